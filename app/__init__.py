@@ -2,9 +2,11 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from config import Config
+from app import assets, compression, database, instrumentation, metrics, profiler, rendering, slow_queries, \
+    templating
 
 # Inicialización de extensiones
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': database.RoutingSession})
 login_manager = LoginManager()
 
 
@@ -13,7 +15,17 @@ def create_app(config_class=Config):
     app.config.from_object(config_class)
 
     # Inicializar extensiones con la app
+    database.configure(app)
     db.init_app(app)
+    database.init_app(app, db)
+    instrumentation.init_app(app)
+    slow_queries.init_app(app)
+    metrics.init_app(app)
+    profiler.init_app(app)
+    templating.init_app(app)
+    assets.init_app(app)
+    rendering.init_app(app)
+    compression.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'login'
     login_manager.login_message = 'Por favor inicia sesión para acceder a esta página.'
@@ -22,21 +34,33 @@ def create_app(config_class=Config):
     with app.app_context():
         from app import routes, models
 
-        # Crear las tablas de la base de datos
-        db.create_all()
-
-        # Crear usuario administrador por defecto si no existe
-        from app.models import User
-        admin = User.query.filter_by(email='admin@carflix.com').first()
-        if not admin:
-            admin = User(
-                username='admin',
-                email='admin@carflix.com',
-                is_admin=True
-            )
-            admin.set_password('admin123')  # Contraseña por defecto
-            db.session.add(admin)
-            db.session.commit()
-            print("✓ Usuario administrador creado: admin@carflix.com / admin123")
-
-    return app
\ No newline at end of file
+        # En producción el esquema y el administrador los prepara `python manage.py init`
+        if app.config['AUTO_INIT_DB']:
+            if init_database():
+                app.logger.warning('Usuario administrador creado: admin@carflix.com / admin123')
+
+    return app
+
+
+def init_database():
+    """Crea las tablas, aplica las migraciones pendientes y crea el administrador por defecto
+
+    Devuelve True si se ha creado el administrador. Requiere un contexto de aplicación.
+    """
+    from app import migrations
+    from app.models import User
+
+    db.create_all()
+    migrations.upgrade()
+
+    if User.query.filter_by(email='admin@carflix.com').first():
+        return False
+    admin = User(
+        username='admin',
+        email='admin@carflix.com',
+        is_admin=True
+    )
+    admin.set_password('admin123')  # Contraseña por defecto
+    db.session.add(admin)
+    db.session.commit()
+    return True
@@ -0,0 +1,184 @@
+"""
+Ficheros estáticos con huella de contenido
+
+build_assets.py copia CSS, JS e imágenes de app/static a app/static/dist con
+el hash del contenido en el nombre (css/style.css -> css/style.1a2b3c4d5e.css),
+escribe al lado las variantes .gz y .br de los ficheros de texto y guarda la
+correspondencia en dist/manifest.json.
+
+En la app, url_for('static', filename='css/style.css') devuelve la ruta con
+huella y esas rutas se sirven con la mejor codificación que acepte el cliente
+y Cache-Control: immutable: una visita repetida no vuelve a descargar nada.
+Un cambio en el fichero cambia su nombre, así que no hace falta invalidar.
+Sin manifiesto (en desarrollo, antes del primer build) todo funciona como antes.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+
+from flask import current_app, request, send_from_directory
+
+DIST_DIR = 'dist'
+HASH_LENGTH = 10
+SOURCES = ('css', 'js', 'images')
+# Subidas de los usuarios: cambian en caliente y ya llevan marca de tiempo en el nombre
+EXCLUDED = ('images/posters', 'images/backgrounds', 'images/profiles')
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.map'}
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))  # Por orden de preferencia
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+# ==================== BUILD ====================
+
+def collect(static_folder):
+    """Rutas lógicas (relativas a static, con /) de los ficheros a procesar"""
+    paths = []
+    for source in SOURCES:
+        for root, dirs, files in os.walk(os.path.join(static_folder, source)):
+            relative_root = os.path.relpath(root, static_folder).replace(os.sep, '/')
+            dirs[:] = [d for d in dirs if f'{relative_root}/{d}' not in EXCLUDED]
+            paths.extend(f'{relative_root}/{name}' for name in files if not name.startswith('.'))
+    return sorted(paths)
+
+
+def rewrite_css_urls(css, logical, files):
+    """Cambia los url(...) relativos de una hoja de estilos por las rutas con huella"""
+    base = posixpath.dirname(logical)
+
+    def replace(match):
+        quote, ref = match.groups()
+        if ref.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        path = re.split(r'[?#]', ref, maxsplit=1)[0]
+        target = posixpath.normpath(posixpath.join(base, path))
+        if target not in files:
+            return match.group(0)
+        return f'url({quote}{posixpath.relpath(files[target], base)}{ref[len(path):]}{quote})'
+
+    return CSS_URL.sub(replace, css)
+
+
+def _compress(data):
+    """{codificación: bytes} de las variantes que ocupan menos que el original"""
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:  # brotli es opcional: sin él solo se genera .gz
+        brotli = None
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    return {encoding: body for encoding, body in variants.items() if len(body) < len(data)}
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def build(static_folder):
+    """Genera dist/ y el manifiesto; devuelve el manifiesto
+
+    Las versiones anteriores se conservan: las páginas ya servidas pueden
+    seguir pidiéndolas mientras dure el despliegue.
+    """
+    output = os.path.join(static_folder, DIST_DIR)
+    files, encodings, sizes = {}, {}, {}
+
+    # Las hojas de estilos al final, cuando ya se conocen los nombres de lo que referencian
+    for logical in sorted(collect(static_folder), key=lambda p: (p.endswith('.css'), p)):
+        with open(os.path.join(static_folder, logical), 'rb') as f:
+            data = f.read()
+        if logical.endswith('.css'):
+            data = rewrite_css_urls(data.decode('utf-8'), logical, files).encode('utf-8')
+
+        name, ext = posixpath.splitext(logical)
+        hashed = f'{name}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}'
+        files[logical] = hashed
+        target = os.path.join(output, hashed)
+        if not os.path.exists(target):
+            _write(target, data)
+
+        sizes[hashed] = {'identity': len(data)}
+        if ext.lower() in COMPRESSIBLE:
+            variants = _compress(data)
+            for encoding, suffix in ENCODINGS:
+                if encoding in variants:
+                    _write(target + suffix, variants[encoding])
+                    sizes[hashed][encoding] = len(variants[encoding])
+            encodings[hashed] = [encoding for encoding, _ in ENCODINGS if encoding in variants]
+
+    manifest = {'files': files, 'encodings': encodings}
+    _write(os.path.join(output, 'manifest.json'), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    manifest['sizes'] = sizes
+    return manifest
+
+
+# ==================== APP ====================
+
+def load_manifest(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    manifest['hashed'] = set(manifest['files'].values())
+    return manifest
+
+
+def _fingerprint(endpoint, values):
+    """url_defaults: url_for('static', filename=...) apunta a la copia con huella"""
+    if endpoint != 'static':
+        return
+    hashed = current_app.extensions['assets']['files'].get(values.get('filename'))
+    if hashed is not None:
+        values['filename'] = f'{DIST_DIR}/{hashed}'
+
+
+def serve_fingerprinted(hashed):
+    """Sirve un fichero con huella en la mejor codificación aceptada, cacheable para siempre"""
+    manifest = current_app.extensions['assets']
+    directory = os.path.join(current_app.static_folder, DIST_DIR)
+    available = manifest['encodings'].get(hashed, [])
+    mimetype = mimetypes.guess_type(hashed)[0] or 'application/octet-stream'
+
+    for encoding, suffix in ENCODINGS:
+        if encoding in available and request.accept_encodings[encoding]:
+            response = send_from_directory(directory, hashed + suffix, mimetype=mimetype,
+                                           max_age=IMMUTABLE_MAX_AGE)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(directory, hashed, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+
+    if available:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    """Carga el manifiesto y engancha url_for y la ruta static; sin manifiesto no hace nada"""
+    manifest = load_manifest(app.config['ASSETS_MANIFEST'])
+    if manifest is None:
+        return
+    app.extensions['assets'] = manifest
+    app.url_defaults(_fingerprint)
+
+    send_static_file = app.view_functions['static']
+    prefix = f'{DIST_DIR}/'
+
+    def static(filename):
+        if filename.startswith(prefix) and filename[len(prefix):] in manifest['hashed']:
+            return serve_fingerprinted(filename[len(prefix):])
+        return send_static_file(filename=filename)
+
+    app.view_functions['static'] = static
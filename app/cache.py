@@ -0,0 +1,66 @@
+"""
+Cachés en memoria del proceso
+
+Cada worker tiene su propia copia: sirven para evitar consultas repetidas dentro
+de una ventana corta (TTL), no como fuente de verdad. Las cachés con nombre se
+registran en CACHES para exportar sus aciertos y fallos (ver app/metrics.py).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+CACHES = {}
+
+
+class TTLCache:
+    """Caché LRU con caducidad por entrada, segura entre hilos"""
+
+    def __init__(self, ttl, maxsize=10000, name=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if name:
+            CACHES[name] = self
+
+    def get(self, key, default=None):
+        """Devuelve el valor si existe y no ha caducado"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Guarda un valor; expulsa el menos usado si se supera maxsize"""
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        """Invalida una entrada"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[1] if entry else None
+
+    def clear(self):
+        """Invalida todas las entradas"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,354 @@
+"""
+Importación masiva del catálogo
+
+Un manifiesto JSON o CSV describe categorías, películas, series con sus
+episodios y las rutas de sus ficheros (relativas a UPLOAD_FOLDER, como las que
+guarda save_file). La importación:
+
+- Valida el manifiesto completo antes de escribir nada: campos obligatorios,
+  tipos, duplicados dentro del propio manifiesto y que los ficheros existan.
+  Si hay errores no se importa nada y se devuelven todos a la vez.
+- Resuelve las categorías con una sola consulta y crea las que falten.
+- Inserta con executemany en lotes de IMPORT_BATCH_SIZE filas, cada lote en su
+  propia transacción de escritura: el escritor no queda bloqueado durante toda
+  la carga.
+- Es idempotente: películas y series se identifican por (título, año) y los
+  episodios por (serie, temporada, número). Lo que ya existe no se toca, así
+  que repetir una importación (o reanudar una interrumpida) solo añade lo que
+  falta.
+
+JSON:
+    {"categories": ["Drama"],
+     "movies": [{"title": "...", "release_year": 2020, "video_path": "videos/movies/x.mp4",
+                 "categories": ["Drama"], "duration": 100, "poster_path": "...", ...}],
+     "series": [{"title": "...", "release_year": 2021, "categories": [...],
+                 "episodes": [{"season": 1, "episode": 1, "title": "...", "video_path": "..."}]}]}
+
+CSV: una fila por película, serie, episodio o categoría con la columna type
+(movie, series, episode o category) y las mismas claves como columnas; las
+categorías de un título van separadas por '|' y cada episodio indica su serie
+en series_title y series_year.
+"""
+
+import csv
+import io
+import json
+import os
+import posixpath
+from collections import namedtuple
+from contextlib import nullcontext
+
+from flask import current_app
+from sqlalchemy import select
+
+from app import counters, db, personalization
+from app.models import Category, Movie, Series, Episode, movie_categories, series_categories
+
+CSV_CATEGORY_SEPARATOR = '|'
+LOOKUP_CHUNK = 500  # Valores por IN (...) al buscar lo que ya existe
+
+Result = namedtuple('Result', 'created existing')
+
+
+class ManifestError(Exception):
+    """Manifiesto no válido; errors es la lista completa de problemas"""
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} errores en el manifiesto')
+        self.errors = errors
+
+
+# ==================== LECTURA ====================
+
+def _csv_items(text):
+    """Convierte las filas del CSV en la misma estructura que el JSON"""
+    movies, series, categories = [], {}, []
+    episodes = []
+    for line, row in enumerate(csv.DictReader(io.StringIO(text)), start=2):
+        row = {key.strip(): (value or '').strip() for key, value in row.items() if key}
+        kind = row.pop('type', '').lower()
+        if row.get('categories'):
+            row['categories'] = [c.strip() for c in row['categories'].split(CSV_CATEGORY_SEPARATOR) if c.strip()]
+        row['_where'] = f'línea {line}'
+        if kind == 'movie':
+            movies.append(row)
+        elif kind == 'series':
+            series[(row.get('title'), row.get('release_year') or None)] = dict(row, episodes=[])
+        elif kind == 'episode':
+            episodes.append(row)
+        elif kind == 'category':
+            categories.append(row.get('title') or row.get('name'))
+        else:
+            raise ManifestError([f'línea {line}: type debe ser movie, series, episode o category'])
+
+    errors = []
+    for row in episodes:
+        parent = series.get((row.get('series_title'), row.get('series_year') or None))
+        if parent is None:
+            errors.append(f"{row['_where']}: la serie «{row.get('series_title')}» no está en el manifiesto")
+        else:
+            parent['episodes'].append(row)
+    if errors:
+        raise ManifestError(errors)
+    return {'categories': categories, 'movies': movies, 'series': list(series.values())}
+
+
+def parse(data, filename):
+    """Lee un manifiesto JSON o CSV (según la extensión) a {categories, movies, series}"""
+    try:
+        text = data.decode('utf-8-sig') if isinstance(data, bytes) else data
+    except UnicodeDecodeError:
+        raise ManifestError(['el manifiesto debe estar en UTF-8'])
+
+    if filename.lower().endswith('.csv'):
+        return _csv_items(text)
+    try:
+        manifest = json.loads(text)
+    except ValueError as e:
+        raise ManifestError([f'JSON no válido: {e}'])
+    if not isinstance(manifest, dict):
+        raise ManifestError(['el JSON debe ser un objeto con categories, movies y series'])
+    return manifest
+
+
+# ==================== VALIDACIÓN ====================
+
+class _Validator:
+    def __init__(self, root, check_media):
+        self.root = root
+        self.check_media = check_media
+        self.errors = []
+
+    def error(self, where, message):
+        self.errors.append(f'{where}: {message}')
+
+    def text(self, item, where, field, max_length=None, required=False):
+        value = item.get(field)
+        value = str(value).strip() if value not in (None, '') else None
+        if value is None:
+            if required:
+                self.error(where, f'falta {field}')
+        elif max_length and len(value) > max_length:
+            self.error(where, f'{field} supera los {max_length} caracteres')
+        return value
+
+    def integer(self, item, where, field, required=False, minimum=None):
+        value = item.get(field)
+        if value in (None, ''):
+            if required:
+                self.error(where, f'falta {field}')
+            return None
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            self.error(where, f'{field} debe ser un número entero')
+            return None
+        if minimum is not None and value < minimum:
+            self.error(where, f'{field} debe ser mayor o igual que {minimum}')
+        return value
+
+    def path(self, item, where, field, required=False):
+        value = self.text(item, where, field, max_length=300, required=required)
+        if value is None:
+            return None
+        value = posixpath.normpath(value.replace('\\', '/'))
+        if value.startswith(('/', '../')) or value == '..':
+            self.error(where, f'{field} debe ser una ruta relativa a la carpeta de subidas')
+        elif self.check_media and not os.path.isfile(os.path.join(self.root, value)):
+            self.error(where, f'no existe el fichero {value}')
+        return value
+
+    def categories(self, item, where):
+        names = item.get('categories') or []
+        if not isinstance(names, list):
+            self.error(where, 'categories debe ser una lista')
+            return []
+        names = [str(name).strip() for name in names if str(name).strip()]
+        for name in names:
+            if len(name) > 50:
+                self.error(where, f'la categoría «{name[:20]}…» supera los 50 caracteres')
+        return list(dict.fromkeys(names))
+
+
+def validate(manifest, root, check_media=True):
+    """Normaliza y valida el manifiesto entero; lanza ManifestError con todos los errores"""
+    v = _Validator(root, check_media)
+    movies, series, seen = [], [], set()
+
+    for number, item in enumerate(manifest.get('movies') or [], start=1):
+        if not isinstance(item, dict):
+            v.error(f'película {number}', 'debe ser un objeto')
+            continue
+        where = item.get('_where') or f'película {number}'
+        movie = {
+            'title': v.text(item, where, 'title', 200, required=True),
+            'description': v.text(item, where, 'description'),
+            'duration': v.integer(item, where, 'duration', minimum=1),
+            'release_year': v.integer(item, where, 'release_year', minimum=1800),
+            'video_path': v.path(item, where, 'video_path', required=True),
+            'poster_path': v.path(item, where, 'poster_path'),
+            'background_path': v.path(item, where, 'background_path'),
+            'categories': v.categories(item, where),
+        }
+        key = ('movie', movie['title'], movie['release_year'])
+        if key in seen:
+            v.error(where, f"película repetida en el manifiesto: {movie['title']} ({movie['release_year']})")
+        seen.add(key)
+        movies.append(movie)
+
+    for number, item in enumerate(manifest.get('series') or [], start=1):
+        if not isinstance(item, dict):
+            v.error(f'serie {number}', 'debe ser un objeto')
+            continue
+        where = item.get('_where') or f'serie {number}'
+        entry = {
+            'title': v.text(item, where, 'title', 200, required=True),
+            'description': v.text(item, where, 'description'),
+            'release_year': v.integer(item, where, 'release_year', minimum=1800),
+            'poster_path': v.path(item, where, 'poster_path'),
+            'background_path': v.path(item, where, 'background_path'),
+            'categories': v.categories(item, where),
+            'episodes': [],
+        }
+        key = ('series', entry['title'], entry['release_year'])
+        if key in seen:
+            v.error(where, f"serie repetida en el manifiesto: {entry['title']} ({entry['release_year']})")
+        seen.add(key)
+
+        numbers = set()
+        for index, raw in enumerate(item.get('episodes') or [], start=1):
+            if not isinstance(raw, dict):
+                v.error(f'{where}, episodio {index}', 'debe ser un objeto')
+                continue
+            episode_where = raw.get('_where') or f'{where}, episodio {index}'
+            episode = {
+                'season_number': v.integer(raw, episode_where, 'season', required=True, minimum=1),
+                'episode_number': v.integer(raw, episode_where, 'episode', required=True, minimum=1),
+                'title': v.text(raw, episode_where, 'title', 200, required=True),
+                'description': v.text(raw, episode_where, 'description'),
+                'duration': v.integer(raw, episode_where, 'duration', minimum=1),
+                'video_path': v.path(raw, episode_where, 'video_path', required=True),
+                'thumbnail_path': v.path(raw, episode_where, 'thumbnail_path'),
+            }
+            number_key = (episode['season_number'], episode['episode_number'])
+            if number_key in numbers:
+                v.error(episode_where, f'episodio T{number_key[0]}E{number_key[1]} repetido')
+            numbers.add(number_key)
+            entry['episodes'].append(episode)
+        series.append(entry)
+
+    categories = v.categories(manifest, 'categorías')
+    for item in movies + series:
+        categories.extend(item['categories'])
+
+    if v.errors:
+        raise ManifestError(v.errors)
+    return {'categories': list(dict.fromkeys(categories)), 'movies': movies, 'series': series}
+
+
+# ==================== INSERCIÓN ====================
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _title_ids(connection, model, titles):
+    """{(título, año): id} de los títulos que ya existen, buscando por el índice de title"""
+    ids = {}
+    for chunk in _chunks(sorted(set(titles)), LOOKUP_CHUNK):
+        query = select(model.id, model.title, model.release_year).where(model.title.in_(chunk))
+        if hasattr(model, 'deleted_at'):  # Una serie pendiente de purga ya no existe
+            query = query.where(model.deleted_at.is_(None))
+        rows = connection.execute(query)
+        for row_id, title, year in rows:
+            ids.setdefault((title, year), row_id)
+    return ids
+
+
+def _import_categories(connection, names):
+    """{nombre: id} de todas las categorías del manifiesto, creando las que falten"""
+    table = Category.__table__
+    ids = dict(connection.execute(select(table.c.name, table.c.id).where(table.c.name.in_(names))).all())
+    missing = [{'name': name} for name in names if name not in ids]
+    if missing:
+        connection.execute(table.insert(), missing)
+        ids = dict(connection.execute(select(table.c.name, table.c.id).where(table.c.name.in_(names))).all())
+    return ids, len(missing)
+
+
+def _import_titles(begin, model, links, link_column, items, category_ids, batch_size):
+    """Inserta películas o series por lotes; devuelve ({(título, año): id}, Result)"""
+    fields = [column.key for column in model.__table__.columns if column.key not in ('id', 'created_at')]
+    ids, created = {}, 0
+    for batch in _chunks(items, batch_size):
+        with begin() as connection:
+            existing = _title_ids(connection, model, [item['title'] for item in batch])
+            new = [item for item in batch if (item['title'], item['release_year']) not in existing]
+            if new:
+                connection.execute(model.__table__.insert(), [{f: item.get(f) for f in fields} for item in new])
+                existing = _title_ids(connection, model, [item['title'] for item in batch])
+                rows = [{link_column: existing[(item['title'], item['release_year'])], 'category_id': category_ids[name]}
+                        for item in new for name in item['categories']]
+                if rows:
+                    connection.execute(links.insert(), rows)
+        ids.update(existing)
+        created += len(new)
+    return ids, Result(created, len(items) - created)
+
+
+def _import_episodes(begin, series_ids, series, batch_size):
+    table = Episode.__table__
+    episodes = [dict(episode, series_id=series_ids[(entry['title'], entry['release_year'])])
+                for entry in series for episode in entry['episodes']]
+    created = 0
+    for batch in _chunks(episodes, batch_size):
+        with begin() as connection:
+            existing = set()
+            for chunk in _chunks(sorted({e['series_id'] for e in batch}), LOOKUP_CHUNK):
+                existing.update(connection.execute(
+                    select(table.c.series_id, table.c.season_number, table.c.episode_number)
+                    .where(table.c.series_id.in_(chunk))).all())
+            new = [e for e in batch if (e['series_id'], e['season_number'], e['episode_number']) not in existing]
+            if new:
+                connection.execute(table.insert(), new)
+        created += len(new)
+    return Result(created, len(episodes) - created)
+
+
+def _import(begin, items, batch_size):
+    with begin() as connection:
+        category_ids, created = _import_categories(connection, items['categories'])
+    results = {'categories': Result(created, len(items['categories']) - created)}
+
+    _, results['movies'] = _import_titles(begin, Movie, movie_categories, 'movie_id', items['movies'],
+                                          category_ids, batch_size)
+    series_ids, results['series'] = _import_titles(begin, Series, series_categories, 'series_id',
+                                                   items['series'], category_ids, batch_size)
+    results['episodes'] = _import_episodes(begin, series_ids, items['series'], batch_size)
+    return results
+
+
+def run(manifest, batch_size=None, check_media=True, dry_run=False):
+    """Valida e importa un manifiesto ya leído; devuelve {tipo: Result(creados, existentes)}
+
+    Con dry_run todo va en una única transacción que se deshace al final: el
+    resultado es exacto pero no queda nada escrito.
+    """
+    batch_size = batch_size or current_app.config['IMPORT_BATCH_SIZE']
+    items = validate(manifest, current_app.config['UPLOAD_FOLDER'], check_media=check_media)
+
+    if dry_run:
+        with db.engine.connect() as connection:
+            transaction = connection.begin()
+            try:
+                return _import(lambda: nullcontext(connection), items, batch_size)
+            finally:
+                transaction.rollback()
+
+    results = _import(db.engine.begin, items, batch_size)
+    # executemany no pasa por el ORM: contadores y catálogo en caché se actualizan aquí
+    if any(result.created for result in results.values()):
+        counters.reconcile([name for name, result in results.items() if result.created])
+        personalization.invalidate_catalog()
+    return results
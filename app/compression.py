@@ -0,0 +1,92 @@
+"""
+Compresión gzip de las respuestas
+
+Middleware WSGI: si el cliente acepta gzip, comprime cada bloque según sale
+(con Z_SYNC_FLUSH, así que los envíos anticipados de app/rendering.py llegan al
+navegador sin esperar al final). No toca:
+- respuestas ya codificadas (estáticos precomprimidos de app/assets.py),
+- tipos ya comprimidos (vídeo, imágenes, audio, zip...),
+- respuestas parciales (Range), HEAD, 204/304 y cuerpos pequeños con longitud conocida.
+"""
+
+import zlib
+
+from werkzeug.http import parse_accept_header
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                      'image/svg+xml')
+
+
+def _accepts_gzip(environ):
+    return parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING'))['gzip'] > 0
+
+
+class GzipMiddleware:
+    def __init__(self, wsgi_app, min_size=500, level=6):
+        self.wsgi_app = wsgi_app
+        self.min_size = min_size
+        self.level = level
+
+    def _should_compress(self, status, headers):
+        code = int(status.split(' ', 1)[0])
+        if code < 200 or code in (204, 206, 304):
+            return False
+        values = {name.lower(): value for name, value in headers}
+        if 'content-encoding' in values or 'content-range' in values:
+            return False
+        if not values.get('content-type', '').startswith(COMPRESSIBLE_TYPES):
+            return False
+        length = values.get('content-length')
+        return length is None or int(length) >= self.min_size
+
+    def __call__(self, environ, start_response):
+        if environ['REQUEST_METHOD'] == 'HEAD' or not _accepts_gzip(environ):
+            return self.wsgi_app(environ, start_response)
+
+        compress = []
+
+        def gzip_start_response(status, headers, exc_info=None):
+            if self._should_compress(status, headers):
+                compress.append(True)
+                vary = [value for name, value in headers if name.lower() == 'vary']
+                headers = [(name, value) for name, value in headers
+                           if name.lower() not in ('content-length', 'vary')]
+                headers.append(('Content-Encoding', 'gzip'))
+                headers.append(('Vary', ', '.join(vary + ['Accept-Encoding'])))
+                headers = [(name, 'W/' + value if name.lower() == 'etag' and not value.startswith('W/') else value)
+                           for name, value in headers]
+            return start_response(status, headers, exc_info)
+
+        body = self.wsgi_app(environ, gzip_start_response)
+        if not compress:
+            return body
+        return GzipBody(body, self.level)
+
+
+class GzipBody:
+    """Cuerpo comprimido; close() cierra siempre el cuerpo original, aunque no se haya empezado a iterar"""
+
+    def __init__(self, body, level):
+        self.body = body
+        self.level = level
+
+    def __iter__(self):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)  # 31: formato gzip
+        for chunk in self.body:
+            if chunk:
+                data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                if data:
+                    yield data
+        yield compressor.flush()
+
+    def close(self):
+        if hasattr(self.body, 'close'):
+            self.body.close()
+
+
+def init_app(app):
+    """Envuelve la app WSGI con el middleware de compresión"""
+    if not app.config['COMPRESSION_ENABLED']:
+        return
+    app.wsgi_app = GzipMiddleware(app.wsgi_app, min_size=app.config['COMPRESSION_MIN_SIZE'],
+                                  level=app.config['COMPRESSION_LEVEL'])
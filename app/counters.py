@@ -0,0 +1,161 @@
+"""
+Contadores precalculados de filas
+
+COUNT(*) en SQLite recorre la tabla entera. La tabla `counter` guarda el número
+de filas de las tablas principales y se mantiene en la misma transacción que
+los cambios: tras cada flush de la sesión se suman las filas nuevas y se restan
+las borradas de los modelos en TABLES (también las marcadas con deleted_at y los
+episodios de las series marcadas, ver app/deletion.py: se cuentan solo las filas
+vivas). Si la transacción se deshace, el contador también.
+
+Lo que no pasa por el ORM (borrados masivos, SQL directo, generate_data.py)
+no se ve, así que cada contador se recalcula con COUNT(*) cuando lleva más de
+COUNTERS_RECONCILE_INTERVAL segundos sin hacerlo: en un hilo aparte, sin
+retrasar la petición que lo detecta. `python manage.py counters` lo fuerza
+(por ejemplo desde cron, tras cargas masivas).
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, text
+from sqlalchemy.orm.attributes import get_history
+
+from app import db
+from app.database import RoutingSession
+
+# tabla -> nombre del contador
+TABLES = {
+    'user': 'users',
+    'movie': 'movies',
+    'series': 'series',
+    'episode': 'episodes',
+    'category': 'categories',
+}
+# Tablas cuyas filas se ocultan con la fila padre marcada con deleted_at: tabla -> (columna, tabla padre)
+HIDDEN_WITH_PARENT = {
+    'episode': ('series_id', 'series'),
+}
+
+counter_table = db.Table('counter',
+                         db.Column('name', db.String(50), primary_key=True),
+                         db.Column('value', db.Integer, nullable=False),
+                         db.Column('reconciled_at', db.DateTime, nullable=False)
+                         )
+
+_reconciling = threading.Lock()
+
+
+# ==================== MANTENIMIENTO ====================
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _count_flushed(session, flush_context):
+    """Aplica al contador las filas insertadas y borradas en este flush"""
+    deltas = {}
+    for obj in session.new:
+        name = TABLES.get(getattr(obj, '__tablename__', None))
+        if name:
+            deltas[name] = deltas.get(name, 0) + 1
+    for obj in session.deleted:
+        name = TABLES.get(getattr(obj, '__tablename__', None))
+        if name:
+            deltas[name] = deltas.get(name, 0) - 1
+    hidden_parents = []
+    for obj in session.dirty:
+        name = TABLES.get(getattr(obj, '__tablename__', None))
+        if name and hasattr(obj, 'deleted_at'):
+            history = get_history(obj, 'deleted_at')
+            if any(value is not None for value in history.added) and not any(history.deleted):
+                deltas[name] = deltas.get(name, 0) - 1
+                hidden_parents.append((obj.__tablename__, obj.id))
+
+    connection = session.connection()
+    # Los episodios de una serie marcada dejan de contar ya, no al purgarla
+    for table, (column, parent) in HIDDEN_WITH_PARENT.items():
+        for parent_table, parent_id in hidden_parents:
+            if parent_table == parent:
+                hidden = connection.execute(text(f'SELECT COUNT(*) FROM "{table}" WHERE {column} = :id'),
+                                            {'id': parent_id}).scalar()
+                deltas[TABLES[table]] = deltas.get(TABLES[table], 0) - hidden
+    for name, delta in deltas.items():
+        if delta:
+            connection.execute(counter_table.update().where(counter_table.c.name == name)
+                               .values(value=counter_table.c.value + delta))
+
+
+# ==================== RECONCILIACIÓN ====================
+
+def _has_deleted_at(connection, table):
+    # Las bases de datos anteriores a la migración 6 no tienen la columna
+    return any(row[1] == 'deleted_at' for row in connection.execute(text(f'PRAGMA table_info("{table}")')))
+
+
+def reconcile_table(connection, table):
+    """Recalcula con COUNT(*) el contador de una tabla; devuelve (antes, después)"""
+    name = TABLES[table]
+    before = connection.execute(counter_table.select().where(counter_table.c.name == name)).first()
+    live = ' WHERE deleted_at IS NULL' if _has_deleted_at(connection, table) else ''
+    if table in HIDDEN_WITH_PARENT:
+        column, parent = HIDDEN_WITH_PARENT[table]
+        if _has_deleted_at(connection, parent):
+            live = f' WHERE {column} NOT IN (SELECT id FROM "{parent}" WHERE deleted_at IS NOT NULL)'
+    value = connection.execute(text(f'SELECT COUNT(*) FROM "{table}"{live}')).scalar()
+    connection.execute(text(
+        'INSERT INTO counter (name, value, reconciled_at) VALUES (:name, :value, :now) '
+        'ON CONFLICT (name) DO UPDATE SET value = excluded.value, reconciled_at = excluded.reconciled_at'
+    ), {'name': name, 'value': value, 'now': datetime.utcnow()})
+    return (before.value if before else None), value
+
+
+def reconcile(names=None):
+    """Recalcula los contadores; devuelve {nombre: (antes, después)}
+
+    Cada contador va en su propia transacción de escritura: como las escrituras
+    están serializadas, el COUNT(*) y la actualización ven el mismo estado.
+    """
+    changes = {}
+    for table, name in TABLES.items():
+        if names is None or name in names:
+            with db.engine.begin() as connection:
+                changes[name] = reconcile_table(connection, table)
+    return changes
+
+
+def _reconcile_in_background(app, names):
+    def run():
+        try:
+            with app.app_context():
+                reconcile(names)
+        except Exception:
+            app.logger.exception('Error al reconciliar los contadores')
+        finally:
+            _reconciling.release()
+
+    if _reconciling.acquire(blocking=False):
+        threading.Thread(target=run, name='carflix-counters', daemon=True).start()
+
+
+# ==================== LECTURA ====================
+
+def get_counts():
+    """{nombre: filas} de todos los contadores, con una sola consulta a la tabla counter"""
+    rows = db.session.execute(counter_table.select()).all()
+    counts = {row.name: row.value for row in rows}
+
+    limit = datetime.utcnow() - timedelta(seconds=current_app.config['COUNTERS_RECONCILE_INTERVAL'])
+    stale = [row.name for row in rows if row.reconciled_at < limit]
+    for table, name in TABLES.items():
+        if name not in counts:
+            # Contador que aún no existe: esta vez se cuenta y se crea en segundo plano
+            counts[name] = db.session.execute(text(f'SELECT COUNT(*) FROM "{table}"')).scalar()
+            stale.append(name)
+    if stale:
+        _reconcile_in_background(current_app._get_current_object(), stale)
+    return counts
+
+
+def count(table):
+    """Filas de una tabla con contador, o None si no lo tiene"""
+    name = TABLES.get(table)
+    return get_counts()[name] if name else None
@@ -0,0 +1,129 @@
+"""
+Perfil de producción para SQLite
+
+- PRAGMAs al abrir cada conexión: WAL, synchronous, mmap_size, cache_size y
+  busy_timeout (valores en Config).
+- Dos engines sobre el mismo fichero: un pool de lectores (bind 'reader', en
+  modo query_only) y un único escritor (el engine por defecto, pool de 1
+  conexión) que abre las transacciones con BEGIN IMMEDIATE, así las escrituras
+  se serializan en lugar de fallar con "database is locked".
+- RoutingSession manda las lecturas al pool de lectores hasta que la
+  transacción escribe; a partir de ahí todo va al escritor hasta el commit o el
+  rollback, para que la petición vea sus propios cambios.
+
+Con bases de datos que no son ficheros SQLite no se cambia nada.
+"""
+
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql.dml import UpdateBase
+
+READER_BIND = 'reader'
+
+
+class RoutingSession(Session):
+    """Sesión que separa lecturas (pool de lectores) y escrituras (escritor único)"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is not None:
+            return bind
+
+        reader = self._db.engines.get(READER_BIND)
+        if reader is not None and not self.info.get('writing'):
+            if not self._flushing and not isinstance(clause, UpdateBase):
+                return reader
+            self.info['writing'] = True
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _reset_routing(session, transaction):
+    """Al terminar la transacción principal se vuelve a leer del pool de lectores"""
+    if transaction.parent is None:
+        session.info.pop('writing', None)
+
+
+def _is_sqlite_file(uri):
+    """True si la URI apunta a un fichero SQLite (no a una base de datos en memoria)"""
+    return uri.startswith('sqlite:///') and len(uri) > len('sqlite:///') and ':memory:' not in uri
+
+
+def _pragmas(config, query_only):
+    """PRAGMAs que se ejecutan en cada conexión nueva"""
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT'])}",
+        f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA cache_size = {int(config['SQLITE_CACHE_SIZE'])}",
+    ]
+    if config['SQLITE_WAL']:
+        pragmas.insert(0, "PRAGMA journal_mode = WAL")
+    if query_only:
+        pragmas.append("PRAGMA query_only = 1")
+    return pragmas
+
+
+def configure(app):
+    """Ajusta la configuración de engines; llamar antes de db.init_app(app)"""
+    config = app.config
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    if not config['SQLITE_TUNING'] or not _is_sqlite_file(uri):
+        return
+
+    busy_seconds = config['SQLITE_BUSY_TIMEOUT'] / 1000
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    options.setdefault('pool_size', 1)
+    options.setdefault('max_overflow', 0)
+    options.setdefault('pool_timeout', config['SQLITE_WRITE_QUEUE_TIMEOUT'])
+    options.setdefault('connect_args', {'timeout': busy_seconds, 'check_same_thread': False})
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    if config['SQLITE_SPLIT_READ_WRITE']:
+        binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault(READER_BIND, {
+            'url': uri,
+            'pool_size': config['SQLITE_READ_POOL_SIZE'],
+            'max_overflow': 0,
+            'pool_timeout': config['SQLITE_WRITE_QUEUE_TIMEOUT'],
+            'connect_args': {'timeout': busy_seconds, 'check_same_thread': False},
+        })
+        config['SQLALCHEMY_BINDS'] = binds
+
+
+def init_app(app, db):
+    """Registra los PRAGMAs en los engines creados; llamar después de db.init_app(app)"""
+    config = app.config
+    if not config['SQLITE_TUNING'] or not _is_sqlite_file(config['SQLALCHEMY_DATABASE_URI']):
+        return
+
+    with app.app_context():
+        engines = db.engines
+
+    writer = engines[None]
+    writer_pragmas = _pragmas(config, query_only=False)
+
+    @event.listens_for(writer, 'connect')
+    def _writer_connect(dbapi_connection, connection_record):
+        # BEGIN lo emite SQLAlchemy (ver _writer_begin), no el driver
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in writer_pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    @event.listens_for(writer, 'begin')
+    def _writer_begin(connection):
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+    reader = engines.get(READER_BIND)
+    if reader is not None:
+        # WAL es persistente en el fichero: lo activa el escritor
+        reader_pragmas = [p for p in _pragmas(config, query_only=True) if 'journal_mode' not in p]
+
+        @event.listens_for(reader, 'connect')
+        def _reader_connect(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in reader_pragmas:
+                cursor.execute(pragma)
+            cursor.close()
@@ -0,0 +1,251 @@
+"""
+Borrado diferido de usuarios y series
+
+Borrar a un usuario con años de historial o una serie larga a través del ORM
+carga y borra en la petición cada fila de asociación y cada episodio, con el
+escritor de SQLite bloqueado todo el tiempo. Aquí el borrado va en dos fases:
+
+1. En la petición solo se marca la fila (deleted_at) y, en los usuarios, se
+   liberan el nombre y el email. Es un UPDATE de una fila.
+2. Un hilo en segundo plano purga las filas marcadas por bloques de
+   PURGE_BATCH_SIZE, cada bloque en su propia transacción y con una pausa
+   entre bloques (PURGE_BATCH_PAUSE) para que pasen el resto de escrituras.
+   Al final borra la fila marcada y los ficheros que ya nadie referencia.
+
+Mientras tanto las consultas del ORM no ven lo marcado: usuarios y series con
+deleted_at ni los episodios de esas series. Las lecturas de Core sobre las
+tablas de asociación (recomendaciones, afinidad) pueden verlo hasta la purga;
+sus resultados se cargan con el ORM, que lo descarta.
+
+El estado está en la base de datos: si el proceso muere a mitad, la purga
+sigue con la siguiente marca o con `python manage.py purge`.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event, literal_column, select
+from sqlalchemy.orm import with_loader_criteria
+
+from app import counters, db, personalization
+from app.database import RoutingSession
+from app.models import User, Movie, Series, Episode, ItemSimilarity, TrendingBucket, UserCategoryAffinity, \
+    invalidate_user_cache, series_categories, movie_favorites, series_favorites, \
+    movie_watched, episode_watched
+
+# Columnas con rutas de ficheros subidos (relativas a UPLOAD_FOLDER)
+MEDIA_COLUMNS = [
+    Movie.video_path, Movie.poster_path, Movie.background_path,
+    Series.poster_path, Series.background_path,
+    Episode.video_path, Episode.thumbnail_path,
+    User.profile_picture,
+]
+# Solo se borran ficheros de las carpetas de subidas, nunca los estáticos de la app
+UPLOAD_SUBFOLDERS = ('videos/movies/', 'videos/series/', 'images/posters/', 'images/backgrounds/',
+                     'images/profiles/')
+
+_purging = threading.Lock()
+_requested = threading.Event()
+
+
+# ==================== OCULTACIÓN ====================
+
+def _deleted_series():
+    return select(Series.__table__.c.id).where(Series.__table__.c.deleted_at.is_not(None))
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _hide_deleted(state):
+    """Añade deleted_at IS NULL a toda consulta ORM (salvo execution_options(include_deleted=True))"""
+    if (not state.is_select or state.is_column_load or state.is_relationship_load
+            or state.execution_options.get('include_deleted')):
+        return
+    state.statement = state.statement.options(
+        with_loader_criteria(User, User.deleted_at.is_(None), include_aliases=True),
+        with_loader_criteria(Series, Series.deleted_at.is_(None), include_aliases=True),
+        with_loader_criteria(Episode, lambda cls: cls.series_id.not_in(_deleted_series()), include_aliases=True),
+    )
+
+
+# ==================== MARCADO ====================
+
+def delete_user(user):
+    """Marca al usuario como borrado y libera su nombre y email; la purga va en segundo plano"""
+    user.deleted_at = datetime.utcnow()
+    user.username = f'deleted-{user.id}'
+    user.email = f'deleted-{user.id}@deleted.invalid'
+    invalidate_user_cache(user)
+    db.session.commit()
+    start_purge(current_app._get_current_object())
+
+
+def delete_series(series):
+    """Marca la serie como borrada; episodios, asociaciones y ficheros se purgan en segundo plano"""
+    series.deleted_at = datetime.utcnow()
+    db.session.commit()
+    personalization.invalidate_catalog()
+    start_purge(current_app._get_current_object())
+
+
+# ==================== PURGA ====================
+
+def _delete_chunk(table, where, size):
+    """Borra hasta size filas de table que cumplen where, en una transacción; devuelve cuántas"""
+    rowid = literal_column('rowid')
+    with db.engine.begin() as connection:
+        chunk = select(rowid).select_from(table).where(where).limit(size)
+        return connection.execute(table.delete().where(rowid.in_(chunk))).rowcount
+
+
+def _drain(table, where):
+    """Borra por bloques todas las filas que cumplen where; devuelve el total"""
+    size = current_app.config['PURGE_BATCH_SIZE']
+    pause = current_app.config['PURGE_BATCH_PAUSE']
+    total = 0
+    while True:
+        deleted = _delete_chunk(table, where, size)
+        total += deleted
+        if deleted < size:
+            return total
+        time.sleep(pause)
+
+
+def _collect_media(connection, columns, where):
+    paths = set()
+    for column in columns:
+        paths.update(path for (path,) in connection.execute(select(column).where(where)) if path)
+    return paths
+
+
+def remove_unreferenced(paths):
+    """Borra los ficheros de paths que ya no referencia ninguna fila; devuelve los borrados"""
+    candidates = {path for path in paths if path.startswith(UPLOAD_SUBFOLDERS)}
+    if not candidates:
+        return []
+    with db.engine.connect() as connection:
+        referenced = set()
+        for column in MEDIA_COLUMNS:
+            referenced.update(connection.execute(select(column).where(column.in_(candidates))).scalars())
+
+    root = os.path.realpath(current_app.config['UPLOAD_FOLDER'])
+    removed = []
+    for path in sorted(candidates - referenced):
+        full_path = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, full_path]) != root:
+            continue
+        try:
+            os.remove(full_path)
+            removed.append(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            current_app.logger.warning('No se pudo borrar %s', full_path, exc_info=True)
+    return removed
+
+
+def purge_user(user_id):
+    """Borra el historial, favoritos y afinidades del usuario, la fila y su foto; devuelve filas borradas"""
+    rows = 0
+    for table, column in ((movie_watched, movie_watched.c.user_id), (episode_watched, episode_watched.c.user_id),
+                          (movie_favorites, movie_favorites.c.user_id),
+                          (series_favorites, series_favorites.c.user_id),
+                          (UserCategoryAffinity.__table__, UserCategoryAffinity.__table__.c.user_id)):
+        rows += _drain(table, column == user_id)
+
+    table = User.__table__
+    with db.engine.begin() as connection:
+        media = _collect_media(connection, [table.c.profile_picture], table.c.id == user_id)
+        rows += connection.execute(table.delete().where(table.c.id == user_id,
+                                                        table.c.deleted_at.is_not(None))).rowcount
+    remove_unreferenced(media)
+    return rows
+
+
+def purge_series(series_id):
+    """Borra episodios, vistos, favoritos, categorías, similitudes y tendencias de la serie, y la serie"""
+    episodes = Episode.__table__
+    series_episodes = select(episodes.c.id).where(episodes.c.series_id == series_id)
+    rows = _drain(episode_watched, episode_watched.c.episode_id.in_(series_episodes))
+
+    for table, where in ((series_favorites, series_favorites.c.series_id == series_id),
+                         (series_categories, series_categories.c.series_id == series_id),
+                         (ItemSimilarity.__table__, ((ItemSimilarity.__table__.c.item_type == 'series')
+                                                     & (ItemSimilarity.__table__.c.item_id == series_id))),
+                         (ItemSimilarity.__table__, ((ItemSimilarity.__table__.c.neighbor_type == 'series')
+                                                     & (ItemSimilarity.__table__.c.neighbor_id == series_id))),
+                         (TrendingBucket.__table__, ((TrendingBucket.__table__.c.item_type == 'series')
+                                                     & (TrendingBucket.__table__.c.item_id == series_id)))):
+        rows += _drain(table, where)
+
+    # Los episodios por bloques, guardando antes sus ficheros
+    media = set()
+    size = current_app.config['PURGE_BATCH_SIZE']
+    while True:
+        with db.engine.begin() as connection:
+            ids = connection.execute(series_episodes.limit(size)).scalars().all()
+            if ids:
+                media |= _collect_media(connection, [episodes.c.video_path, episodes.c.thumbnail_path],
+                                        episodes.c.id.in_(ids))
+                rows += connection.execute(episodes.delete().where(episodes.c.id.in_(ids))).rowcount
+        if len(ids) < size:
+            break
+        time.sleep(current_app.config['PURGE_BATCH_PAUSE'])
+
+    table = Series.__table__
+    with db.engine.begin() as connection:
+        media |= _collect_media(connection, [table.c.poster_path, table.c.background_path], table.c.id == series_id)
+        rows += connection.execute(table.delete().where(table.c.id == series_id,
+                                                        table.c.deleted_at.is_not(None))).rowcount
+    remove_unreferenced(media)
+    return rows
+
+
+def pending():
+    """[('user' | 'series', id), ...] marcados y aún sin purgar"""
+    with db.engine.connect() as connection:
+        users = connection.execute(select(User.__table__.c.id).where(User.__table__.c.deleted_at.is_not(None)))
+        series = connection.execute(select(Series.__table__.c.id)
+                                    .where(Series.__table__.c.deleted_at.is_not(None)))
+        return [('user', user_id) for (user_id,) in users] + [('series', series_id) for (series_id,) in series]
+
+
+def purge_pending():
+    """Purga todo lo marcado; devuelve [(tipo, id, filas borradas)]"""
+    done = []
+    while True:
+        batch = pending()
+        if not batch:
+            break
+        for kind, item_id in batch:
+            rows = purge_user(item_id) if kind == 'user' else purge_series(item_id)
+            done.append((kind, item_id, rows))
+    if done:
+        counters.reconcile()
+        personalization.invalidate_catalog()
+    return done
+
+
+def start_purge(app):
+    """Lanza la purga en un hilo si no hay otra en marcha en este proceso"""
+    _requested.set()
+
+    def run():
+        try:
+            with app.app_context():
+                while _requested.is_set():
+                    _requested.clear()
+                    for kind, item_id, rows in purge_pending():
+                        app.logger.info('Purgado %s %s: %s filas', kind, item_id, rows)
+        except Exception:
+            app.logger.exception('Error en la purga de borrados')
+        finally:
+            _purging.release()
+        # Una marca hecha justo al terminar no debe quedarse esperando a la siguiente
+        if _requested.is_set():
+            start_purge(app)
+
+    if _purging.acquire(blocking=False):
+        threading.Thread(target=run, name='carflix-purge', daemon=True).start()
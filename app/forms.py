@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from flask_wtf.file import FileField, FileAllowed
+from flask_wtf.file import FileField, FileAllowed, FileRequired
 from wtforms import StringField, PasswordField, BooleanField, SubmitField, TextAreaField, IntegerField, \
     SelectMultipleField
 from wtforms.validators import DataRequired, Email, EqualTo, ValidationError, Length, Optional
@@ -98,6 +98,17 @@ class CategoryForm(FlaskForm):
     submit = SubmitField('Guardar Categoría')
 
 
+class CatalogImportForm(FlaskForm):
+    """Formulario de importación masiva del catálogo"""
+    manifest = FileField('Manifiesto (JSON o CSV)', validators=[
+        FileRequired('Selecciona un manifiesto'),
+        FileAllowed(['json', 'csv'], 'Solo se permiten manifiestos .json o .csv')
+    ])
+    dry_run = BooleanField('Simular (validar y contar sin escribir)')
+    skip_media_check = BooleanField('No comprobar que existan los ficheros')
+    submit = SubmitField('Importar')
+
+
 class SearchForm(FlaskForm):
     """Formulario de búsqueda"""
     query = StringField('Buscar', validators=[DataRequired()])
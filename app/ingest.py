@@ -0,0 +1,254 @@
+"""
+Alta automática de episodios desde una carpeta
+
+Recorre una carpeta bajo UPLOAD_FOLDER (normalmente videos/series/<serie>),
+deduce temporada y episodio del nombre de cada vídeo y crea los Episode que
+falten en la serie indicada.
+
+- Nombres reconocidos: S01E02, s1.e2, 1x02 o una carpeta de temporada
+  ("Temporada 1", "Season 01", "S1") con ficheros "E02", "Episodio 2" o "02 - Título".
+  Lo que sigue al número, limpio de puntos y guiones bajos, es el título.
+- Incremental: los ficheros que ya son el video_path de algún episodio se
+  descartan por nombre, sin stat ni lectura; repetir el escaneo solo procesa
+  lo nuevo.
+- stat y lectura de cabeceras (duración) en un pool de hilos (INGEST_THREADS):
+  en discos de red casi todo el tiempo es espera.
+- La duración de MP4/MOV sale de la caja mvhd, sin dependencias. Para otros
+  contenedores se usa ffprobe si está instalado; si no, queda vacía.
+"""
+
+import os
+import re
+import shutil
+import struct
+import subprocess
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from sqlalchemy import select
+
+from app import counters, db
+from app.models import Episode
+
+VIDEO_EXTENSIONS = {'.mp4', '.m4v', '.mov', '.mkv', '.avi'}
+MP4_EXTENSIONS = {'.mp4', '.m4v', '.mov'}
+MAX_BOXES = 1000  # Cajas MP4 que se recorren como mucho buscando moov
+FFPROBE_TIMEOUT = 30
+
+SEASON_EPISODE = [
+    re.compile(r'(?<![a-z0-9])s(\d{1,2})[ ._-]*e(\d{1,3})(?!\d)', re.IGNORECASE),
+    re.compile(r'(?<!\d)(\d{1,2})x(\d{1,3})(?!\d)', re.IGNORECASE),
+]
+SEASON_FOLDER = re.compile(r'^(?:season|temporada|s)[ ._-]*(\d{1,2})$', re.IGNORECASE)
+EPISODE_ONLY = [
+    re.compile(r'(?<![a-z])(?:episodio|episode|cap[ií]tulo|cap|ep|e)[ ._-]*(\d{1,3})(?!\d)', re.IGNORECASE),
+    re.compile(r'^(\d{1,3})(?!\d)'),
+]
+
+Candidate = namedtuple('Candidate', 'path season_number episode_number title')
+Entry = namedtuple('Entry', 'action path season_number episode_number title duration reason')
+
+
+# ==================== NOMBRES ====================
+
+def _clean_title(text):
+    text = re.sub(r'[._]+', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip(' -–—[]()') or None
+
+
+def parse_name(path):
+    """(temporada, episodio, título o None) a partir de la ruta; None si no se reconoce"""
+    folder, filename = os.path.split(path)
+    stem = os.path.splitext(filename)[0]
+
+    for pattern in SEASON_EPISODE:
+        match = pattern.search(stem)
+        if match:
+            return int(match.group(1)), int(match.group(2)), _clean_title(stem[match.end():])
+
+    season = SEASON_FOLDER.match(os.path.basename(folder))
+    if season:
+        for pattern in EPISODE_ONLY:
+            match = pattern.search(stem)
+            if match:
+                return int(season.group(1)), int(match.group(1)), _clean_title(stem[match.end():])
+    return None
+
+
+# ==================== DURACIÓN ====================
+
+def _boxes(f, start, end):
+    """(tipo, inicio del contenido, fin) de las cajas MP4 entre start y end"""
+    position, count = start, 0
+    while position + 8 <= end and count < MAX_BOXES:
+        f.seek(position)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack('>I4s', header)
+        body = position + 8
+        if size == 1:
+            large = f.read(8)
+            if len(large) < 8:
+                return
+            size = struct.unpack('>Q', large)[0]
+            body += 8
+        elif size == 0:
+            size = end - position
+        if size < body - position:
+            return
+        yield kind, body, position + size
+        position += size
+        count += 1
+
+
+def mp4_duration(path):
+    """Segundos según la caja moov/mvhd de un MP4 o MOV; None si no se encuentra"""
+    with open(path, 'rb') as f:
+        end = os.fstat(f.fileno()).st_size
+        for kind, body, box_end in _boxes(f, 0, end):
+            if kind != b'moov':
+                continue
+            for child, child_body, _ in _boxes(f, body, box_end):
+                if child != b'mvhd':
+                    continue
+                f.seek(child_body)
+                version = f.read(1)
+                if version == b'\x01':
+                    f.seek(child_body + 4 + 16)
+                    data = f.read(12)
+                    timescale, duration = struct.unpack('>IQ', data) if len(data) == 12 else (0, 0)
+                else:
+                    f.seek(child_body + 4 + 8)
+                    data = f.read(8)
+                    timescale, duration = struct.unpack('>II', data) if len(data) == 8 else (0, 0)
+                return duration / timescale if timescale else None
+    return None
+
+
+def _ffprobe_duration(path):
+    ffprobe = shutil.which('ffprobe')
+    if ffprobe is None:
+        return None
+    try:
+        result = subprocess.run([ffprobe, '-v', 'error', '-show_entries', 'format=duration',
+                                 '-of', 'default=noprint_wrappers=1:nokey=1', path],
+                                capture_output=True, text=True, timeout=FFPROBE_TIMEOUT)
+        return float(result.stdout.strip())
+    except (OSError, subprocess.TimeoutExpired, ValueError):
+        return None
+
+
+def probe_minutes(path):
+    """Duración en minutos (como Episode.duration); None si no se puede leer"""
+    try:
+        if os.path.splitext(path)[1].lower() in MP4_EXTENSIONS:
+            seconds = mp4_duration(path)
+        else:
+            seconds = _ffprobe_duration(path)
+    except (OSError, struct.error):
+        return None
+    return max(1, round(seconds / 60)) if seconds else None
+
+
+# ==================== ESCANEO ====================
+
+def _walk(directory, root):
+    """Rutas relativas a root (con /) de los vídeos bajo directory"""
+    stack = [directory]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in VIDEO_EXTENSIONS:
+                    yield os.path.relpath(entry.path, root).replace(os.sep, '/')
+
+
+def _inspect(root, candidate):
+    """stat (descarta ficheros vacíos, p. ej. copias a medias) y duración"""
+    full_path = os.path.join(root, candidate.path)
+    try:
+        if os.stat(full_path).st_size == 0:
+            return None, 'fichero vacío'
+    except OSError as e:
+        return None, str(e)
+    return probe_minutes(full_path), None
+
+
+def scan(series_id, directory):
+    """Compara la carpeta con los episodios de la serie; devuelve la lista de Entry
+
+    action: 'new' (se crearía), 'conflict' (temporada y episodio ya existen con
+    otro fichero o repetidos en la carpeta), 'skipped' (nombre no reconocido o
+    fichero no válido). Los ficheros ya dados de alta no aparecen.
+    """
+    root = os.path.realpath(current_app.config['UPLOAD_FOLDER'])
+    directory = os.path.realpath(os.path.join(root, directory))
+    if os.path.commonpath([root, directory]) != root:
+        raise ValueError('La carpeta debe estar dentro de UPLOAD_FOLDER')
+    if not os.path.isdir(directory):
+        raise ValueError(f'No existe la carpeta {directory}')
+
+    known_paths = set(db.session.execute(select(Episode.video_path)).scalars())
+    taken = {(season, number): path for season, number, path in db.session.execute(
+        select(Episode.season_number, Episode.episode_number, Episode.video_path)
+        .where(Episode.series_id == series_id))}
+
+    entries, candidates = [], []
+    for path in sorted(_walk(directory, root)):
+        if path in known_paths:
+            continue
+        parsed = parse_name(path)
+        if parsed is None:
+            entries.append(Entry('skipped', path, None, None, None, None, 'nombre no reconocido'))
+            continue
+        season, number, title = parsed
+        key = (season, number)
+        if key in taken:
+            entries.append(Entry('conflict', path, season, number, title, None, f'ya existe: {taken[key]}'))
+            continue
+        taken[key] = path
+        candidates.append(Candidate(path, season, number, title))
+
+    with ThreadPoolExecutor(max_workers=current_app.config['INGEST_THREADS']) as pool:
+        inspected = pool.map(lambda candidate: _inspect(root, candidate), candidates)
+        for candidate, (duration, problem) in zip(candidates, inspected):
+            if problem:
+                entries.append(Entry('skipped', candidate.path, candidate.season_number,
+                                     candidate.episode_number, candidate.title, None, problem))
+            else:
+                entries.append(Entry('new', candidate.path, candidate.season_number, candidate.episode_number,
+                                     candidate.title or f'Episodio {candidate.episode_number}', duration, None))
+
+    entries.sort(key=lambda e: (e.action != 'new', e.season_number or 0, e.episode_number or 0, e.path))
+    return entries
+
+
+def ingest(series_id, directory, dry_run=False):
+    """Escanea y da de alta los episodios nuevos en lotes; devuelve la lista de Entry"""
+    entries = scan(series_id, directory)
+    rows = [{'series_id': series_id, 'season_number': e.season_number, 'episode_number': e.episode_number,
+             'title': e.title[:200], 'duration': e.duration, 'video_path': e.path}
+            for e in entries if e.action == 'new']
+    if dry_run or not rows:
+        return entries
+
+    # La sesión solo ha leído: el escritor está libre para las transacciones por lote
+    db.session.rollback()
+    batch_size = current_app.config['IMPORT_BATCH_SIZE']
+    table = Episode.__table__
+    for start in range(0, len(rows), batch_size):
+        with db.engine.begin() as connection:
+            # Otro proceso puede haber dado de alta alguno desde el escaneo
+            existing = set(connection.execute(select(table.c.season_number, table.c.episode_number)
+                                              .where(table.c.series_id == series_id)).all())
+            batch = [row for row in rows[start:start + batch_size]
+                     if (row['season_number'], row['episode_number']) not in existing]
+            if batch:
+                connection.execute(table.insert(), batch)
+    counters.reconcile(['episodes'])
+    return entries
@@ -0,0 +1,173 @@
+"""
+Instrumentación de SQL por petición
+
+Eventos de SQLAlchemy sobre todos los engines que cuentan, por petición, el
+número de sentencias, el tiempo total en la base de datos y cuántas veces se
+repite cada "forma" de sentencia (la SQL con los literales normalizados). Una
+forma que se repite QUERY_N_PLUS_ONE_THRESHOLD veces o más en la misma petición
+se marca como probable N+1.
+
+- En modo debug (o con QUERY_STATS_HEADERS) se añaden cabeceras X-Query-* a la respuesta.
+- Con QUERY_STATS_LOG se escribe una línea JSON por petición en el logger
+  'carflix.sql' (WARNING si hay sospechas de N+1). En las páginas de
+  stream_page la plantilla se ejecuta después de after_request: la línea se
+  escribe al terminar el envío (teardown) e incluye sus consultas.
+
+Otros módulos pueden registrar funciones en STATEMENT_HOOKS para recibir cada
+sentencia ejecutada: hook(statement, parameters, duration, context).
+"""
+
+import json
+import logging
+import re
+import time
+from collections import Counter
+
+from flask import current_app, g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('carflix.sql')
+
+STATEMENT_HOOKS = []
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACES = re.compile(r'\s+')
+# BEGIN IMMEDIATE del escritor, COMMIT, SAVEPOINT...: no son consultas y se repiten en cada lote
+_TRANSACTION = re.compile(r'\s*(?:BEGIN|COMMIT|END|ROLLBACK|SAVEPOINT|RELEASE)\b', re.IGNORECASE)
+
+_listening = False
+
+
+def statement_shape(statement):
+    """Normaliza una sentencia: literales -> ?, listas IN (?, ?, ...) -> (?...)"""
+    shape = _STRING.sub('?', statement)
+    shape = _NUMBER.sub('?', shape)
+    shape = _IN_LIST.sub('(?...)', shape)
+    return _SPACES.sub(' ', shape).strip()
+
+
+class RequestQueryStats:
+    """Estadísticas de SQL acumuladas durante una petición"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes = Counter()
+
+    def add(self, statement, duration):
+        if _TRANSACTION.match(statement):
+            return
+        self.count += 1
+        self.total_time += duration
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold):
+        """[(forma, veces), ...] de las formas repetidas al menos threshold veces"""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+def current_stats():
+    """Estadísticas de la petición en curso (None fuera de una petición)"""
+    if not has_request_context():
+        return None
+    stats = g.get('query_stats')
+    if stats is None:
+        stats = g.query_stats = RequestQueryStats()
+    return stats
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_start'].pop()
+    stats = current_stats()
+    if stats is not None:
+        stats.add(statement, duration)
+    for hook in STATEMENT_HOOKS:
+        hook(statement, parameters, duration, context)
+
+
+def _handle_error(exception_context):
+    """Descarta el inicio de una sentencia que ha fallado"""
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('query_start'):
+        connection.info['query_start'].pop()
+
+
+def headers_enabled():
+    """True si se añaden cabeceras X-Query-* (QUERY_STATS_HEADERS; None = solo en debug)"""
+    show_headers = current_app.config['QUERY_STATS_HEADERS']
+    return current_app.debug if show_headers is None else show_headers
+
+
+def _after_request(response):
+    """Cabeceras en debug y línea de log estructurada"""
+    if g.get('streaming_template'):
+        # El cuerpo aún no se ha renderizado: el log se escribe al terminar (_teardown_request)
+        g.query_stats_response = response
+        return response
+
+    stats = g.get('query_stats')
+    if stats is None:
+        return response
+
+    repeated = stats.repeated(current_app.config['QUERY_N_PLUS_ONE_THRESHOLD'])
+    if headers_enabled():
+        response.headers['X-Query-Count'] = str(stats.count)
+        response.headers['X-Query-Time-Ms'] = f'{stats.total_time * 1000:.2f}'
+        response.headers['X-Query-N-Plus-One'] = str(len(repeated))
+        if repeated:
+            shape, times = repeated[0]
+            response.headers['X-Query-N-Plus-One-Top'] = f'{times}x {shape[:200]}'.encode(
+                'ascii', 'replace').decode('ascii')
+    _log(response, stats, repeated)
+    return response
+
+
+def _log(response, stats, repeated):
+    if not current_app.config['QUERY_STATS_LOG']:
+        return
+    line = {
+        'event': 'sql_stats',
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'queries': stats.count,
+        'db_ms': round(stats.total_time * 1000, 2),
+        'n_plus_one': [{'count': times, 'shape': shape} for shape, times in repeated],
+    }
+    logger.log(logging.WARNING if repeated else logging.INFO, json.dumps(line, ensure_ascii=False))
+
+
+def _teardown_request(exception):
+    """Páginas de stream_page: la plantilla ya ha terminado y sus consultas están contadas"""
+    response = g.pop('query_stats_response', None)
+    stats = g.get('query_stats')
+    if response is not None and stats is not None:
+        _log(response, stats, stats.repeated(current_app.config['QUERY_N_PLUS_ONE_THRESHOLD']))
+
+
+def init_app(app):
+    """Registra los eventos de SQLAlchemy (una vez por proceso) y el after_request"""
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+        _listening = True
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+    # Sin handler propio las líneas INFO se perderían (logging solo muestra WARNING por defecto)
+    if app.config['QUERY_STATS_LOG'] and not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
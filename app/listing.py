@@ -0,0 +1,167 @@
+"""
+Listados paginados del panel de administración
+
+Paginación por clave (keyset): en lugar de OFFSET, cada página continúa desde
+la última fila de la anterior con WHERE (columna, id) > (valor, id). Con un
+índice sobre la columna de orden el coste de una página no depende de lo lejos
+que esté del principio. El cursor de la página siguiente/anterior viaja en la
+URL (?after= / ?before=) codificado en base64.
+
+Solo se ordena por columnas indexadas (las de SORTS de cada listado); en las
+que admiten NULL (created_at) el cursor sigue el orden de SQLite, que pone los
+NULL antes que cualquier valor. El filtro de texto es de prefijo, con rangos
+que también usan el índice (distingue mayúsculas). Sin filtros el total sale de app/counters.py; con
+filtros es un COUNT(*) cacheado unos segundos (ADMIN_COUNT_TTL), aproximado
+mientras la caché no caduca.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from flask import current_app, request
+from sqlalchemy import DateTime, and_, or_, tuple_
+
+from app import counters
+from app.cache import TTLCache
+
+MAX_PER_PAGE = 200
+PREFIX_END = '\U0010ffff'
+
+_count_cache = TTLCache(ttl=60, maxsize=1000, name='admin_counts')
+
+
+# ==================== CURSORES ====================
+
+def encode_cursor(value, row_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, column):
+    """(valor, id) de un cursor; None si no es válido"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        value, row_id = json.loads(raw)
+        if isinstance(column.type, DateTime) and value is not None:
+            value = datetime.fromisoformat(value)
+        return value, int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+# ==================== PÁGINA ====================
+
+class Page:
+    """Una página de un listado, con lo necesario para enlazar la siguiente y la anterior"""
+
+    def __init__(self, items, sort, descending, q, per_page, total, next_cursor, prev_cursor, filters):
+        self.items = items
+        self.sort = sort
+        self.descending = descending
+        self.q = q
+        self.per_page = per_page
+        self.total = total
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.filters = filters
+
+    @property
+    def direction(self):
+        return 'desc' if self.descending else 'asc'
+
+    def args(self, **overrides):
+        """Argumentos de url_for para otra página o criterio del mismo listado"""
+        values = {'sort': self.sort, 'dir': self.direction, 'q': self.q or None,
+                  'per_page': self.per_page, **self.filters}
+        values.update(overrides)
+        return {key: value for key, value in values.items() if value not in (None, '')}
+
+
+def prefix_filter(columns, q):
+    """Filas cuyo valor en alguna de las columnas empieza por q (rango indexable, no LIKE)"""
+    return or_(*(and_(column >= q, column < q + PREFIX_END) for column in columns))
+
+
+def approximate_count(query, key):
+    table, q, filters = key
+    if not q and not filters and table in counters.TABLES:
+        return counters.count(table)
+    total = _count_cache.get(key)
+    if total is None:
+        total = query.order_by(None).count()
+        _count_cache.set(key, total, ttl=current_app.config['ADMIN_COUNT_TTL'])
+    return total
+
+
+def keyset_filter(column, id_column, cursor, reverse):
+    """Filas posteriores al cursor en el orden (columna, id), o anteriores si reverse"""
+    value, row_id = cursor
+    after_id = id_column < row_id if reverse else id_column > row_id
+    if column is id_column:
+        return after_id
+    if value is None:
+        # Cursor entre los NULL: el resto de NULL por id y, hacia delante, todos los valores
+        nulls = and_(column.is_(None), after_id)
+        return nulls if reverse else or_(nulls, column.isnot(None))
+    key, bound = tuple_(column, id_column), tuple_(value, row_id)
+    if not reverse:
+        return key > bound
+    # (columna, id) < (valor, id) es NULL para las filas sin valor, que van antes de todas
+    return or_(key < bound, column.is_(None)) if column.nullable else key < bound
+
+
+def paginate(query, model, sorts, default_sort, search_columns=(), filters=None):
+    """Página del listado según los argumentos de la petición
+
+    sorts: {nombre: columna} de columnas indexadas (pueden admitir NULL, ver keyset_filter).
+    filters: {argumento: (valor, expresión)} de filtros adicionales ya resueltos.
+    """
+    args = request.args
+    sort = args.get('sort') if args.get('sort') in sorts else default_sort
+    descending = args.get('dir') == 'desc'
+    q = args.get('q', '').strip()
+    per_page = min(max(args.get('per_page', current_app.config['ADMIN_PAGE_SIZE'], type=int), 1), MAX_PER_PAGE)
+    filters = filters or {}
+
+    if q and search_columns:
+        query = query.filter(prefix_filter(search_columns, q))
+    for _, expression in filters.values():
+        query = query.filter(expression)
+
+    count_key = (model.__tablename__, q, tuple(sorted((name, value) for name, (value, _) in filters.items())))
+    total = approximate_count(query, count_key)
+
+    column, id_column = sorts[sort], model.id
+    before = decode_cursor(args.get('before'), column)
+    after = None if before else decode_cursor(args.get('after'), column)
+    cursor = before or after
+    # Para ir hacia atrás se recorre en orden inverso y se da la vuelta al resultado
+    reverse = descending != (before is not None)
+
+    if cursor is not None:
+        query = query.filter(keyset_filter(column, id_column, cursor, reverse))
+    order = [column, id_column] if column is not id_column else [id_column]
+    query = query.order_by(*(c.desc() if reverse else c.asc() for c in order))
+
+    items = query.limit(per_page + 1).all()
+    more = len(items) > per_page
+    items = items[:per_page]
+    if before is not None:
+        items.reverse()
+
+    def cursor_of(item):
+        return encode_cursor(getattr(item, column.key), item.id)
+
+    has_next = more if before is None else True
+    has_prev = more if before is not None else after is not None
+    return Page(
+        items=items, sort=sort, descending=descending, q=q, per_page=per_page, total=total,
+        next_cursor=cursor_of(items[-1]) if items and has_next else None,
+        prev_cursor=cursor_of(items[0]) if items and has_prev else None,
+        filters={name: value for name, (value, _) in filters.items()},
+    )
@@ -0,0 +1,187 @@
+"""
+Comprobación de integridad de los ficheros referenciados
+
+Recorre todas las rutas de las columnas de medios (deletion.MEDIA_COLUMNS):
+vídeos, pósters, fondos, miniaturas y fotos de perfil. Comprueba que cada
+fichero existe, no está vacío y su cabecera corresponde a su extensión (MP4/MOV,
+Matroska/WebM, AVI, JPEG, PNG, GIF, WebP). El resultado se guarda en la tabla
+media_check y se muestra en /admin/media.
+
+- stat y lectura de cabeceras en un pool de MEDIA_CHECK_THREADS hilos.
+- Incremental: si el tamaño y la fecha de modificación coinciden con los de la
+  última comprobación, no se vuelve a leer la cabecera (--full lo fuerza).
+- Solo se escriben las filas que cambian; las rutas que ya nadie referencia se
+  borran de la tabla. La fecha de la última pasada va en su propia fila
+  (media_check_run), no en cada fila de resultados.
+
+Se lanza con `python manage.py verify` (por ejemplo desde cron) o desde el panel.
+"""
+
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert
+
+from app import db
+from app.deletion import MEDIA_COLUMNS
+from app.models import MediaCheck
+
+HEADER_BYTES = 16
+WRITE_CHUNK = 1000
+
+# extensión -> comprobación de los primeros HEADER_BYTES bytes
+MP4_BOXES = {b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'pnot'}
+SIGNATURES = {
+    '.mp4': lambda h: h[4:8] in MP4_BOXES,
+    '.m4v': lambda h: h[4:8] in MP4_BOXES,
+    '.mov': lambda h: h[4:8] in MP4_BOXES,
+    '.mkv': lambda h: h.startswith(b'\x1a\x45\xdf\xa3'),
+    '.webm': lambda h: h.startswith(b'\x1a\x45\xdf\xa3'),
+    '.avi': lambda h: h[:4] == b'RIFF' and h[8:12] == b'AVI ',
+    '.jpg': lambda h: h.startswith(b'\xff\xd8\xff'),
+    '.jpeg': lambda h: h.startswith(b'\xff\xd8\xff'),
+    '.png': lambda h: h.startswith(b'\x89PNG\r\n\x1a\n'),
+    '.gif': lambda h: h[:6] in (b'GIF87a', b'GIF89a'),
+    '.webp': lambda h: h[:4] == b'RIFF' and h[8:12] == b'WEBP',
+}
+
+# Una sola fila (id = 1) con la última pasada completada
+run_table = db.Table('media_check_run',
+                     db.Column('id', db.Integer, primary_key=True),
+                     db.Column('finished_at', db.DateTime, nullable=False),
+                     db.Column('full', db.Boolean, nullable=False),
+                     db.Column('written', db.Integer, nullable=False)
+                     )
+
+Result = namedtuple('Result', 'status detail size mtime')
+
+_checking = threading.Lock()
+
+
+# ==================== REFERENCIAS ====================
+
+def references():
+    """{ruta: (tipo, id, campo, nº de referencias)} con la primera fila que referencia cada ruta"""
+    refs = {}
+    with db.engine.connect() as connection:
+        for column in MEDIA_COLUMNS:
+            table = column.class_.__table__
+            rows = connection.execute(select(table.c.id, column).where(column.is_not(None), column != ''))
+            for item_id, path in rows:
+                ref = refs.get(path)
+                if ref is None:
+                    refs[path] = (table.name, item_id, column.key, 1)
+                else:
+                    refs[path] = ref[:3] + (ref[3] + 1,)
+    return refs
+
+
+# ==================== COMPROBACIÓN ====================
+
+def check_file(root, path, previous=None):
+    """Result de una ruta; con previous (Result anterior) no relee la cabecera si no ha cambiado"""
+    full_path = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full_path]) != root:
+        return Result('invalid', 'ruta fuera de la carpeta de subidas', None, None)
+    try:
+        stat = os.stat(full_path)
+    except FileNotFoundError:
+        return Result('missing', 'no existe', None, None)
+    except OSError as e:
+        return Result('missing', e.strerror, None, None)
+
+    if previous is not None and previous.size == stat.st_size and previous.mtime == stat.st_mtime \
+            and previous.status in ('ok', 'invalid', 'empty'):
+        return previous
+    if stat.st_size == 0:
+        return Result('empty', 'fichero vacío', 0, stat.st_mtime)
+
+    validate = SIGNATURES.get(os.path.splitext(path)[1].lower())
+    if validate is None:
+        return Result('ok', 'formato no comprobado', stat.st_size, stat.st_mtime)
+    try:
+        with open(full_path, 'rb') as f:
+            header = f.read(HEADER_BYTES)
+    except OSError as e:
+        return Result('invalid', f'no se puede leer: {e.strerror}', stat.st_size, stat.st_mtime)
+    if not validate(header):
+        return Result('invalid', 'la cabecera no corresponde a la extensión', stat.st_size, stat.st_mtime)
+    return Result('ok', None, stat.st_size, stat.st_mtime)
+
+
+def run(full=False):
+    """Comprueba todas las rutas referenciadas; devuelve ({estado: nº de rutas}, nº de filas que cambian)"""
+    root = os.path.realpath(current_app.config['UPLOAD_FOLDER'])
+    refs = references()
+
+    table = MediaCheck.__table__
+    with db.engine.connect() as connection:
+        stored = {row.path: (Result(row.status, row.detail, row.size, row.mtime),
+                             (row.item_type, row.item_id, row.field, row.ref_count))
+                  for row in connection.execute(select(table))}
+
+    paths = sorted(refs)
+    with ThreadPoolExecutor(max_workers=current_app.config['MEDIA_CHECK_THREADS']) as pool:
+        results = list(pool.map(
+            lambda p: check_file(root, p, None if full or p not in stored else stored[p][0]), paths))
+
+    now = datetime.utcnow()
+    rows, counts = [], {}
+    for path, result in zip(paths, results):
+        counts[result.status] = counts.get(result.status, 0) + 1
+        if full or stored.get(path) != (result, refs[path]):
+            item_type, item_id, field, ref_count = refs[path]
+            rows.append({'path': path, 'status': result.status, 'detail': result.detail, 'size': result.size,
+                         'mtime': result.mtime, 'item_type': item_type, 'item_id': item_id, 'field': field,
+                         'ref_count': ref_count, 'checked_at': now})
+    gone = [path for path in stored if path not in refs]
+
+    for start in range(0, len(rows), WRITE_CHUNK):
+        with db.engine.begin() as connection:
+            statement = insert(table)
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=[table.c.path],
+                set_={name: statement.excluded[name] for name in rows[0] if name != 'path'}),
+                rows[start:start + WRITE_CHUNK])
+    with db.engine.begin() as connection:
+        for start in range(0, len(gone), WRITE_CHUNK):
+            connection.execute(table.delete().where(table.c.path.in_(gone[start:start + WRITE_CHUNK])))
+        statement = insert(run_table).values(id=1, finished_at=datetime.utcnow(), full=full, written=len(rows))
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[run_table.c.id],
+            set_={name: statement.excluded[name] for name in ('finished_at', 'full', 'written')}))
+    return counts, len(rows)
+
+
+def summary():
+    """{estado: nº de rutas} de la última comprobación y la fecha en que terminó (None si no hay ninguna)"""
+    counts = dict(db.session.execute(select(MediaCheck.status, func.count()).group_by(MediaCheck.status)).all())
+    last = db.session.execute(select(run_table.c.finished_at).where(run_table.c.id == 1)).scalar()
+    return counts, last
+
+
+def start(app, full=False):
+    """Lanza la comprobación en un hilo; False si ya hay una en marcha en este proceso"""
+    if not _checking.acquire(blocking=False):
+        return False
+
+    def work():
+        try:
+            with app.app_context():
+                run(full=full)
+        except Exception:
+            app.logger.exception('Error en la comprobación de ficheros')
+        finally:
+            _checking.release()
+
+    threading.Thread(target=work, name='carflix-media-check', daemon=True).start()
+    return True
+
+
+def running():
+    return _checking.locked()
@@ -0,0 +1,116 @@
+"""
+Recolector de ficheros subidos huérfanos (marcar y barrer)
+
+Al sustituir un póster, un vídeo o una foto de perfil, o al borrar una
+película o un episodio, el fichero anterior se queda en app/static para
+siempre. El recolector:
+
+1. Marca: reúne en una sola consulta (UNION de todas las columnas de rutas,
+   deletion.MEDIA_COLUMNS) todas las rutas referenciadas, incluidas las de
+   filas con borrado pendiente.
+2. Barre: recorre las carpetas de subidas en paralelo (un directorio por tarea
+   en un pool de MEDIA_GC_THREADS hilos) y se queda con los ficheros que nadie
+   referencia.
+3. Solo son candidatos los que llevan más de MEDIA_GC_GRACE segundos sin
+   modificarse: una subida en curso o recién guardada cuya fila aún no se ha
+   escrito no se toca. Se usa el mayor de mtime y ctime, porque los vídeos
+   copiados para ingest con `cp -p` o `rsync -a` conservan su mtime antiguo
+   pero su ctime es el de la copia. Antes de borrar se vuelve a comprobar cada ruta contra
+   la base de datos (deletion.remove_unreferenced).
+
+Por defecto solo informa; `python manage.py gc --delete` borra.
+"""
+
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from flask import current_app
+from sqlalchemy import select, union
+
+from app import db
+from app.deletion import MEDIA_COLUMNS, UPLOAD_SUBFOLDERS, remove_unreferenced
+
+DELETE_CHUNK = 500  # Rutas por comprobación y borrado
+
+MediaFile = namedtuple('MediaFile', 'path size changed')  # changed: max(mtime, ctime)
+Report = namedtuple('Report', 'scanned referenced orphans young removed reclaimed_bytes')
+
+
+def referenced_paths():
+    """Todas las rutas que referencia alguna fila, en una consulta"""
+    query = union(*(select(column.label('path')).where(column.is_not(None)) for column in MEDIA_COLUMNS))
+    with db.engine.connect() as connection:
+        return set(connection.execute(query).scalars())
+
+
+def _scan_dir(path):
+    """Ficheros y subdirectorios de un directorio (sin seguir enlaces)"""
+    files, dirs = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                files.append((entry.path, stat.st_size, max(stat.st_mtime, stat.st_ctime)))
+    return files, dirs
+
+
+def walk(root, threads):
+    """[MediaFile] de las carpetas de subidas, con las rutas relativas a root"""
+    found = []
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        pending = {pool.submit(_scan_dir, os.path.join(root, folder))
+                   for folder in UPLOAD_SUBFOLDERS if os.path.isdir(os.path.join(root, folder))}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    files, dirs = future.result()
+                except OSError as e:  # Directorio borrado o sin permisos durante el recorrido
+                    current_app.logger.warning('No se pudo recorrer %s', e.filename)
+                    continue
+                for path, size, changed in files:
+                    found.append(MediaFile(os.path.relpath(path, root).replace(os.sep, '/'), size, changed))
+                pending |= {pool.submit(_scan_dir, directory) for directory in dirs}
+    return found
+
+
+def collect(delete=False, grace=None):
+    """Marca y barre; con delete=True borra los huérfanos fuera del periodo de gracia
+
+    Devuelve (Report, [MediaFile huérfanos], ordenados por tamaño).
+    """
+    config = current_app.config
+    grace = config['MEDIA_GC_GRACE'] if grace is None else grace
+    root = config['UPLOAD_FOLDER']
+
+    # Primero el recorrido y después la marca: un fichero subido entre los dos
+    # pasos ya tiene su fila cuando se leen las referencias
+    files = walk(root, config['MEDIA_GC_THREADS'])
+    referenced = referenced_paths()
+
+    limit = time.time() - grace
+    orphans, young = [], 0
+    for media in files:
+        if media.path in referenced:
+            continue
+        if media.changed > limit:
+            young += 1
+        else:
+            orphans.append(media)
+    orphans.sort(key=lambda media: media.size, reverse=True)
+
+    removed, reclaimed = [], 0
+    if delete:
+        sizes = {media.path: media.size for media in orphans}
+        paths = list(sizes)
+        for start in range(0, len(paths), DELETE_CHUNK):
+            removed.extend(remove_unreferenced(paths[start:start + DELETE_CHUNK]))
+        reclaimed = sum(sizes[path] for path in removed)
+
+    report = Report(scanned=len(files), referenced=len(referenced), orphans=len(orphans), young=young,
+                    removed=len(removed), reclaimed_bytes=reclaimed)
+    return report, orphans
@@ -0,0 +1,277 @@
+"""
+Métricas de peticiones en formato Prometheus
+
+Por cada endpoint: histograma de latencias, peticiones por código de estado,
+bytes de respuesta (serve_video tiene su propio endpoint, así que el vídeo sale
+separado) y tiempo en la base de datos (de app/instrumentation.py). Además,
+peticiones en curso, aciertos/fallos de las cachés con nombre (app/cache.py) y
+tiempo de renderizado por plantilla y bloque (app/templating.py).
+
+Cada hilo escribe en su propio diccionario, sin locks en el camino de la
+petición; los diccionarios se suman al hacer el scrape. Una muestra es
+(nombre, etiquetas) -> valor, así que sumar procesos o hilos es sumar claves.
+
+Con varios procesos (METRICS_MULTIPROC_DIR) cada worker vuelca sus muestras a
+<dir>/metrics_<pid>.json cada METRICS_FLUSH_INTERVAL segundos y /metrics suma
+todos los ficheros. Los contadores de workers muertos se conservan; los gauges
+solo se suman de procesos vivos.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+
+from flask import current_app, g, request
+
+from app.cache import CACHES
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# nombre -> (tipo, ayuda)
+FAMILIES = {
+    'carflix_http_requests_total': ('counter', 'Peticiones HTTP por endpoint, método y estado'),
+    'carflix_http_request_duration_seconds': ('histogram', 'Latencia de las peticiones HTTP'),
+    'carflix_http_requests_in_flight': ('gauge', 'Peticiones HTTP en curso'),
+    'carflix_http_response_bytes_total': ('counter', 'Bytes de respuesta por endpoint'),
+    'carflix_db_seconds_total': ('counter', 'Tiempo en la base de datos por endpoint'),
+    'carflix_db_queries_total': ('counter', 'Sentencias SQL por endpoint'),
+    'carflix_cache_hits_total': ('counter', 'Aciertos de caché'),
+    'carflix_cache_misses_total': ('counter', 'Fallos de caché'),
+    'carflix_template_render_seconds_total': ('counter', 'Tiempo de renderizado por plantilla y bloque'),
+    'carflix_template_renders_total': ('counter', 'Renderizados por plantilla y bloque'),
+}
+GAUGES = {name for name, (kind, _) in FAMILIES.items() if kind == 'gauge'}
+
+UNMATCHED = '<sin_ruta>'
+
+
+# ==================== MUESTRAS POR HILO ====================
+
+class _ThreadSamples(threading.local):
+    """Muestras del hilo actual; cada hilo se registra al usarlas por primera vez"""
+
+    def __init__(self):
+        self.samples = {}
+        with _registry_lock:
+            _threads.append((threading.current_thread(), self.samples))
+
+
+_registry_lock = threading.Lock()
+_threads = []  # [(hilo, muestras)]
+_retired = {}  # Muestras de hilos que ya han terminado
+_local = _ThreadSamples()
+_last_flush = 0.0
+
+
+def _inc(name, labels, value=1):
+    samples = _local.samples
+    key = (name, labels)
+    samples[key] = samples.get(key, 0) + value
+
+
+def observe(endpoint, method, status, duration, size, db_time, db_queries):
+    """Registra una petición terminada"""
+    _inc('carflix_http_requests_total', (('endpoint', endpoint), ('method', method), ('status', str(status))))
+
+    labels = (('endpoint', endpoint), ('method', method))
+    for le in BUCKETS:
+        if duration <= le:
+            _inc('carflix_http_request_duration_seconds_bucket', labels + (('le', repr(le)),))
+    _inc('carflix_http_request_duration_seconds_bucket', labels + (('le', '+Inf'),))
+    _inc('carflix_http_request_duration_seconds_sum', labels, duration)
+    _inc('carflix_http_request_duration_seconds_count', labels)
+
+    endpoint_label = (('endpoint', endpoint),)
+    if size:
+        _inc('carflix_http_response_bytes_total', endpoint_label, size)
+    if db_queries:
+        _inc('carflix_db_seconds_total', endpoint_label, db_time)
+        _inc('carflix_db_queries_total', endpoint_label, db_queries)
+
+
+def observe_template(template, block, duration):
+    """Registra el renderizado de una plantilla o de uno de sus bloques"""
+    labels = (('template', template), ('block', block))
+    _inc('carflix_template_render_seconds_total', labels, duration)
+    _inc('carflix_template_renders_total', labels)
+
+
+def _merge(target, samples):
+    for key, value in list(samples.items()):
+        target[key] = target.get(key, 0) + value
+
+
+def process_samples():
+    """Suma las muestras de todos los hilos de este proceso y las de las cachés"""
+    with _registry_lock:
+        alive = []
+        for thread, samples in _threads:
+            if thread.is_alive():
+                alive.append((thread, samples))
+            else:
+                _merge(_retired, samples)
+        _threads[:] = alive
+
+        total = dict(_retired)
+        for _, samples in alive:
+            _merge(total, samples)
+
+    for name, cache in CACHES.items():
+        total[('carflix_cache_hits_total', (('cache', name),))] = cache.hits
+        total[('carflix_cache_misses_total', (('cache', name),))] = cache.misses
+    return total
+
+
+# ==================== MULTIPROCESO ====================
+
+def _dump_path(directory, pid):
+    return os.path.join(directory, f'metrics_{pid}.json')
+
+
+def flush(directory):
+    """Vuelca las muestras de este proceso (escritura atómica con rename)"""
+    rows = [[name, list(labels), value] for (name, labels), value in process_samples().items()]
+    path = _dump_path(directory, os.getpid())
+    tmp = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(rows, f)
+    os.replace(tmp, path)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect(directory=None):
+    """Muestras de este proceso, o de todos los workers si hay directorio compartido"""
+    if not directory:
+        return process_samples()
+
+    flush(directory)
+    total = {}
+    for filename in os.listdir(directory):
+        if not (filename.startswith('metrics_') and filename.endswith('.json')):
+            continue
+        pid = int(filename[len('metrics_'):-len('.json')])
+        alive = _pid_alive(pid)
+        try:
+            with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                rows = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in rows:
+            if name in GAUGES and not alive:
+                continue
+            key = (name, tuple(tuple(pair) for pair in labels))
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+# ==================== FORMATO DE TEXTO ====================
+
+def _family(sample_name):
+    for suffix in ('_bucket', '_sum', '_count'):
+        base = sample_name[:-len(suffix)]
+        if sample_name.endswith(suffix) and FAMILIES.get(base, ('',))[0] == 'histogram':
+            return base
+    return sample_name
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _sort_key(row):
+    """Agrupa por serie; dentro de un histograma, buckets por 'le' creciente y luego _sum y _count"""
+    name, labels, _ = row
+    series = tuple(pair for pair in labels if pair[0] != 'le')
+    le = dict(labels).get('le')
+    return series, not name.endswith('_bucket'), float(le) if le else 0.0, name
+
+
+def render(samples):
+    """Texto en formato de exposición de Prometheus 0.0.4"""
+    by_family = {}
+    for (name, labels), value in samples.items():
+        by_family.setdefault(_family(name), []).append((name, labels, value))
+
+    lines = []
+    for family in sorted(by_family):
+        kind, help_text = FAMILIES.get(family, ('untyped', family))
+        lines.append(f'# HELP {family} {help_text}')
+        lines.append(f'# TYPE {family} {kind}')
+        for name, labels, value in sorted(by_family[family], key=_sort_key):
+            label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+            lines.append(f'{name}{{{label_text}}} {_format_value(value)}' if labels
+                         else f'{name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+# ==================== MIDDLEWARE ====================
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    _inc('carflix_http_requests_in_flight', ())
+
+
+def _after_request(response):
+    if g.get('metrics_start') is None:
+        return response
+    if g.get('streaming_template'):
+        g.metrics_response = response  # Se mide al terminar de renderizar y enviar (_teardown_request)
+        return response
+    _observe(response)
+    return response
+
+
+def _observe(response):
+    stats = g.get('query_stats')
+    observe(
+        endpoint=request.endpoint or UNMATCHED,
+        method=request.method,
+        status=response.status_code,
+        duration=time.perf_counter() - g.metrics_start,
+        size=response.content_length or 0,
+        db_time=stats.total_time if stats else 0.0,
+        db_queries=stats.count if stats else 0,
+    )
+
+    global _last_flush
+    directory = current_app.config['METRICS_MULTIPROC_DIR']
+    now = time.monotonic()
+    if directory and now - _last_flush >= current_app.config['METRICS_FLUSH_INTERVAL']:
+        _last_flush = now
+        flush(directory)
+
+
+def _teardown_request(exception):
+    response = g.pop('metrics_response', None)
+    if response is not None:
+        _observe(response)
+    if g.pop('metrics_start', None) is not None:
+        _inc('carflix_http_requests_in_flight', (), -1)
+
+
+def init_app(app):
+    """Registra el middleware de métricas"""
+    if not app.config['METRICS_ENABLED']:
+        return
+    directory = app.config['METRICS_MULTIPROC_DIR']
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        atexit.register(flush, directory)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
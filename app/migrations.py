@@ -0,0 +1,153 @@
+"""
+Migraciones de esquema versionadas
+
+db.create_all() solo crea las tablas que faltan: nunca añade índices ni
+columnas a tablas existentes. Cada migración de esta lista se aplica una vez
+por base de datos (se registra en schema_migrations) y debe ser idempotente
+(CREATE INDEX IF NOT EXISTS, add_column_if_missing...), porque en una base de
+datos nueva create_all ya habrá creado el esquema actual de los modelos.
+
+Para añadir una migración: nueva función con @migration(siguiente_versión, 'nombre').
+"""
+
+from datetime import datetime
+
+from sqlalchemy import text
+
+from app import counters, db, personalization
+
+schema_migrations = db.Table('schema_migrations',
+                             db.Column('version', db.Integer, primary_key=True),
+                             db.Column('name', db.String(100), nullable=False),
+                             db.Column('applied_at', db.DateTime, nullable=False)
+                             )
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    """Registra una función fn(connection) como migración"""
+
+    def decorator(fn):
+        assert all(m[0] != version for m in MIGRATIONS), f'Versión de migración duplicada: {version}'
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+
+    return decorator
+
+
+# ==================== UTILIDADES ====================
+
+def create_index(connection, name, table, columns):
+    connection.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({", ".join(columns)})'))
+
+
+def add_column_if_missing(connection, table, column, definition):
+    """ALTER TABLE ... ADD COLUMN solo si la columna no existe"""
+    existing = {row[1] for row in connection.execute(text(f'PRAGMA table_info({table})'))}
+    if column not in existing:
+        connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {definition}'))
+
+
+# ==================== MIGRACIONES ====================
+
+@migration(1, 'indices_episodios')
+def _episode_indexes(connection):
+    create_index(connection, 'ix_episode_series_season_episode', 'episode',
+                 ['series_id', 'season_number', 'episode_number'])
+
+
+@migration(2, 'indices_fechas_historial')
+def _date_indexes(connection):
+    for table in ('movie_watched', 'episode_watched'):
+        create_index(connection, f'ix_{table}_user_date', table, ['user_id', 'watched_date'])
+        create_index(connection, f'ix_{table}_watched_date', table, ['watched_date'])
+    for table in ('movie_favorites', 'series_favorites'):
+        create_index(connection, f'ix_{table}_user_added', table, ['user_id', 'added_date'])
+
+
+@migration(3, 'indices_inversos_asociaciones')
+def _reverse_indexes(connection):
+    create_index(connection, 'ix_movie_watched_movie_id', 'movie_watched', ['movie_id'])
+    create_index(connection, 'ix_episode_watched_episode_id', 'episode_watched', ['episode_id'])
+    create_index(connection, 'ix_movie_favorites_movie_id', 'movie_favorites', ['movie_id'])
+    create_index(connection, 'ix_series_favorites_series_id', 'series_favorites', ['series_id'])
+    create_index(connection, 'ix_movie_categories_category_id', 'movie_categories', ['category_id'])
+    create_index(connection, 'ix_series_categories_category_id', 'series_categories', ['category_id'])
+
+
+@migration(4, 'indices_listados_admin')
+def _listing_indexes(connection):
+    # Orden por fecha de alta en los listados paginados del panel de administración
+    for table in ('user', 'movie', 'series'):
+        create_index(connection, f'ix_{table}_created_at', f'"{table}"', ['created_at'])
+
+
+@migration(5, 'contadores')
+def _counters(connection):
+    counters.counter_table.create(connection, checkfirst=True)
+    for table in counters.TABLES:
+        counters.reconcile_table(connection, table)
+
+
+@migration(6, 'borrado_diferido')
+def _soft_delete(connection):
+    for table in ('user', 'series'):
+        add_column_if_missing(connection, f'"{table}"', 'deleted_at', 'DATETIME')
+        create_index(connection, f'ix_{table}_deleted_at', f'"{table}"', ['deleted_at'])
+    # Los contadores pasan a contar solo las filas no borradas
+    for table in counters.TABLES:
+        counters.reconcile_table(connection, table)
+
+
+@migration(7, 'comprobacion_medios')
+def _media_check(connection):
+    db.metadata.tables['media_check'].create(connection, checkfirst=True)
+
+
+@migration(8, 'afinidad_desde_historial')
+def _affinity_backfill(connection):
+    # Los vectores ya no se construyen al leer /home: se completan los que falten
+    personalization.rebuild_affinities(connection)
+
+
+@migration(9, 'ultima_comprobacion_medios')
+def _media_check_run(connection):
+    db.metadata.tables['media_check_run'].create(connection, checkfirst=True)
+
+
+@migration(10, 'version_usuario')
+def _user_version(connection):
+    add_column_if_missing(connection, '"user"', 'version', "INTEGER NOT NULL DEFAULT '0'")
+
+
+# ==================== EJECUCIÓN ====================
+
+def applied_versions(connection):
+    schema_migrations.create(connection, checkfirst=True)
+    return {row.version: row.applied_at for row in connection.execute(schema_migrations.select())}
+
+
+def status():
+    """Lista [(versión, nombre, fecha de aplicación o None), ...]"""
+    with db.engine.begin() as connection:
+        applied = applied_versions(connection)
+    return [(version, name, applied.get(version)) for version, name, _ in MIGRATIONS]
+
+
+def upgrade():
+    """Aplica las migraciones pendientes, cada una en su propia transacción"""
+    with db.engine.begin() as connection:
+        applied = applied_versions(connection)
+
+    done = []
+    for version, name, fn in MIGRATIONS:
+        if version in applied:
+            continue
+        with db.engine.begin() as connection:
+            fn(connection)
+            connection.execute(schema_migrations.insert().values(version=version, name=name,
+                                                                 applied_at=datetime.utcnow()))
+        done.append((version, name))
+    return done
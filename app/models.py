@@ -1,46 +1,62 @@
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.orm import deferred, make_transient_to_detached
 from flask_login import UserMixin
 from app import db, login_manager
+from app.cache import TTLCache
+from app.passwords import hash_password, verify_password, needs_rehash
 
 # Tabla de relación muchos a muchos: Películas-Categorías
 movie_categories = db.Table('movie_categories',
                             db.Column('movie_id', db.Integer, db.ForeignKey('movie.id'), primary_key=True),
-                            db.Column('category_id', db.Integer, db.ForeignKey('category.id'), primary_key=True)
+                            db.Column('category_id', db.Integer, db.ForeignKey('category.id'), primary_key=True),
+                            db.Index('ix_movie_categories_category_id', 'category_id')
                             )
 
 # Tabla de relación muchos a muchos: Series-Categorías
 series_categories = db.Table('series_categories',
                              db.Column('series_id', db.Integer, db.ForeignKey('series.id'), primary_key=True),
-                             db.Column('category_id', db.Integer, db.ForeignKey('category.id'), primary_key=True)
+                             db.Column('category_id', db.Integer, db.ForeignKey('category.id'), primary_key=True),
+                             db.Index('ix_series_categories_category_id', 'category_id')
                              )
 
 # Tabla de favoritos de películas
 movie_favorites = db.Table('movie_favorites',
                            db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
                            db.Column('movie_id', db.Integer, db.ForeignKey('movie.id'), primary_key=True),
-                           db.Column('added_date', db.DateTime, default=datetime.utcnow)
+                           db.Column('added_date', db.DateTime, default=datetime.utcnow),
+                           db.Index('ix_movie_favorites_movie_id', 'movie_id'),
+                           db.Index('ix_movie_favorites_user_added', 'user_id', 'added_date')
                            )
 
 # Tabla de favoritos de series
 series_favorites = db.Table('series_favorites',
                             db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
                             db.Column('series_id', db.Integer, db.ForeignKey('series.id'), primary_key=True),
-                            db.Column('added_date', db.DateTime, default=datetime.utcnow)
+                            db.Column('added_date', db.DateTime, default=datetime.utcnow),
+                            db.Index('ix_series_favorites_series_id', 'series_id'),
+                            db.Index('ix_series_favorites_user_added', 'user_id', 'added_date')
                             )
 
 # Tabla de películas vistas
 movie_watched = db.Table('movie_watched',
                          db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
                          db.Column('movie_id', db.Integer, db.ForeignKey('movie.id'), primary_key=True),
-                         db.Column('watched_date', db.DateTime, default=datetime.utcnow)
+                         db.Column('watched_date', db.DateTime, default=datetime.utcnow),
+                         db.Index('ix_movie_watched_movie_id', 'movie_id'),
+                         db.Index('ix_movie_watched_user_date', 'user_id', 'watched_date'),
+                         db.Index('ix_movie_watched_watched_date', 'watched_date')
                          )
 
 # Tabla de episodios vistos
 episode_watched = db.Table('episode_watched',
                            db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
                            db.Column('episode_id', db.Integer, db.ForeignKey('episode.id'), primary_key=True),
-                           db.Column('watched_date', db.DateTime, default=datetime.utcnow)
+                           db.Column('watched_date', db.DateTime, default=datetime.utcnow),
+                           db.Index('ix_episode_watched_episode_id', 'episode_id'),
+                           db.Index('ix_episode_watched_user_date', 'user_id', 'watched_date'),
+                           db.Index('ix_episode_watched_watched_date', 'watched_date')
                            )
 
 
@@ -49,10 +65,12 @@ class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False, index=True)
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
-    password_hash = db.Column(db.String(256))
+    password_hash = deferred(db.Column(db.String(256)))  # Solo se carga al comprobar la contraseña
     is_admin = db.Column(db.Boolean, default=False)
     profile_picture = db.Column(db.String(300), default='images/default-avatar.png')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    deleted_at = db.Column(db.DateTime, index=True)  # Borrado pendiente de purga (ver app/deletion.py)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Ver invalidate_user_cache
 
     # Relaciones
     favorite_movies = db.relationship('Movie', secondary=movie_favorites,
@@ -63,14 +81,20 @@ class User(UserMixin, db.Model):
                                      backref=db.backref('watched_by', lazy='dynamic'))
     watched_episodes = db.relationship('Episode', secondary=episode_watched,
                                        backref=db.backref('watched_by', lazy='dynamic'))
+    category_affinities = db.relationship('UserCategoryAffinity', lazy='dynamic',
+                                          cascade='all, delete-orphan')
 
     def set_password(self, password):
         """Establece la contraseña hasheada"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        """Verifica la contraseña"""
-        return check_password_hash(self.password_hash, password)
+        """Verifica la contraseña (puede lanzar PasswordCheckBusy)"""
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        """True si el hash no usa los parámetros actuales de Config"""
+        return needs_rehash(self.password_hash)
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -95,7 +119,7 @@ class Movie(db.Model):
     video_path = db.Column(db.String(300), nullable=False)
     poster_path = db.Column(db.String(300))
     background_path = db.Column(db.String(300))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     # Relaciones
     categories = db.relationship('Category', secondary=movie_categories,
@@ -113,7 +137,8 @@ class Series(db.Model):
     release_year = db.Column(db.Integer)
     poster_path = db.Column(db.String(300))
     background_path = db.Column(db.String(300))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    deleted_at = db.Column(db.DateTime, index=True)  # Borrado pendiente de purga (ver app/deletion.py)
 
     # Relaciones
     categories = db.relationship('Category', secondary=series_categories,
@@ -127,6 +152,11 @@ class Series(db.Model):
 
 class Episode(db.Model):
     """Modelo de Episodio"""
+    # Cubre también las búsquedas solo por series_id
+    __table_args__ = (
+        db.Index('ix_episode_series_season_episode', 'series_id', 'season_number', 'episode_number'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     series_id = db.Column(db.Integer, db.ForeignKey('series.id'), nullable=False)
     season_number = db.Column(db.Integer, nullable=False)
@@ -142,7 +172,92 @@ class Episode(db.Model):
         return f'<Episode S{self.season_number}E{self.episode_number}: {self.title}>'
 
 
+class UserCategoryAffinity(db.Model):
+    """Afinidad de un usuario a una categoría (vistos y favoritos ponderados)"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), primary_key=True)
+    weight = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<UserCategoryAffinity user={self.user_id} category={self.category_id} weight={self.weight}>'
+
+
+class ItemSimilarity(db.Model):
+    """Vecinos más similares precalculados para cada título (película o serie)"""
+    item_type = db.Column(db.String(10), primary_key=True)  # 'movie' o 'series'
+    item_id = db.Column(db.Integer, primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    neighbor_type = db.Column(db.String(10), nullable=False)
+    neighbor_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<ItemSimilarity {self.item_type}:{self.item_id} #{self.rank} -> {self.neighbor_type}:{self.neighbor_id}>'
+
+
+class TrendingBucket(db.Model):
+    """Instantánea de un bucket de los contadores de tendencias"""
+    period = db.Column(db.String(5), primary_key=True)  # '1h', '24h' o '7d'
+    item_type = db.Column(db.String(10), primary_key=True)
+    item_id = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)  # Número absoluto de bucket (timestamp // tamaño)
+    count = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<TrendingBucket {self.period} {self.item_type}:{self.item_id} #{self.bucket}={self.count}>'
+
+
+class MediaCheck(db.Model):
+    """Último resultado de la comprobación de un fichero referenciado (ver app/media_check.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(300), unique=True, nullable=False)
+    status = db.Column(db.String(10), nullable=False, index=True)  # 'ok', 'missing', 'empty', 'invalid'
+    detail = db.Column(db.String(200))
+    size = db.Column(db.BigInteger)
+    mtime = db.Column(db.Float)
+    item_type = db.Column(db.String(10), nullable=False)  # Primera fila que lo referencia
+    item_id = db.Column(db.Integer, nullable=False)
+    field = db.Column(db.String(30), nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=1)
+    checked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)  # Último cambio de resultado
+
+    def __repr__(self):
+        return f'<MediaCheck {self.path} {self.status}>'
+
+
+# Caché de identidad de usuarios: {user_id: columnas}. Nunca guarda password_hash
+_user_cache = TTLCache(ttl=30, maxsize=10000, name='user')
+_CACHED_COLUMNS = [column.key for column in User.__table__.columns if column.key != 'password_hash']
+
+
+def invalidate_user_cache(user):
+    """
+    Incrementa la versión del usuario (se guarda con el siguiente commit, así
+    que hay que llamarla antes). Todos los procesos comparan esa versión con la
+    de su caché en cada petición, así que ninguno sigue usando is_admin o el
+    borrado de antes.
+    """
+    user.version = User.version + 1
+    _user_cache.pop(user.id)
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    """Carga el usuario para Flask-Login"""
-    return User.query.get(int(user_id))
\ No newline at end of file
+    """Carga el usuario para Flask-Login (desde caché si su versión en la BD coincide)"""
+    user_id = int(user_id)
+
+    cached = _user_cache.get(user_id)
+    if cached is not None:
+        # Consulta por clave primaria de una sola columna (los borrados no aparecen, ver app/deletion.py)
+        version = db.session.execute(select(User.version).where(User.id == user_id)).scalar()
+        if version == cached['version']:
+            # Se reconstruye la instancia y se adjunta a la sesión sin cargar la fila
+            user = User(**cached)
+            make_transient_to_detached(user)
+            return db.session.merge(user, load=False)
+
+    user = db.session.get(User, user_id)
+    if user is not None:
+        columns = {key: getattr(user, key) for key in _CACHED_COLUMNS}
+        _user_cache.set(user_id, columns, ttl=current_app.config['USER_CACHE_TTL'])
+    return user
\ No newline at end of file
@@ -0,0 +1,95 @@
+"""
+Hash y verificación de contraseñas
+
+El algoritmo y su coste se configuran en Config (PASSWORD_HASH_METHOD). Las
+verificaciones se ejecutan en un pool de hilos acotado: hashlib libera el GIL
+durante scrypt/pbkdf2, y el límite de peticiones en espera evita que una ráfaga
+de inicios de sesión sature la CPU de todos los workers. Si el pool está lleno
+se lanza PasswordCheckBusy en lugar de hacer esperar a la petición.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from functools import lru_cache
+
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordCheckBusy(Exception):
+    """Hay demasiadas verificaciones de contraseña en curso"""
+
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """Los hilos del pool no sobreviven a un fork: el hijo crea los suyos"""
+    global _executor, _slots, _lock
+    _executor = _slots = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_executor():
+    """Crea el pool y el semáforo la primera vez que se usan"""
+    global _executor, _slots
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                config = current_app.config
+                _slots = threading.BoundedSemaphore(config['PASSWORD_CHECK_MAX_PENDING'])
+                _executor = ThreadPoolExecutor(max_workers=config['PASSWORD_CHECK_WORKERS'],
+                                               thread_name_prefix='password-check')
+    return _executor, _slots
+
+
+def hash_password(password):
+    """Genera el hash con los parámetros configurados"""
+    config = current_app.config
+    return generate_password_hash(password, method=config['PASSWORD_HASH_METHOD'],
+                                  salt_length=config['PASSWORD_SALT_LENGTH'])
+
+
+@lru_cache(maxsize=8)
+def _full_method(method, salt_length):
+    """Prefijo completo que Werkzeug guarda para un método (p. ej. 'scrypt' -> 'scrypt:32768:8:1')"""
+    sample = generate_password_hash('', method=method, salt_length=salt_length)
+    return sample.split('$', 1)[0], len(sample.split('$')[1])
+
+
+def needs_rehash(password_hash):
+    """True si el hash se generó con otro algoritmo, coste o longitud de sal"""
+    if not password_hash or password_hash.count('$') < 2:
+        return True
+    config = current_app.config
+    method, salt_length = _full_method(config['PASSWORD_HASH_METHOD'], config['PASSWORD_SALT_LENGTH'])
+    stored_method, stored_salt, _ = password_hash.split('$', 2)
+    return stored_method != method or len(stored_salt) != salt_length
+
+
+def verify_password(password_hash, password):
+    """Verifica la contraseña en el pool acotado; lanza PasswordCheckBusy si está lleno"""
+    if not password_hash:
+        return False
+
+    executor, slots = _get_executor()
+    if not slots.acquire(blocking=False):
+        raise PasswordCheckBusy()
+    try:
+        future = executor.submit(check_password_hash, password_hash, password)
+    except Exception:
+        slots.release()
+        raise
+    # El hueco se libera cuando termina el cálculo, aunque la petición deje de esperar
+    future.add_done_callback(lambda _: slots.release())
+
+    try:
+        return future.result(timeout=current_app.config['PASSWORD_CHECK_TIMEOUT'])
+    except TimeoutError:
+        raise PasswordCheckBusy()
@@ -0,0 +1,187 @@
+"""
+Orden personalizado de las filas de /home por afinidad a categorías
+
+Cada usuario tiene un vector de afinidad (UserCategoryAffinity) que se actualiza
+de forma incremental al marcar vistos/favoritos; las lecturas (/home) nunca
+escriben. El historial que se escribe sin pasar por las vistas (generate_data)
+se vuelca con rebuild_affinities. El orden de películas y series
+se calcula con un producto escalar contra los vectores de categorías de cada
+título (precalculados por proceso) y se guarda en caché por usuario con TTL.
+"""
+
+from collections import defaultdict
+from functools import lru_cache
+
+from flask import current_app
+from sqlalchemy import func, literal, select, union_all
+
+from app import db
+from app.cache import TTLCache
+from app.models import Episode, UserCategoryAffinity, movie_categories, series_categories, movie_watched, \
+    movie_favorites, series_favorites, episode_watched
+
+# Peso de cada interacción en el vector de afinidad
+WATCH_WEIGHT = 1.0
+FAVORITE_WEIGHT = 2.0
+EPISODE_WEIGHT = 0.2  # Un episodio cuenta menos que una película completa
+
+# Caché de vectores del catálogo y de órdenes por usuario
+_catalog_cache = TTLCache(ttl=600, maxsize=2, name='personalization_catalog')
+_ranking_cache = TTLCache(ttl=300, maxsize=50000, name='personalization_ranking')
+
+_CATEGORY_TABLES = {
+    'movie': (movie_categories, movie_categories.c.movie_id),
+    'series': (series_categories, series_categories.c.series_id),
+}
+
+
+# ==================== VECTORES DE AFINIDAD ====================
+
+def _history_select(user_id=None):
+    """SELECT (user_id, category_id, peso) de todo el historial, o solo el de un usuario"""
+    episodes = Episode.__table__
+    parts = [
+        (movie_watched.c.user_id, select(movie_watched.c.user_id, movie_categories.c.category_id,
+                                         literal(WATCH_WEIGHT).label('weight'))
+         .join(movie_categories, movie_categories.c.movie_id == movie_watched.c.movie_id)),
+        (movie_favorites.c.user_id, select(movie_favorites.c.user_id, movie_categories.c.category_id,
+                                           literal(FAVORITE_WEIGHT).label('weight'))
+         .join(movie_categories, movie_categories.c.movie_id == movie_favorites.c.movie_id)),
+        (series_favorites.c.user_id, select(series_favorites.c.user_id, series_categories.c.category_id,
+                                            literal(FAVORITE_WEIGHT).label('weight'))
+         .join(series_categories, series_categories.c.series_id == series_favorites.c.series_id)),
+        (episode_watched.c.user_id, select(episode_watched.c.user_id, series_categories.c.category_id,
+                                           literal(EPISODE_WEIGHT).label('weight'))
+         .select_from(episode_watched)
+         .join(episodes, episodes.c.id == episode_watched.c.episode_id)
+         .join(series_categories, series_categories.c.series_id == episodes.c.series_id)),
+    ]
+    history = union_all(*(query if user_id is None else query.where(user_col == user_id)
+                          for user_col, query in parts)).subquery()
+    return (select(history.c.user_id, history.c.category_id, func.sum(history.c.weight))
+            .group_by(history.c.user_id, history.c.category_id))
+
+
+def rebuild_affinities(connection, user_id=None):
+    """Recalcula desde el historial los vectores de todos los usuarios (o de uno) en una sentencia
+
+    Para las filas de historial escritas sin pasar por record_interaction
+    (generate_data, migraciones).
+    """
+    table = UserCategoryAffinity.__table__
+    delete = table.delete()
+    connection.execute(delete if user_id is None else delete.where(table.c.user_id == user_id))
+    connection.execute(table.insert().from_select(['user_id', 'category_id', 'weight'], _history_select(user_id)))
+    if user_id is None:
+        _ranking_cache.clear()
+    else:
+        _ranking_cache.pop(user_id)
+
+
+def get_affinity(user_id):
+    """Vector de afinidad {category_id: peso}; vacío si el usuario no tiene historial con categorías
+
+    Solo lee: el vector se mantiene en las escrituras (record_interaction).
+    """
+    return dict(db.session.execute(
+        select(UserCategoryAffinity.category_id, UserCategoryAffinity.weight)
+        .where(UserCategoryAffinity.user_id == user_id)
+    ).all())
+
+
+def record_interaction(user_id, categories, delta):
+    """
+    Suma delta a la afinidad del usuario en las categorías de un título.
+    Llamar después de modificar la relación y antes del commit.
+    """
+    for category in categories:
+        row = db.session.get(UserCategoryAffinity, (user_id, category.id))
+        if row is None:
+            row = UserCategoryAffinity(user_id=user_id, category_id=category.id, weight=0.0)
+            db.session.add(row)
+        row.weight = max(0.0, row.weight + delta)
+
+    _ranking_cache.pop(user_id)
+
+
+# ==================== VECTORES DEL CATÁLOGO ====================
+
+@lru_cache(maxsize=None)
+def numpy_or_none():
+    """numpy es opcional (sin él se puntúa en Python puro); se importa al cargar el catálogo"""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _load_catalog():
+    """Lee las tablas de categorías y construye la matriz título x categoría"""
+    np = numpy_or_none()
+    catalog = {}
+    for item_type, (table, item_col) in _CATEGORY_TABLES.items():
+        item_categories = defaultdict(list)
+        for item_id, category_id in db.session.execute(select(item_col, table.c.category_id)):
+            item_categories[item_id].append(category_id)
+
+        ids = sorted(item_categories)
+        category_ids = sorted({c for cats in item_categories.values() for c in cats})
+        if np is not None:
+            column = {c: i for i, c in enumerate(category_ids)}
+            matrix = np.zeros((len(ids), len(category_ids)), dtype=np.float32)
+            for row, item_id in enumerate(ids):
+                matrix[row, [column[c] for c in item_categories[item_id]]] = 1.0
+        else:
+            matrix = [item_categories[item_id] for item_id in ids]
+        catalog[item_type] = (ids, category_ids, matrix)
+    return catalog
+
+
+def get_catalog():
+    """Matriz título x categoría en caché (se invalida al editar el catálogo)"""
+    catalog = _catalog_cache.get('catalog')
+    if catalog is None:
+        catalog = _load_catalog()
+        _catalog_cache.set('catalog', catalog, ttl=current_app.config['PERSONALIZATION_CATALOG_TTL'])
+    return catalog
+
+
+def invalidate_catalog():
+    """Invalida los vectores del catálogo y todos los órdenes personalizados"""
+    _catalog_cache.clear()
+    _ranking_cache.clear()
+
+
+# ==================== ORDENACIÓN ====================
+
+def _scores(item_type, affinity):
+    """Puntuación {item_id: score} de cada título con categorías"""
+    ids, category_ids, matrix = get_catalog()[item_type]
+    if not ids:
+        return {}
+
+    np = numpy_or_none()
+    if np is not None:
+        vector = np.array([affinity.get(c, 0.0) for c in category_ids], dtype=np.float32)
+        return dict(zip(ids, (matrix @ vector).tolist()))
+    return {item_id: sum(affinity.get(c, 0.0) for c in cats) for item_id, cats in zip(ids, matrix)}
+
+
+def get_ranking(user_id):
+    """Puntuación de cada título para el usuario: {'movie': {id: score}, 'series': {...}}"""
+    ranking = _ranking_cache.get(user_id)
+    if ranking is None:
+        affinity = get_affinity(user_id)
+        ranking = {item_type: _scores(item_type, affinity) for item_type in _CATEGORY_TABLES}
+        _ranking_cache.set(user_id, ranking, ttl=current_app.config['PERSONALIZATION_CACHE_TTL'])
+    return ranking
+
+
+def personalize(user, item_type, items):
+    """Ordena una lista de películas o series según la afinidad del usuario"""
+    scores = get_ranking(user.id)[item_type]
+    if not any(scores.values()):
+        return items
+    # sorted es estable: a igual puntuación se mantiene el orden original
+    return sorted(items, key=lambda item: scores.get(item.id, 0.0), reverse=True)
@@ -0,0 +1,271 @@
+"""
+Profiler de muestreo por petición
+
+Un hilo del proceso toma cada PROFILER_INTERVAL_MS la pila del hilo que atiende
+las peticiones perfiladas (sys._current_frames), sin instrumentar las llamadas:
+la petición apenas se ralentiza. Las pilas se guardan en formato "collapsed"
+(una línea "marco;marco;marco N"), el que usan flamegraph.pl y speedscope.
+
+- Bajo demanda: un administrador añade ?_profile=1 o la cabecera X-Profile: 1.
+  Se guardan <PROFILER_DIR>/<fecha>-<endpoint>-<pid>.folded y un .json con el
+  reparto entre SQL/ORM, plantillas y Python; la respuesta lleva las cabeceras
+  X-Profile-File y X-Profile-Summary.
+- Continuo: con PROFILER_SAMPLE_RATE = N se perfila 1 de cada N peticiones y
+  las pilas se acumulan en <PROFILER_DIR>/continuous-<pid>.folded.
+"""
+
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app, g, request
+from flask_login import current_user
+
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'X-Profile'
+
+CATEGORIES = ('sql', 'template', 'python')
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))).replace('\\', '/') + '/'
+
+_request_counter = itertools.count(1)
+_continuous = Counter()
+_continuous_lock = threading.Lock()
+_last_flush = 0.0
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+# ==================== MUESTREO ====================
+
+def _short_path(filename):
+    """Ruta desde site-packages (paquetes) o desde la raíz del proyecto"""
+    path = filename.replace('\\', '/')
+    if '/site-packages/' in path:
+        return path.rsplit('/site-packages/', 1)[1]
+    if path.startswith(_ROOT):
+        return path[len(_ROOT):]
+    return '/'.join(path.split('/')[-3:])
+
+
+class Sampler(threading.Thread):
+    """Hilo que muestrea las pilas de los hilos registrados"""
+
+    def __init__(self, interval):
+        super().__init__(name='carflix-profiler', daemon=True)
+        self.interval = interval
+        self._targets = {}  # id de hilo -> Counter de pilas
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._labels = {}  # objeto de código -> etiqueta
+        self._switch_interval = None
+
+    def add(self, thread_id):
+        with self._lock:
+            if not self._targets:
+                # El muestreador solo consigue el GIL cuando el hilo perfilado lo
+                # suelta: sin esto las muestras se concentran en las llamadas a
+                # SQLite (que sí lo sueltan) y el código Python queda oculto
+                self._switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(min(self._switch_interval, self.interval / 4))
+            self._targets[thread_id] = Counter()
+        self._wake.set()
+
+    def remove(self, thread_id):
+        with self._lock:
+            stacks = self._targets.pop(thread_id, Counter())
+            if not self._targets and self._switch_interval is not None:
+                sys.setswitchinterval(self._switch_interval)
+                self._switch_interval = None
+        return stacks
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f'{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})'
+        return label
+
+    def _stack(self, frame):
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        return ';'.join(reversed(labels))
+
+    def run(self):
+        while True:
+            if not self._targets:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, stacks in self._targets.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[self._stack(frame)] += 1
+
+
+def get_sampler(interval):
+    """Sampler del proceso (se arranca la primera vez)"""
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None or not _sampler.is_alive():
+            _sampler = Sampler(interval)
+            _sampler.start()
+    return _sampler
+
+
+# ==================== RESULTADOS ====================
+
+def classify(stack):
+    """'sql' si la muestra está dentro de SQLAlchemy, 'template' si está en Jinja, si no 'python'"""
+    if '(sqlalchemy/' in stack:
+        return 'sql'
+    if '(jinja2/' in stack or '.html:' in stack:
+        return 'template'
+    return 'python'
+
+
+def summarize(stacks, interval):
+    """Reparto de las muestras por categoría, en muestras, ms y porcentaje"""
+    counts = Counter()
+    for stack, n in stacks.items():
+        counts[classify(stack)] += n
+    total = sum(counts.values())
+    return {
+        'samples': total,
+        'interval_ms': interval * 1000,
+        'breakdown': {
+            category: {
+                'samples': counts[category],
+                'ms': round(counts[category] * interval * 1000, 1),
+                'percent': round(100 * counts[category] / total, 1) if total else 0.0,
+            }
+            for category in CATEGORIES
+        },
+    }
+
+
+def write_folded(path, stacks):
+    """Escribe las pilas en formato collapsed (escritura atómica)"""
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        for stack, n in stacks.most_common():
+            f.write(f'{stack} {n}\n')
+    os.replace(tmp, path)
+
+
+def _flush_continuous(directory):
+    with _continuous_lock:
+        stacks = Counter(_continuous)
+    if stacks:
+        write_folded(os.path.join(directory, f'continuous-{os.getpid()}.folded'), stacks)
+
+
+# ==================== MIDDLEWARE ====================
+
+def _requested():
+    """Perfilado bajo demanda: flag en la petición y usuario administrador"""
+    flag = request.args.get(PROFILE_PARAM) or request.headers.get(PROFILE_HEADER)
+    if flag not in ('1', 'true', 'yes'):
+        return False
+    return current_user.is_authenticated and current_user.is_admin
+
+
+def _before_request():
+    config = current_app.config
+    on_demand = _requested()
+    rate = config['PROFILER_SAMPLE_RATE']
+    continuous = bool(rate) and next(_request_counter) % rate == 0
+    if not (on_demand or continuous):
+        return
+
+    interval = config['PROFILER_INTERVAL_MS'] / 1000
+    get_sampler(interval).add(threading.get_ident())
+    g.profile = {'on_demand': on_demand, 'continuous': continuous, 'interval': interval,
+                 'start': time.perf_counter()}
+
+
+def _stop():
+    profile = g.pop('profile', None)
+    if profile is None:
+        return None, None
+    return profile, _sampler.remove(threading.get_ident())
+
+
+def on_demand():
+    """True si la petición en curso se perfila bajo demanda (el resultado va en cabeceras)"""
+    return bool(g.get('profile', {}).get('on_demand'))
+
+
+def _after_request(response):
+    if g.get('profile') is not None and g.get('streaming_template'):
+        g.profile_response = response  # Se sigue muestreando hasta que termine la plantilla
+        return response
+    _finish(response)
+    return response
+
+
+def _finish(response):
+    profile, stacks = _stop()
+    if profile is None:
+        return
+
+    global _last_flush
+    config = current_app.config
+    directory = config['PROFILER_DIR']
+    os.makedirs(directory, exist_ok=True)
+
+    if profile['continuous']:
+        with _continuous_lock:
+            _continuous.update(stacks)
+        now = time.monotonic()
+        if now - _last_flush >= config['PROFILER_FLUSH_INTERVAL']:
+            _last_flush = now
+            _flush_continuous(directory)
+
+    if profile['on_demand']:
+        summary = summarize(stacks, profile['interval'])
+        stats = g.get('query_stats')
+        summary.update({
+            'method': request.method,
+            'path': request.full_path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'wall_ms': round((time.perf_counter() - profile['start']) * 1000, 1),
+            'db_ms_measured': round(stats.total_time * 1000, 1) if stats else None,
+        })
+
+        name = f'{datetime.now():%Y%m%d-%H%M%S-%f}-{request.endpoint or "none"}-{os.getpid()}'
+        write_folded(os.path.join(directory, name + '.folded'), stacks)
+        with open(os.path.join(directory, name + '.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+
+        response.headers['X-Profile-File'] = name + '.folded'
+        response.headers['X-Profile-Summary'] = ' '.join(
+            f'{category}={summary["breakdown"][category]["percent"]}%' for category in CATEGORIES
+        ) + f' samples={summary["samples"]}'
+
+
+def _teardown_request(exception):
+    """Completa el perfil de las páginas de stream_page; si la petición falló, deja de muestrear el hilo"""
+    response = g.pop('profile_response', None)
+    if response is not None:
+        _finish(response)
+    _stop()
+
+
+def init_app(app):
+    """Registra el middleware del profiler"""
+    if not app.config['PROFILER_ENABLED']:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,97 @@
+"""
+Auditoría de planes de consulta (EXPLAIN QUERY PLAN de SQLite)
+
+KNOWN_QUERIES recoge las consultas que lanzan las rutas. La auditoría compila
+cada una contra la base de datos real y marca los recorridos completos (de
+tabla o de índice: "SCAN ...") y las ordenaciones en árbol temporal, salvo en
+las consultas que por naturaleza recorren toda la tabla (listados completos,
+búsquedas con LIKE '%...%').
+"""
+
+from sqlalchemy import select, func, text
+
+from app import db
+from app.models import User, Movie, Series, Episode, Category, ItemSimilarity, UserCategoryAffinity, \
+    movie_categories, series_categories, movie_favorites, series_favorites, movie_watched, episode_watched
+
+# Valores de ejemplo para los parámetros
+_ID = 1
+_TEXT = 'a'
+
+# (nombre, constructor de la consulta, recorrido completo esperado)
+KNOWN_QUERIES = [
+    ('login: usuario por email',
+     lambda: select(User).where(User.email == 'admin@carflix.com'), False),
+    ('load_user: usuario por id',
+     lambda: select(User).where(User.id == _ID), False),
+    ('load_user: versión del usuario',
+     lambda: select(User.version).where(User.id == _ID), False),
+    ('home: todas las películas',
+     lambda: select(Movie), True),
+    ('home: películas de una categoría',
+     lambda: select(Movie).join(movie_categories).where(movie_categories.c.category_id == _ID), False),
+    ('home: series de una categoría',
+     lambda: select(Series).join(series_categories).where(series_categories.c.category_id == _ID), False),
+    ('home: episodios de una serie (count)',
+     lambda: select(func.count()).select_from(Episode).where(Episode.series_id == _ID), False),
+    ('series_detail / admin_episodes: episodios ordenados',
+     lambda: select(Episode).where(Episode.series_id == _ID)
+     .order_by(Episode.season_number, Episode.episode_number), False),
+    ('películas vistas por el usuario',
+     lambda: select(Movie).join(movie_watched).where(movie_watched.c.user_id == _ID), False),
+    ('episodios vistos por el usuario',
+     lambda: select(Episode).join(episode_watched).where(episode_watched.c.user_id == _ID), False),
+    ('películas favoritas del usuario',
+     lambda: select(Movie).join(movie_favorites).where(movie_favorites.c.user_id == _ID), False),
+    ('series favoritas del usuario',
+     lambda: select(Series).join(series_favorites).where(series_favorites.c.user_id == _ID), False),
+    ('usuarios que vieron una película',
+     lambda: select(func.count()).select_from(movie_watched).where(movie_watched.c.movie_id == _ID), False),
+    ('usuarios que vieron un episodio',
+     lambda: select(func.count()).select_from(episode_watched).where(episode_watched.c.episode_id == _ID), False),
+    ('usuarios con una película en favoritos',
+     lambda: select(func.count()).select_from(movie_favorites).where(movie_favorites.c.movie_id == _ID), False),
+    ('último título visto por el usuario',
+     lambda: select(movie_watched.c.movie_id).where(movie_watched.c.user_id == _ID)
+     .order_by(movie_watched.c.watched_date.desc()).limit(1), False),
+    ('recomendaciones: vecinos de un título',
+     lambda: select(ItemSimilarity).where(ItemSimilarity.item_type == 'movie', ItemSimilarity.item_id == _ID)
+     .order_by(ItemSimilarity.rank), False),
+    ('afinidad del usuario',
+     lambda: select(UserCategoryAffinity).where(UserCategoryAffinity.user_id == _ID), False),
+    ('search: películas por título/descripción',
+     lambda: select(Movie).where(Movie.title.ilike(f'%{_TEXT}%') | Movie.description.ilike(f'%{_TEXT}%')), True),
+    ('search: categoría por nombre',
+     lambda: select(Category).where(Category.name.ilike(f'%{_TEXT}%')), True),
+    ('admin_stats: usuarios no administradores',
+     lambda: select(User).where(User.is_admin == False), True),  # noqa: E712
+]
+
+
+def explain(statement):
+    """Devuelve las líneas de EXPLAIN QUERY PLAN de una consulta"""
+    engine = db.engine
+    sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+    with engine.connect() as connection:
+        rows = connection.execute(text('EXPLAIN QUERY PLAN ' + sql)).all()
+    return [row[-1] for row in rows]
+
+
+def plan_problems(plan):
+    """Líneas del plan que indican un recorrido completo o una ordenación temporal"""
+    problems = []
+    for line in plan:
+        if line.startswith('SCAN'):
+            problems.append(line)
+        elif 'USE TEMP B-TREE' in line:
+            problems.append(line)
+    return problems
+
+
+def audit():
+    """Lista [(nombre, plan, problemas, esperado), ...] para todas las consultas conocidas"""
+    results = []
+    for name, build, full_scan_expected in KNOWN_QUERIES:
+        plan = explain(build())
+        results.append((name, plan, plan_problems(plan), full_scan_expected))
+    return results
@@ -0,0 +1,233 @@
+"""
+Motor de recomendaciones ítem a ítem ("Porque viste...")
+
+La construcción es offline (build_recommendations.py): se cargan las tablas de
+vistos y favoritos en una matriz dispersa usuario x título, se calcula la
+similitud coseno entre títulos y se guardan los K vecinos de cada uno en
+ItemSimilarity. En cada petición solo se consulta esa tabla por clave primaria.
+"""
+
+import heapq
+from collections import defaultdict
+from functools import lru_cache
+
+from flask import current_app
+from sqlalchemy import select
+
+from app import db
+from app.models import Movie, Series, Episode, ItemSimilarity, movie_watched, episode_watched, \
+    movie_favorites, series_favorites
+
+# Peso de cada señal en la matriz usuario x título
+WATCH_WEIGHT = 1.0
+FAVORITE_WEIGHT = 2.0
+
+# Filas de la matriz de similitud que se calculan a la vez con scipy
+BLOCK_SIZE = 2048
+
+
+# ==================== CONSTRUCCIÓN ====================
+
+def load_interactions():
+    """Carga vistos y favoritos como {user_id: {(tipo, id): peso}}"""
+    user_items = defaultdict(dict)
+
+    def add(rows, item_type, weight):
+        for user_id, item_id in rows:
+            items = user_items[user_id]
+            key = (item_type, item_id)
+            items[key] = items.get(key, 0.0) + weight
+
+    add(db.session.execute(select(movie_watched.c.user_id, movie_watched.c.movie_id)), 'movie', WATCH_WEIGHT)
+    add(db.session.execute(select(movie_favorites.c.user_id, movie_favorites.c.movie_id)), 'movie', FAVORITE_WEIGHT)
+    add(db.session.execute(select(series_favorites.c.user_id, series_favorites.c.series_id)), 'series',
+        FAVORITE_WEIGHT)
+
+    # Los episodios vistos cuentan una sola vez por serie
+    episodes = select(episode_watched.c.user_id, Episode.series_id) \
+        .join(Episode, Episode.id == episode_watched.c.episode_id).distinct()
+    add(db.session.execute(episodes), 'series', WATCH_WEIGHT)
+
+    return user_items
+
+
+def _cap_history(user_items, max_items):
+    """Recorta el historial de los usuarios muy activos (coste cuadrático por usuario)"""
+    for user_id, items in user_items.items():
+        if len(items) > max_items:
+            kept = heapq.nlargest(max_items, items.items(), key=lambda kv: (kv[1], kv[0]))
+            user_items[user_id] = dict(kept)
+    return user_items
+
+
+def _neighbors_python(user_items, top_k):
+    """Similitud coseno con diccionarios dispersos (sin dependencias)"""
+    norms = defaultdict(float)
+    dots = defaultdict(lambda: defaultdict(float))
+
+    for items in user_items.values():
+        pairs = list(items.items())
+        for i, (a, wa) in enumerate(pairs):
+            norms[a] += wa * wa
+            row_a = dots[a]
+            for b, wb in pairs[i + 1:]:
+                product = wa * wb
+                row_a[b] += product
+                dots[b][a] += product
+
+    neighbors = {}
+    for item, row in dots.items():
+        norm_a = norms[item] ** 0.5
+        scored = ((other, dot / (norm_a * norms[other] ** 0.5)) for other, dot in row.items())
+        neighbors[item] = heapq.nlargest(top_k, scored, key=lambda kv: (kv[1], kv[0]))
+    return neighbors
+
+
+@lru_cache(maxsize=None)
+def scientific():
+    """(numpy, scipy.sparse) o (None, None)
+
+    Son opcionales (sin ellos se usa Python puro) y solo hacen falta al
+    construir, así que no se importan al arrancar la app.
+    """
+    try:
+        import numpy
+        from scipy import sparse
+    except ImportError:
+        return None, None
+    return numpy, sparse
+
+
+def _neighbors_scipy(user_items, top_k):
+    """Similitud coseno vectorizada: X^T X por bloques de filas con matrices CSR"""
+    np, sparse = scientific()
+    index = {}
+    rows, cols, data = [], [], []
+    for row, items in enumerate(user_items.values()):
+        for item, weight in items.items():
+            rows.append(row)
+            cols.append(index.setdefault(item, len(index)))
+            data.append(weight)
+
+    keys = list(index)
+    X = sparse.csr_matrix((data, (rows, cols)), shape=(len(user_items), len(keys)), dtype=np.float64)
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=0)).ravel())
+    norms[norms == 0] = 1.0
+    Xn = (X @ sparse.diags(1.0 / norms)).tocsc()
+    XnT = Xn.T.tocsr()
+
+    neighbors = {}
+    for start in range(0, len(keys), BLOCK_SIZE):
+        block = (XnT[start:start + BLOCK_SIZE] @ Xn).tocsr()
+        for offset in range(block.shape[0]):
+            item = start + offset
+            lo, hi = block.indptr[offset], block.indptr[offset + 1]
+            cand, scores = block.indices[lo:hi], block.data[lo:hi]
+            mask = cand != item
+            cand, scores = cand[mask], scores[mask]
+            if len(cand) > top_k:
+                top = np.argpartition(-scores, top_k)[:top_k]
+                cand, scores = cand[top], scores[top]
+            order = np.argsort(-scores, kind='stable')
+            neighbors[keys[item]] = [(keys[c], float(s)) for c, s in zip(cand[order], scores[order])]
+    return neighbors
+
+
+def compute_neighbors(user_items, top_k):
+    """Devuelve {(tipo, id): [((tipo, id), score), ...]} con los top_k vecinos"""
+    if scientific()[1] is not None:
+        return _neighbors_scipy(user_items, top_k)
+    return _neighbors_python(user_items, top_k)
+
+
+def build_recommendations(top_k=None):
+    """Reconstruye la tabla ItemSimilarity completa en una sola transacción"""
+    top_k = top_k or current_app.config['RECOMMENDATIONS_TOP_K']
+    user_items = _cap_history(load_interactions(), current_app.config['RECOMMENDATIONS_MAX_USER_ITEMS'])
+    neighbors = compute_neighbors(user_items, top_k)
+
+    rows = []
+    for (item_type, item_id), items in neighbors.items():
+        for rank, ((neighbor_type, neighbor_id), score) in enumerate(items):
+            rows.append({
+                'item_type': item_type,
+                'item_id': item_id,
+                'rank': rank,
+                'neighbor_type': neighbor_type,
+                'neighbor_id': neighbor_id,
+                'score': score
+            })
+
+    table = ItemSimilarity.__table__
+    db.session.execute(table.delete())
+    if rows:
+        db.session.execute(table.insert(), rows)
+    db.session.commit()
+    return len(rows)
+
+
+# ==================== CONSULTA ====================
+
+def load_items(keys):
+    """Convierte [(tipo, id), ...] en [(tipo, Movie/Series), ...] respetando el orden"""
+    ids = {'movie': [], 'series': []}
+    for item_type, item_id in keys:
+        ids[item_type].append(item_id)
+
+    found = {}
+    if ids['movie']:
+        found.update((('movie', m.id), m) for m in Movie.query.filter(Movie.id.in_(ids['movie'])))
+    if ids['series']:
+        found.update((('series', s.id), s) for s in Series.query.filter(Series.id.in_(ids['series'])))
+    return [(key[0], found[key]) for key in keys if key in found]
+
+
+def get_similar(item_type, item_id, limit=6):
+    """Títulos similares a uno dado como [(tipo, objeto), ...] (consulta por clave primaria)"""
+    rows = db.session.execute(
+        select(ItemSimilarity.neighbor_type, ItemSimilarity.neighbor_id)
+        .where(ItemSimilarity.item_type == item_type, ItemSimilarity.item_id == item_id)
+        .order_by(ItemSimilarity.rank)
+        .limit(limit)
+    ).all()
+    return load_items([(t, i) for t, i in rows])
+
+
+def last_watched(user):
+    """Último título visto por el usuario como (tipo, id), o None"""
+    movie = db.session.execute(
+        select(movie_watched.c.movie_id, movie_watched.c.watched_date)
+        .where(movie_watched.c.user_id == user.id)
+        .order_by(movie_watched.c.watched_date.desc())
+        .limit(1)
+    ).first()
+    episode = db.session.execute(
+        select(Episode.series_id, episode_watched.c.watched_date)
+        .join(Episode, Episode.id == episode_watched.c.episode_id)
+        .where(episode_watched.c.user_id == user.id)
+        .order_by(episode_watched.c.watched_date.desc())
+        .limit(1)
+    ).first()
+
+    candidates = []
+    if movie:
+        candidates.append((movie.watched_date, ('movie', movie.movie_id)))
+    if episode:
+        candidates.append((episode.watched_date, ('series', episode.series_id)))
+    if not candidates:
+        return None
+    return max(candidates, key=lambda c: c[0])[1]
+
+
+def because_you_watched(user, limit=12):
+    """Devuelve (título semilla, recomendaciones) para la fila "Porque viste..." de /home"""
+    seed = last_watched(user)
+    if seed is None:
+        return None, []
+
+    recommendations = get_similar(seed[0], seed[1], limit)
+    if not recommendations:
+        return None, []
+
+    seed_items = load_items([seed])
+    return (seed_items[0][1] if seed_items else None), recommendations
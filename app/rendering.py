@@ -0,0 +1,66 @@
+"""
+Renderizado de plantillas por partes
+
+stream_page() envía la página mientras Jinja la va generando en lugar de
+construirla entera en memoria. Las plantillas marcan con {{ flush() }} los
+puntos donde conviene enviar lo que hay aunque sea poco (tras el <head>, para
+que el navegador empiece a pedir el CSS, y tras el banner de /home); entre
+marcas se envía cada STREAM_FLUSH_BYTES.
+
+Las cabeceras salen antes de renderizar, así que todo lo que toque la sesión
+(mensajes flash, token CSRF) se resuelve antes de empezar. Los hooks de
+instrumentation, metrics y profiler registran estas páginas al terminar el
+envío (teardown_request), con las consultas y el tiempo de la plantilla. Si hay
+que devolver resultados en cabeceras (X-Query-* o ?_profile=1) la página se
+renderiza entera, como render_template.
+"""
+
+from flask import Response, current_app, g, get_flashed_messages, render_template, stream_template
+from flask_wtf.csrf import generate_csrf
+from markupsafe import Markup
+
+from app import instrumentation, profiler
+
+FLUSH_MARKER = '<!--carflix:flush-->'
+
+
+def flush():
+    """Punto de envío para plantillas; fuera de stream_page no escribe nada"""
+    return Markup(FLUSH_MARKER) if g.get('streaming_template') else ''
+
+
+def _chunks(pieces, size):
+    """Agrupa los trozos de Jinja en bloques de `size` caracteres, cortando en las marcas"""
+    buffer, length = [], 0
+    for piece in pieces:
+        while FLUSH_MARKER in piece:
+            before, piece = piece.split(FLUSH_MARKER, 1)
+            buffer.append(before)
+            chunk = ''.join(buffer)
+            if chunk:
+                yield chunk
+            buffer, length = [], 0
+        buffer.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    chunk = ''.join(buffer)
+    if chunk:
+        yield chunk
+
+
+def stream_page(template_name, **context):
+    """Como render_template, pero la respuesta se envía a medida que se renderiza"""
+    if instrumentation.headers_enabled() or profiler.on_demand():
+        return render_template(template_name, **context)
+    # La cookie de sesión va en las cabeceras: hay que tocar la sesión ahora
+    get_flashed_messages()
+    generate_csrf()
+    g.streaming_template = True
+    pieces = stream_template(template_name, **context)
+    return Response(_chunks(pieces, current_app.config['STREAM_FLUSH_BYTES']), mimetype='text/html')
+
+
+def init_app(app):
+    app.add_template_global(flush)
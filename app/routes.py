@@ -1,13 +1,29 @@
 import os
-from flask import render_template, redirect, url_for, flash, request, current_app, send_from_directory
+from flask import render_template, redirect, url_for, flash, request, current_app, send_from_directory, abort, \
+    Response
 from flask_login import login_user, logout_user, current_user, login_required
 from werkzeug.utils import secure_filename
 from functools import wraps
 from app import db
-from app.models import User, Movie, Series, Episode, Category
+from app.models import User, Movie, Series, Episode, Category, invalidate_user_cache, movie_categories, \
+    series_categories, MediaCheck
+from app.passwords import PasswordCheckBusy
+from app.recommendations import get_similar, because_you_watched
+from app import personalization
+from app import trending
+from app import slow_queries
+from app import metrics
+from app import counters
+from app import catalog_import
+from app import deletion
+from app import media_check
+from app.rendering import stream_page
+from app.listing import paginate
 from app.forms import LoginForm, RegistrationForm, MovieForm, SeriesForm, EpisodeForm, CategoryForm, SearchForm, \
-    ProfileForm, ChangePasswordForm, AdminUserForm
+    ProfileForm, ChangePasswordForm, AdminUserForm, CatalogImportForm
 from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.orm import undefer
 
 # Obtener la instancia de la app
 from flask import current_app as app
@@ -71,11 +87,22 @@ def login():
 
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data).first()
-        if user is None or not user.check_password(form.password.data):
+        user = User.query.options(undefer(User.password_hash)).filter_by(email=form.email.data).first()
+        try:
+            valid = user is not None and user.check_password(form.password.data)
+        except PasswordCheckBusy:
+            flash('Hay muchos inicios de sesión en curso, inténtalo de nuevo en unos segundos', 'warning')
+            return render_template('login.html', form=form), 503
+
+        if not valid:
             flash('Email o contraseña incorrectos', 'danger')
             return redirect(url_for('login'))
 
+        # Regenerar el hash si cambiaron los parámetros en Config
+        if user.password_needs_rehash():
+            user.set_password(form.password.data)
+            db.session.commit()
+
         login_user(user, remember=form.remember_me.data)
         next_page = request.args.get('next')
         if not next_page or not next_page.startswith('/'):
@@ -121,11 +148,15 @@ def logout():
 @login_required
 def home():
     """Página principal del usuario"""
-    movies = Movie.query.all()
-    series = Series.query.all()
+    movies = personalization.personalize(current_user, 'movie', Movie.query.all())
+    series = personalization.personalize(current_user, 'series', Series.query.all())
     categories = Category.query.all()
+    because_seed, because_items = because_you_watched(current_user)
+    trending_items = trending.trending('24h', 12)
 
-    return render_template('home.html', movies=movies, series=series, categories=categories)
+    return stream_page('home.html', movies=movies, series=series, categories=categories,
+                       because_seed=because_seed, because_items=because_items,
+                       trending_items=trending_items)
 
 
 @app.route('/movie/<int:movie_id>')
@@ -135,8 +166,10 @@ def movie_detail(movie_id):
     movie = Movie.query.get_or_404(movie_id)
     is_favorite = movie in current_user.favorite_movies
     is_watched = movie in current_user.watched_movies
+    similar = get_similar('movie', movie.id)
 
-    return render_template('movie_detail.html', movie=movie, is_favorite=is_favorite, is_watched=is_watched)
+    return render_template('movie_detail.html', movie=movie, is_favorite=is_favorite, is_watched=is_watched,
+                           similar=similar)
 
 
 @app.route('/series/<int:series_id>')
@@ -157,7 +190,10 @@ def series_detail(series_id):
     for season in seasons:
         seasons[season].sort(key=lambda x: x.episode_number)
 
-    return render_template('series_detail.html', series=series, seasons=seasons, is_favorite=is_favorite)
+    similar = get_similar('series', series.id)
+
+    return render_template('series_detail.html', series=series, seasons=seasons, is_favorite=is_favorite,
+                           similar=similar)
 
 
 @app.route('/search', methods=['GET', 'POST'])
@@ -221,11 +257,14 @@ def toggle_favorite_movie(movie_id):
 
     if movie in current_user.favorite_movies:
         current_user.favorite_movies.remove(movie)
+        delta = -personalization.FAVORITE_WEIGHT
         flash(f'"{movie.title}" eliminada de tu lista', 'info')
     else:
         current_user.favorite_movies.append(movie)
+        delta = personalization.FAVORITE_WEIGHT
         flash(f'"{movie.title}" añadida a tu lista', 'success')
 
+    personalization.record_interaction(current_user.id, movie.categories, delta)
     db.session.commit()
     return redirect(request.referrer or url_for('home'))
 
@@ -238,11 +277,14 @@ def toggle_favorite_series(series_id):
 
     if series in current_user.favorite_series:
         current_user.favorite_series.remove(series)
+        delta = -personalization.FAVORITE_WEIGHT
         flash(f'"{series.title}" eliminada de tu lista', 'info')
     else:
         current_user.favorite_series.append(series)
+        delta = personalization.FAVORITE_WEIGHT
         flash(f'"{series.title}" añadida a tu lista', 'success')
 
+    personalization.record_interaction(current_user.id, series.categories, delta)
     db.session.commit()
     return redirect(request.referrer or url_for('home'))
 
@@ -255,12 +297,17 @@ def toggle_watched_movie(movie_id):
 
     if movie in current_user.watched_movies:
         current_user.watched_movies.remove(movie)
+        delta = -personalization.WATCH_WEIGHT
         flash(f'"{movie.title}" marcada como no vista', 'info')
     else:
         current_user.watched_movies.append(movie)
+        delta = personalization.WATCH_WEIGHT
         flash(f'"{movie.title}" marcada como vista', 'success')
 
+    personalization.record_interaction(current_user.id, movie.categories, delta)
     db.session.commit()
+    if delta > 0:
+        trending.record_watch('movie', movie.id)
     return redirect(request.referrer or url_for('home'))
 
 
@@ -272,15 +319,35 @@ def toggle_watched_episode(episode_id):
 
     if episode in current_user.watched_episodes:
         current_user.watched_episodes.remove(episode)
+        delta = -personalization.EPISODE_WEIGHT
         flash(f'Episodio marcado como no visto', 'info')
     else:
         current_user.watched_episodes.append(episode)
+        delta = personalization.EPISODE_WEIGHT
         flash(f'Episodio marcado como visto', 'success')
 
+    personalization.record_interaction(current_user.id, episode.series.categories, delta)
     db.session.commit()
+    if delta > 0:
+        trending.record_watch('series', episode.series_id)
     return redirect(request.referrer or url_for('series_detail', series_id=episode.series_id))
 
 
+@app.route('/heartbeat/<item_type>/<int:item_id>', methods=['POST'])
+@login_required
+def playback_heartbeat(item_type, item_id):
+    """Señal periódica del reproductor para las tendencias"""
+    if item_type not in ('movie', 'series'):
+        abort(404)
+    if not trending.allow_heartbeat(current_user.id):
+        return '', 429
+    if not trending.known_item(item_type, item_id):
+        abort(404)
+
+    trending.record_heartbeat(item_type, item_id)
+    return '', 204
+
+
 # ==================== PERFIL DE USUARIO ====================
 
 @app.route('/profile', methods=['GET', 'POST'])
@@ -313,6 +380,7 @@ def profile():
             if profile_pic:
                 current_user.profile_picture = profile_pic
 
+        invalidate_user_cache(current_user)
         db.session.commit()
         flash('Perfil actualizado correctamente', 'success')
         return redirect(url_for('profile'))
@@ -327,11 +395,18 @@ def change_password():
     form = ChangePasswordForm()
 
     if form.validate_on_submit():
-        if not current_user.check_password(form.current_password.data):
+        try:
+            valid = current_user.check_password(form.current_password.data)
+        except PasswordCheckBusy:
+            flash('El servidor está ocupado, inténtalo de nuevo en unos segundos', 'warning')
+            return redirect(url_for('change_password'))
+
+        if not valid:
             flash('La contraseña actual es incorrecta', 'danger')
             return redirect(url_for('change_password'))
 
         current_user.set_password(form.new_password.data)
+        invalidate_user_cache(current_user)
         db.session.commit()
 
         flash('Contraseña cambiada correctamente', 'success')
@@ -355,9 +430,8 @@ def delete_account():
             return redirect(url_for('profile'))
 
     logout_user()
-    user = User.query.get(user_id)
-    db.session.delete(user)
-    db.session.commit()
+    # Se marca ahora; historial, favoritos y foto se purgan en segundo plano
+    deletion.delete_user(User.query.get(user_id))
 
     flash(f'Cuenta de {username} eliminada correctamente', 'info')
     return redirect(url_for('index'))
@@ -521,6 +595,13 @@ def admin_stats():
             series.watch_count = count
             popular_series.append(series)
 
+    # Tendencias por ventana de tiempo
+    trending_windows = [
+        ('Última hora', trending.trending('1h', 5)),
+        ('Últimas 24 horas', trending.trending('24h', 5)),
+        ('Últimos 7 días', trending.trending('7d', 5)),
+    ]
+
     global_stats = {
         'total_users': len(users),
         'total_hours': total_time // 60,
@@ -532,7 +613,31 @@ def admin_stats():
                            global_stats=global_stats,
                            user_stats=user_stats,
                            popular_movies=popular_movies,
-                           popular_series=popular_series)
+                           popular_series=popular_series,
+                           trending_windows=trending_windows)
+
+
+@app.route('/admin/slow-queries')
+@login_required
+@admin_required
+def admin_slow_queries():
+    """Consultas lentas agrupadas por forma, ordenadas por tiempo total"""
+    path = current_app.config['SLOW_QUERY_DB']
+    offenders = slow_queries.top_offenders(path) if path else []
+    return render_template('admin/slow_queries.html', offenders=offenders,
+                           threshold=current_app.config['SLOW_QUERY_THRESHOLD_MS'])
+
+
+@app.route('/admin/slow-queries/reset', methods=['POST'])
+@login_required
+@admin_required
+def admin_reset_slow_queries():
+    """Vacía el registro de consultas lentas"""
+    path = current_app.config['SLOW_QUERY_DB']
+    if path:
+        slow_queries.reset(path)
+    flash('Registro de consultas lentas vaciado', 'success')
+    return redirect(url_for('admin_slow_queries'))
 
 
 # ==================== STREAMING DE VIDEO ====================
@@ -552,17 +657,11 @@ def serve_video(filename):
 def admin_dashboard():
     """Panel de administración"""
     try:
-        stats = {
-            'users': User.query.count(),
-            'movies': Movie.query.count(),
-            'series': Series.query.count(),
-            'episodes': Episode.query.count(),
-            'categories': Category.query.count()
-        }
-        print(f"DEBUG: Stats = {stats}")  # Debug
+        stats = counters.get_counts()
+        current_app.logger.debug('Estadísticas del panel: %s', stats)
         return render_template('admin/dashboard.html', stats=stats)
     except Exception as e:
-        print(f"ERROR en admin_dashboard: {e}")  # Debug
+        current_app.logger.exception('Error en admin_dashboard')
         flash(f'Error en el panel de administración: {str(e)}', 'danger')
         return redirect(url_for('home'))
 
@@ -574,8 +673,13 @@ def admin_dashboard():
 @admin_required
 def admin_users():
     """Lista de usuarios"""
-    users = User.query.all()
-    return render_template('admin/users.html', users=users)
+    role = request.args.get('role')
+    filters = {'role': (role, User.is_admin.is_(role == 'admin'))} if role in ('admin', 'user') else {}
+    page = paginate(User.query, User,
+                    sorts={'id': User.id, 'username': User.username, 'email': User.email,
+                           'created_at': User.created_at},
+                    default_sort='id', search_columns=(User.username, User.email), filters=filters)
+    return stream_page('admin/users.html', users=page.items, page=page)
 
 
 @app.route('/admin/user/add', methods=['GET', 'POST'])
@@ -650,6 +754,7 @@ def admin_edit_user(user_id):
         if form.password.data:
             user.set_password(form.password.data)
 
+        invalidate_user_cache(user)
         db.session.commit()
         flash(f'Usuario "{user.username}" actualizado correctamente', 'success')
         return redirect(url_for('admin_users'))
@@ -667,9 +772,9 @@ def admin_delete_user(user_id):
         return redirect(url_for('admin_users'))
 
     user = User.query.get_or_404(user_id)
-    db.session.delete(user)
-    db.session.commit()
-    flash(f'Usuario "{user.username}" eliminado correctamente', 'success')
+    username = user.username
+    deletion.delete_user(user)
+    flash(f'Usuario "{username}" eliminado correctamente', 'success')
     return redirect(url_for('admin_users'))
 
 
@@ -684,6 +789,7 @@ def admin_toggle_admin(user_id):
 
     user = User.query.get_or_404(user_id)
     user.is_admin = not user.is_admin
+    invalidate_user_cache(user)
     db.session.commit()
 
     status = "administrador" if user.is_admin else "usuario normal"
@@ -698,8 +804,10 @@ def admin_toggle_admin(user_id):
 @admin_required
 def admin_movies():
     """Lista de películas"""
-    movies = Movie.query.all()
-    return render_template('admin/movies.html', movies=movies)
+    page = paginate(Movie.query, Movie,
+                    sorts={'id': Movie.id, 'title': Movie.title, 'created_at': Movie.created_at},
+                    default_sort='id', search_columns=(Movie.title,))
+    return stream_page('admin/movies.html', movies=page.items, page=page)
 
 
 @app.route('/admin/movie/add', methods=['GET', 'POST'])
@@ -747,6 +855,7 @@ def admin_add_movie():
 
         db.session.add(movie)
         db.session.commit()
+        personalization.invalidate_catalog()
 
         flash(f'Película "{movie.title}" añadida correctamente', 'success')
         return redirect(url_for('admin_movies'))
@@ -794,6 +903,7 @@ def admin_edit_movie(movie_id):
                 movie.categories.append(category)
 
         db.session.commit()
+        personalization.invalidate_catalog()
         flash(f'Película "{movie.title}" actualizada correctamente', 'success')
         return redirect(url_for('admin_movies'))
 
@@ -808,6 +918,7 @@ def admin_delete_movie(movie_id):
     movie = Movie.query.get_or_404(movie_id)
     db.session.delete(movie)
     db.session.commit()
+    personalization.invalidate_catalog()
     flash(f'Película "{movie.title}" eliminada correctamente', 'success')
     return redirect(url_for('admin_movies'))
 
@@ -819,8 +930,10 @@ def admin_delete_movie(movie_id):
 @admin_required
 def admin_series():
     """Lista de series"""
-    series = Series.query.all()
-    return render_template('admin/series.html', series=series)
+    page = paginate(Series.query, Series,
+                    sorts={'id': Series.id, 'title': Series.title, 'created_at': Series.created_at},
+                    default_sort='id', search_columns=(Series.title,))
+    return stream_page('admin/series.html', series=page.items, page=page)
 
 
 @app.route('/admin/series/add', methods=['GET', 'POST'])
@@ -854,6 +967,7 @@ def admin_add_series():
 
         db.session.add(series)
         db.session.commit()
+        personalization.invalidate_catalog()
 
         flash(f'Serie "{series.title}" añadida correctamente', 'success')
         return redirect(url_for('admin_series'))
@@ -894,6 +1008,7 @@ def admin_edit_series(series_id):
                 series.categories.append(category)
 
         db.session.commit()
+        personalization.invalidate_catalog()
         flash(f'Serie "{series.title}" actualizada correctamente', 'success')
         return redirect(url_for('admin_series'))
 
@@ -906,8 +1021,7 @@ def admin_edit_series(series_id):
 def admin_delete_series(series_id):
     """Eliminar serie"""
     series = Series.query.get_or_404(series_id)
-    db.session.delete(series)
-    db.session.commit()
+    deletion.delete_series(series)
     flash(f'Serie "{series.title}" eliminada correctamente', 'success')
     return redirect(url_for('admin_series'))
 
@@ -982,6 +1096,82 @@ def admin_delete_episode(episode_id):
     return redirect(url_for('admin_episodes', series_id=series_id))
 
 
+# ==================== ADMIN: IMPORTACIÓN ====================
+
+@app.route('/admin/import', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def admin_import():
+    """Importación masiva de películas, series y episodios desde un manifiesto"""
+    form = CatalogImportForm()
+    results, errors = None, []
+
+    if form.validate_on_submit():
+        upload = form.manifest.data
+        try:
+            manifest = catalog_import.parse(upload.read(), upload.filename)
+            results = catalog_import.run(manifest, check_media=not form.skip_media_check.data,
+                                         dry_run=form.dry_run.data)
+        except catalog_import.ManifestError as e:
+            errors = e.errors
+            flash(f'{len(errors)} errores en el manifiesto: no se ha importado nada', 'danger')
+        else:
+            created = sum(result.created for result in results.values())
+            if form.dry_run.data:
+                flash(f'Simulación correcta: se crearían {created} elementos', 'info')
+            else:
+                flash(f'Importación completada: {created} elementos nuevos', 'success')
+
+    return render_template('admin/import.html', form=form, results=results, errors=errors,
+                           dry_run=form.dry_run.data)
+
+
+# ==================== ADMIN: FICHEROS ====================
+
+@app.route('/admin/media')
+@login_required
+@admin_required
+def admin_media():
+    """Ficheros referenciados que faltan, están vacíos o no son válidos"""
+    status = request.args.get('status')
+    filters = {'status': (status, MediaCheck.status == status)} if status in ('missing', 'empty', 'invalid') else {}
+    page = paginate(MediaCheck.query.filter(MediaCheck.status != 'ok'), MediaCheck,
+                    sorts={'id': MediaCheck.id, 'path': MediaCheck.path},
+                    default_sort='id', search_columns=(MediaCheck.path,), filters=filters)
+    counts, last_check = media_check.summary()
+
+    # Enlace a la ficha de cada elemento; los episodios se editan desde su serie
+    episode_ids = [check.item_id for check in page.items if check.item_type == 'episode']
+    episode_series = dict(db.session.execute(
+        db.select(Episode.id, Episode.series_id).where(Episode.id.in_(episode_ids))).all()) if episode_ids else {}
+    links = {}
+    for check in page.items:
+        if check.item_type == 'movie':
+            links[check.id] = url_for('admin_edit_movie', movie_id=check.item_id)
+        elif check.item_type == 'series':
+            links[check.id] = url_for('admin_edit_series', series_id=check.item_id)
+        elif check.item_type == 'user':
+            links[check.id] = url_for('admin_edit_user', user_id=check.item_id)
+        elif check.item_id in episode_series:
+            links[check.id] = url_for('admin_episodes', series_id=episode_series[check.item_id])
+
+    return render_template('admin/media.html', checks=page.items, page=page, links=links, counts=counts,
+                           last_check=last_check, running=media_check.running())
+
+
+@app.route('/admin/media/check', methods=['POST'])
+@login_required
+@admin_required
+def admin_media_check():
+    """Lanza la comprobación de ficheros en segundo plano"""
+    full = request.form.get('full') == '1'
+    if media_check.start(current_app._get_current_object(), full=full):
+        flash('Comprobación de ficheros iniciada; recarga la página en unos segundos', 'info')
+    else:
+        flash('Ya hay una comprobación de ficheros en marcha', 'warning')
+    return redirect(url_for('admin_media'))
+
+
 # ==================== ADMIN: CATEGORÍAS ====================
 
 @app.route('/admin/categories', methods=['GET', 'POST'])
@@ -990,7 +1180,6 @@ def admin_delete_episode(episode_id):
 def admin_categories():
     """Gestionar categorías"""
     form = CategoryForm()
-    categories = Category.query.all()
 
     if form.validate_on_submit():
         category = Category(name=form.name.data)
@@ -999,7 +1188,20 @@ def admin_categories():
         flash(f'Categoría "{category.name}" añadida correctamente', 'success')
         return redirect(url_for('admin_categories'))
 
-    return render_template('admin/categories.html', form=form, categories=categories)
+    page = paginate(Category.query, Category, sorts={'id': Category.id, 'name': Category.name},
+                    default_sort='name', search_columns=(Category.name,))
+
+    # Contenidos por categoría de la página, con una consulta agrupada por tabla
+    ids = [category.id for category in page.items]
+    content_counts = dict.fromkeys(ids, 0)
+    for table in (movie_categories, series_categories):
+        rows = db.session.query(table.c.category_id, func.count()).filter(table.c.category_id.in_(ids)) \
+            .group_by(table.c.category_id)
+        for category_id, count in rows:
+            content_counts[category_id] += count
+
+    return render_template('admin/categories.html', form=form, categories=page.items, page=page,
+                           content_counts=content_counts)
 
 
 @app.route('/admin/category/delete/<int:category_id>')
@@ -1010,5 +1212,21 @@ def admin_delete_category(category_id):
     category = Category.query.get_or_404(category_id)
     db.session.delete(category)
     db.session.commit()
+    personalization.invalidate_catalog()
     flash(f'Categoría "{category.name}" eliminada correctamente', 'success')
-    return redirect(url_for('admin_categories'))
\ No newline at end of file
+    return redirect(url_for('admin_categories'))
+
+
+# ==================== MÉTRICAS ====================
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Métricas en formato de texto de Prometheus"""
+    config = current_app.config
+    if not config['METRICS_ENABLED']:
+        abort(404)
+    token = config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    samples = metrics.collect(config['METRICS_MULTIPROC_DIR'])
+    return Response(metrics.render(samples), mimetype='text/plain; version=0.0.4; charset=utf-8')
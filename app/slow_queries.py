@@ -0,0 +1,221 @@
+"""
+Registro de consultas lentas
+
+Se engancha a instrumentation.STATEMENT_HOOKS: toda sentencia que tarda más de
+SLOW_QUERY_THRESHOLD_MS se registra con sus parámetros (los que parecen
+secretos se ocultan), la ruta que la lanzó y el EXPLAIN QUERY PLAN de SQLite.
+
+- Cada consulta lenta se escribe como línea JSON en el logger 'carflix.sql.slow'
+  (y en un fichero rotativo si SLOW_QUERY_LOG_FILE está definido).
+- Las consultas se agregan por forma (ver instrumentation.statement_shape) en
+  una base de datos SQLite aparte (SLOW_QUERY_DB). No se usa la base de datos
+  principal porque el registro ocurre en mitad de otra sentencia, posiblemente
+  con el escritor único ocupado por la propia petición.
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from logging.handlers import RotatingFileHandler
+
+from flask import current_app, request, has_app_context, has_request_context
+
+from app import instrumentation
+
+logger = logging.getLogger('carflix.sql.slow')
+
+REDACTED = '***'
+SECRET_PARAM = re.compile(r'pass|secret|token|hash|key|salt|csrf', re.IGNORECASE)
+MAX_PARAM_LENGTH = 200
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS slow_query (
+    shape TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    total_ms REAL NOT NULL,
+    max_ms REAL NOT NULL,
+    last_ms REAL NOT NULL,
+    statement TEXT NOT NULL,
+    params TEXT,
+    route TEXT,
+    plan TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+)
+"""
+
+_UPSERT = """
+INSERT INTO slow_query (shape, count, total_ms, max_ms, last_ms, statement, params, route, plan,
+                        first_seen, last_seen)
+VALUES (:shape, 1, :ms, :ms, :ms, :statement, :params, :route, :plan, :now, :now)
+ON CONFLICT (shape) DO UPDATE SET
+    count = count + 1,
+    total_ms = total_ms + excluded.total_ms,
+    max_ms = max(max_ms, excluded.max_ms),
+    last_ms = excluded.last_ms,
+    statement = excluded.statement,
+    params = excluded.params,
+    route = excluded.route,
+    plan = excluded.plan,
+    last_seen = excluded.last_seen
+"""
+
+_registered = False
+
+
+# ==================== CAPTURA ====================
+
+def _redact_value(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f'<{len(value)} bytes>'
+    if isinstance(value, str) and len(value) > MAX_PARAM_LENGTH:
+        return value[:MAX_PARAM_LENGTH] + '...'
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def redact_parameters(parameters, context):
+    """Parámetros de la sentencia con los secretos ocultos
+
+    Con una sentencia compilada por SQLAlchemy se conocen los nombres de los
+    parámetros y se ocultan los que parecen contraseñas, hashes o tokens. En
+    SQL textual sin nombres se ocultan todas las cadenas.
+    """
+    compiled = getattr(context, 'compiled_parameters', None)
+    if compiled and len(compiled) == 1:
+        return {name: REDACTED if SECRET_PARAM.search(name) else _redact_value(value)
+                for name, value in compiled[0].items()}
+    if isinstance(parameters, dict):
+        return {name: REDACTED if SECRET_PARAM.search(name) else _redact_value(value)
+                for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)) and not (parameters and isinstance(parameters[0], (list, tuple, dict))):
+        return [REDACTED if isinstance(value, str) else _redact_value(value) for value in parameters]
+    return f'<{len(parameters)} filas>'
+
+
+def query_plan(statement, parameters, context):
+    """EXPLAIN QUERY PLAN sobre la misma conexión DBAPI (sin pasar por los eventos de SQLAlchemy)"""
+    if context is None or context.dialect.name != 'sqlite' or context.executemany:
+        return None
+    if not statement.lstrip().upper().startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')):
+        return None
+    try:
+        cursor = context.cursor.connection.cursor()
+        try:
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+            return [row[-1] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    except sqlite3.Error:
+        return None
+
+
+def current_route():
+    if not has_request_context():
+        return None
+    return f'{request.method} {request.path} ({request.endpoint})'
+
+
+# ==================== ALMACENAMIENTO ====================
+
+def _connect(path):
+    connection = sqlite3.connect(path, timeout=1)
+    connection.execute(_SCHEMA)
+    return connection
+
+
+def store(path, entry):
+    """Agrega una consulta lenta en la tabla slow_query"""
+    connection = _connect(path)
+    try:
+        with connection:
+            connection.execute(_UPSERT, entry)
+    finally:
+        connection.close()
+
+
+def top_offenders(path, limit=50):
+    """Formas de consulta ordenadas por tiempo total, como diccionarios"""
+    connection = _connect(path)
+    connection.row_factory = sqlite3.Row
+    try:
+        rows = connection.execute('SELECT * FROM slow_query ORDER BY total_ms DESC LIMIT ?', (limit,)).fetchall()
+    finally:
+        connection.close()
+
+    offenders = []
+    for row in rows:
+        offender = dict(row)
+        offender['avg_ms'] = offender['total_ms'] / offender['count']
+        offender['plan'] = json.loads(offender['plan']) if offender['plan'] else []
+        offenders.append(offender)
+    return offenders
+
+
+def reset(path):
+    connection = _connect(path)
+    try:
+        with connection:
+            connection.execute('DELETE FROM slow_query')
+    finally:
+        connection.close()
+
+
+# ==================== HOOK ====================
+
+def _on_statement(statement, parameters, duration, context):
+    if not has_app_context():
+        return
+    config = current_app.config
+    threshold = config['SLOW_QUERY_THRESHOLD_MS']
+    if not threshold or duration * 1000 < threshold:
+        return
+
+    plan = query_plan(statement, parameters, context)
+    entry = {
+        'shape': instrumentation.statement_shape(statement),
+        'ms': round(duration * 1000, 2),
+        'statement': statement,
+        'params': json.dumps(redact_parameters(parameters, context), ensure_ascii=False, default=str),
+        'route': current_route(),
+        'plan': json.dumps(plan, ensure_ascii=False) if plan is not None else None,
+        'now': time.time(),
+    }
+
+    logger.warning(json.dumps({
+        'event': 'slow_query',
+        'ms': entry['ms'],
+        'route': entry['route'],
+        'statement': statement,
+        'params': json.loads(entry['params']),
+        'plan': plan,
+    }, ensure_ascii=False))
+
+    path = config['SLOW_QUERY_DB']
+    if path:
+        try:
+            store(path, entry)
+        except sqlite3.Error as e:
+            logger.error('No se pudo guardar la consulta lenta: %s', e)
+
+
+def init_app(app):
+    """Registra el hook (una vez por proceso) y el fichero de log rotativo"""
+    global _registered
+    if not _registered:
+        instrumentation.STATEMENT_HOOKS.append(_on_statement)
+        _registered = True
+
+    log_file = app.config['SLOW_QUERY_LOG_FILE']
+    if log_file:
+        log_file = os.path.abspath(log_file)
+    if log_file and not any(getattr(h, 'baseFilename', None) == log_file for h in logger.handlers):
+        handler = RotatingFileHandler(log_file, maxBytes=app.config['SLOW_QUERY_LOG_MAX_BYTES'],
+                                      backupCount=app.config['SLOW_QUERY_LOG_BACKUPS'], encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
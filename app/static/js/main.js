@@ -184,6 +184,17 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    // ========== HEARTBEAT DE REPRODUCCIÓN ==========
+    // Mientras el video se reproduce avisa al servidor una vez por minuto (tendencias)
+    const heartbeatVideo = document.querySelector('video[data-heartbeat-url]');
+    if (heartbeatVideo) {
+        setInterval(function() {
+            if (!heartbeatVideo.paused && !heartbeatVideo.ended) {
+                fetch(heartbeatVideo.dataset.heartbeatUrl, { method: 'POST', credentials: 'same-origin' });
+            }
+        }, 60000);
+    }
+
     // ========== SEARCH AUTO-SUBMIT ==========
     const searchInput = document.querySelector('.search-input-large');
     if (searchInput) {
@@ -0,0 +1,358 @@
+"""
+Servidor asyncio para vídeo y subidas
+
+Con WSGI cada espectador de /video/<ruta> ocupa un hilo durante toda la
+descarga. Este servidor atiende esas rutas en un único bucle asyncio: una
+conexión abierta solo cuesta un socket y unos KB, y los datos salen con
+loop.sendfile() (sendfile del sistema; si no está disponible, lecturas en el
+pool de hilos respetando el control de flujo del transporte).
+
+- GET/HEAD /video/<ruta>: mismos ficheros que serve_video, con Range (206/416).
+- PUT /upload/<movies|series>/<nombre>: subida de vídeo en crudo para
+  administradores; el cuerpo se escribe en disco por bloques a medida que llega
+  y la respuesta es {"path": ...}, la ruta relativa que se guarda en video_path.
+
+La autenticación es la de la app Flask: la cookie de sesión (o la de "recordarme")
+se evalúa con Flask-Login en un hilo aparte, así que las reglas son idénticas.
+Las páginas HTML siguen en la app Flask; un proxy inverso envía /video/ y
+/upload/ a este servidor.
+
+Por encima de STREAM_MAX_CONNECTIONS conexiones el proceso responde 503 con
+Retry-After en lugar de aceptar más trabajo.
+"""
+
+import asyncio
+import json
+import logging
+import mimetypes
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.utils import formatdate
+from urllib.parse import unquote, urlsplit
+
+from flask_login import current_user
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename
+
+from app import metrics
+
+logger = logging.getLogger('carflix.streaming')
+
+MAX_HEADER_BYTES = 16 * 1024
+UPLOAD_CHUNK = 256 * 1024
+UPLOAD_FOLDERS = {'movies': 'videos/movies', 'series': 'videos/series'}
+
+REASONS = {
+    200: 'OK', 201: 'Created', 206: 'Partial Content', 400: 'Bad Request', 401: 'Unauthorized',
+    403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed', 408: 'Request Timeout',
+    411: 'Length Required', 413: 'Payload Too Large', 415: 'Unsupported Media Type',
+    416: 'Range Not Satisfiable', 500: 'Internal Server Error', 503: 'Service Unavailable',
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message=''):
+        super().__init__(message)
+        self.status = status
+        self.message = message or REASONS.get(status, '')
+
+
+# ==================== HTTP ====================
+
+class Request:
+    def __init__(self, method, target, version, headers):
+        self.method = method
+        self.path = unquote(urlsplit(target).path)
+        self.version = version
+        self.headers = headers  # nombres en minúsculas
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+
+async def read_request(reader):
+    """Lee la línea de petición y las cabeceras; None si el cliente cerró la conexión"""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise HTTPError(400)
+    except asyncio.LimitOverrunError:
+        raise HTTPError(400, 'Cabeceras demasiado grandes')
+
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ')
+    except ValueError:
+        raise HTTPError(400)
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+    return Request(method, target, version, headers)
+
+
+def parse_range(header, size):
+    """(inicio, fin) inclusivos de una cabecera 'bytes=a-b'; None si no hay rango"""
+    if not header:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        return None  # Varios rangos: se sirve el fichero completo
+    first, _, last = spec.strip().partition('-')
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0:
+                raise HTTPError(416)
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPError(416)
+    return start, end
+
+
+def response_head(status, headers):
+    lines = [f'HTTP/1.1 {status} {REASONS.get(status, "")}']
+    lines += [f'{name}: {value}' for name, value in headers.items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+# ==================== SERVIDOR ====================
+
+class StreamServer:
+    def __init__(self, app):
+        self.app = app
+        config = app.config
+        self.root = config['UPLOAD_FOLDER']
+        self.max_connections = config['STREAM_MAX_CONNECTIONS']
+        self.max_upload = config['STREAM_MAX_UPLOAD_BYTES']
+        self.idle_timeout = config['STREAM_IDLE_TIMEOUT']
+        self.allowed_videos = config['ALLOWED_VIDEO_EXTENSIONS']
+        self.connections = 0
+        self.rejected = 0
+        # Autenticación y escritura de subidas: trabajo bloqueante fuera del bucle
+        self.executor = ThreadPoolExecutor(config['STREAM_THREADS'], thread_name_prefix='carflix-stream')
+
+    # ---------- conexiones ----------
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            if self.connections > self.max_connections:
+                self.rejected += 1
+                await self._send_error(writer, HTTPError(503, 'Demasiadas conexiones'), {'Retry-After': '5'})
+                return
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    return
+                except HTTPError as e:
+                    await self._send_error(writer, e)
+                    return
+                if request is None:
+                    return
+                if not await self._dispatch(request, reader, writer) or not request.keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _dispatch(self, request, reader, writer):
+        """Atiende una petición; devuelve False si la conexión no se puede reutilizar"""
+        start = time.perf_counter()
+        status, sent, endpoint = 500, 0, metrics.UNMATCHED
+        try:
+            if request.path.startswith('/video/'):
+                endpoint = 'serve_video'
+                status, sent = await self.serve_video(request, writer)
+            elif request.path.startswith('/upload/'):
+                endpoint = 'stream_upload'
+                status, sent = await self.upload(request, reader, writer)
+            else:
+                raise HTTPError(404)
+            return True
+        except HTTPError as e:
+            status = e.status
+            sent = await self._send_error(writer, e)
+            # El cuerpo de una subida rechazada puede seguir en el socket
+            return request.method != 'PUT'
+        except (ConnectionError, asyncio.CancelledError):
+            raise
+        except Exception:
+            logger.exception('Error atendiendo %s %s', request.method, request.path)
+            sent = await self._send_error(writer, HTTPError(500))
+            return False
+        finally:
+            if self.app.config['METRICS_ENABLED']:
+                metrics.observe(endpoint, request.method, status, time.perf_counter() - start, sent, 0.0, 0)
+
+    async def _send_error(self, writer, error, headers=None):
+        body = json.dumps({'error': error.message}, ensure_ascii=False).encode('utf-8')
+        head = {'Content-Type': 'application/json', 'Content-Length': str(len(body)), **(headers or {})}
+        writer.write(response_head(error.status, head) + body)
+        await writer.drain()
+        return len(body)
+
+    # ---------- autenticación ----------
+
+    def _authenticate(self, request):
+        """(id, es_admin) del usuario de la cookie, evaluado por Flask-Login; None si es anónimo"""
+        cookie = request.headers.get('cookie')
+        if not cookie:
+            return None
+        with self.app.test_request_context(request.path, headers={'Cookie': cookie}):
+            user = current_user._get_current_object()
+            if not user.is_authenticated:
+                return None
+            return user.id, bool(user.is_admin)
+
+    async def authenticate(self, request):
+        user = await asyncio.get_running_loop().run_in_executor(self.executor, self._authenticate, request)
+        if user is None:
+            raise HTTPError(401, 'Inicia sesión para acceder')
+        return user
+
+    # ---------- vídeo ----------
+
+    async def serve_video(self, request, writer):
+        if request.method not in ('GET', 'HEAD'):
+            raise HTTPError(405)
+        await self.authenticate(request)
+
+        path = safe_join(self.root, request.path[len('/video/'):])
+        if path is None:
+            raise HTTPError(404)
+        try:
+            f = open(path, 'rb')
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            raise HTTPError(404)
+
+        with f:
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+            byte_range = parse_range(request.headers.get('range'), size) if size else None
+            start, end = byte_range or (0, size - 1)
+            length = end - start + 1 if size else 0
+            status = 206 if byte_range else 200
+
+            headers = {
+                'Content-Type': mimetypes.guess_type(path)[0] or 'application/octet-stream',
+                'Content-Length': str(length),
+                'Accept-Ranges': 'bytes',
+                'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+                'Cache-Control': 'private, max-age=3600',
+            }
+            if byte_range:
+                headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+            writer.write(response_head(status, headers))
+            await writer.drain()
+
+            if request.method == 'HEAD' or not length:
+                return status, 0
+            # sendfile() del sistema si el transporte lo permite; si no, asyncio lee en
+            # el pool de hilos y espera a que el cliente vacíe el búfer entre bloques
+            sent = await asyncio.get_running_loop().sendfile(writer.transport, f, start, length)
+        return status, sent
+
+    # ---------- subidas ----------
+
+    async def upload(self, request, reader, writer):
+        if request.method != 'PUT':
+            raise HTTPError(405)
+        _, is_admin = await self.authenticate(request)
+        if not is_admin:
+            raise HTTPError(403)
+
+        kind, _, name = request.path[len('/upload/'):].partition('/')
+        subfolder = UPLOAD_FOLDERS.get(kind)
+        filename = secure_filename(name)
+        if subfolder is None or not filename:
+            raise HTTPError(404)
+        base, ext = os.path.splitext(filename)
+        if ext[1:].lower() not in self.allowed_videos:
+            raise HTTPError(415, 'Solo se permiten archivos de video')
+
+        if 'content-length' not in request.headers:
+            raise HTTPError(411)
+        try:
+            remaining = int(request.headers['content-length'])
+        except ValueError:
+            raise HTTPError(400)
+        if remaining > self.max_upload:
+            raise HTTPError(413)
+        if request.headers.get('expect', '').lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+            await writer.drain()
+
+        # Mismo formato de nombre que routes.save_file
+        filename = f"{base}_{datetime.now():%Y%m%d_%H%M%S}{ext}"
+        directory = os.path.join(self.root, subfolder)
+        os.makedirs(directory, exist_ok=True)
+        target = os.path.join(directory, filename)
+        partial = target + '.part'
+
+        loop = asyncio.get_running_loop()
+        f = open(partial, 'wb')
+        try:
+            while remaining:
+                try:
+                    chunk = await asyncio.wait_for(reader.read(min(UPLOAD_CHUNK, remaining)), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    raise HTTPError(408)
+                if not chunk:
+                    raise ConnectionError('Subida interrumpida')
+                remaining -= len(chunk)
+                # Mientras se escribe el bloque no se lee más del socket: el cliente
+                # no puede llenar la memoria más rápido de lo que escribe el disco
+                await loop.run_in_executor(self.executor, f.write, chunk)
+            f.close()
+            os.replace(partial, target)
+        except BaseException:
+            f.close()
+            os.unlink(partial)
+            raise
+
+        body = json.dumps({'path': f'{subfolder}/{filename}'}).encode('utf-8')
+        writer.write(response_head(201, {'Content-Type': 'application/json', 'Content-Length': str(len(body))}) + body)
+        await writer.drain()
+        return 201, len(body)
+
+
+async def _flush_metrics(directory, interval):
+    """Vuelca las métricas al directorio compartido para que las sume /metrics de la app"""
+    while True:
+        await asyncio.sleep(interval)
+        metrics.flush(directory)
+
+
+async def serve(app, host, port, reuse_port=False):
+    """Arranca el servidor y atiende hasta que se cancele la tarea"""
+    stream_server = StreamServer(app)
+    server = await asyncio.start_server(stream_server.handle, host, port, limit=MAX_HEADER_BYTES,
+                                        backlog=4096, reuse_port=reuse_port or None)
+    directory = app.config['METRICS_MULTIPROC_DIR'] if app.config['METRICS_ENABLED'] else None
+    flusher = asyncio.create_task(_flush_metrics(directory, app.config['METRICS_FLUSH_INTERVAL'])) \
+        if directory else None
+    async with server:
+        try:
+            await server.serve_forever()
+        finally:
+            if flusher is not None:
+                flusher.cancel()
+                metrics.flush(directory)
+            stream_server.executor.shutdown(wait=False, cancel_futures=True)
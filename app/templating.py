@@ -0,0 +1,78 @@
+"""
+Compilación y medición de las plantillas Jinja
+
+- Caché de bytecode en disco (TEMPLATE_CACHE_DIR): la primera vez que un proceso
+  compila una plantilla guarda el resultado, y el resto de workers (y los
+  arranques siguientes) lo cargan sin volver a compilar. Jinja escribe cada
+  fichero con rename atómico y lo descarta si la plantilla ha cambiado.
+- Precalentamiento (TEMPLATE_WARM_UP): al crear la app se cargan todas las
+  plantillas, así ninguna petición paga la compilación.
+- Medición: con las métricas activas, cada plantilla y cada bloque suman su
+  tiempo de renderizado en carflix_template_render_seconds_total (el tiempo de
+  un bloque incluye el de los bloques e includes que contiene). Solo cuenta el
+  tiempo dentro de Jinja: en las páginas renderizadas por partes no se incluye
+  lo que se tarda en enviar cada bloque.
+"""
+
+import os
+import time
+
+from jinja2 import FileSystemBytecodeCache, Template
+
+from app import metrics
+
+WHOLE_TEMPLATE = '(plantilla)'
+
+
+def _timed(template, block, render):
+    """Envuelve una función de renderizado de Jinja (un generador) y mide el tiempo dentro de ella"""
+
+    def render_timed(context):
+        stream = render(context)
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    chunk = next(stream)
+                except StopIteration:
+                    elapsed += time.perf_counter() - start
+                    return
+                elapsed += time.perf_counter() - start
+                yield chunk
+        finally:
+            metrics.observe_template(template, block, elapsed)
+
+    return render_timed
+
+
+class TimedTemplate(Template):
+    """Plantilla cuyas funciones de renderizado (la raíz y cada bloque) se miden"""
+
+    @classmethod
+    def from_code(cls, environment, code, globals, uptodate=None):
+        template = super().from_code(environment, code, globals, uptodate)
+        name = template.name or '<string>'
+        template.root_render_func = _timed(name, WHOLE_TEMPLATE, template.root_render_func)
+        template.blocks = {block: _timed(name, block, render) for block, render in template.blocks.items()}
+        return template
+
+
+def warm_up(app):
+    """Carga (y compila, o lee de la caché) todas las plantillas; devuelve cuántas"""
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def init_app(app):
+    """Configura el entorno de Jinja; debe llamarse antes de que nada use app.jinja_env"""
+    directory = app.config['TEMPLATE_CACHE_DIR']
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_options = dict(app.jinja_options, bytecode_cache=FileSystemBytecodeCache(directory))
+    if app.config['METRICS_ENABLED']:
+        app.jinja_env.template_class = TimedTemplate
+    if app.config['TEMPLATE_WARM_UP']:
+        warm_up(app)
@@ -0,0 +1,245 @@
+"""
+Tendencias con ventanas deslizantes (1h, 24h y 7d)
+
+Cada proceso mantiene en memoria un buffer circular de buckets por título y
+ventana, alimentado al marcar contenido como visto y por los heartbeats del
+reproductor. Un hilo por proceso suma periódicamente a la tabla
+trending_bucket lo que ha registrado desde la última vez (count = count +
+delta, así los workers de serve.py no se pisan) y recarga de ella los
+contadores de todos; las peticiones nunca escriben. El top N de cada ventana se
+recalcula como mucho cada TRENDING_REFRESH_INTERVAL segundos, así que servirlo
+no depende del tamaño del catálogo.
+"""
+
+import heapq
+import os
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from app import db
+from app.cache import TTLCache
+from app.models import Movie, Series, TrendingBucket
+from app.recommendations import load_items
+
+# Ventanas: nombre -> (segundos por bucket, número de buckets)
+WINDOWS = {
+    '1h': (300, 12),
+    '24h': (3600, 24),
+    '7d': (6 * 3600, 28),
+}
+
+# Peso de cada señal
+WATCH_WEIGHT = 1.0
+HEARTBEAT_WEIGHT = 0.1  # El reproductor envía uno por minuto
+
+_catalog_ids = TTLCache(ttl=300, maxsize=1, name='trending_catalog_ids')
+_last_heartbeat = TTLCache(ttl=60, maxsize=100000, name='trending_heartbeats')
+
+
+class SlidingWindowCounter:
+    """Contador por clave con un buffer circular de buckets de tamaño fijo"""
+
+    def __init__(self, bucket_seconds, buckets):
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        self._entries = {}  # clave -> (conteos, número absoluto de bucket)
+
+    def _bucket(self, now):
+        return int(now // self.bucket_seconds)
+
+    def add(self, key, amount, now):
+        """Suma amount en el bucket actual de la clave (O(1))"""
+        self.load(key, self._bucket(now), amount)
+
+    def load(self, key, bucket, amount):
+        """Suma amount en un bucket absoluto concreto"""
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = ([0.0] * self.buckets, [-1] * self.buckets)
+        counts, epochs = entry
+        slot = bucket % self.buckets
+        if epochs[slot] != bucket:
+            if epochs[slot] > bucket:
+                return  # Bucket más antiguo que el que ocupa el hueco
+            counts[slot] = 0.0
+            epochs[slot] = bucket
+        counts[slot] += amount
+
+    def totals(self, now):
+        """Total de la ventana por clave; elimina las claves ya caducadas"""
+        oldest = self._bucket(now) - self.buckets + 1
+        result = {}
+        for key, (counts, epochs) in list(self._entries.items()):
+            total = sum(c for c, e in zip(counts, epochs) if e >= oldest)
+            if total > 0:
+                result[key] = total
+            else:
+                del self._entries[key]
+        return result
+
+    def buckets_snapshot(self, now):
+        """Lista (clave, bucket, conteo) de los buckets vigentes"""
+        oldest = self._bucket(now) - self.buckets + 1
+        return [(key, e, c)
+                for key, (counts, epochs) in self._entries.items()
+                for c, e in zip(counts, epochs) if e >= oldest and c > 0]
+
+
+class TrendingTracker:
+    """Contadores de todas las ventanas más el top N precalculado"""
+
+    def __init__(self):
+        self.counters = self._new_counters()
+        self._pending = {}  # (ventana, tipo, id, bucket) -> suma aún no guardada
+        self._lock = threading.Lock()
+        self._top = {}  # ventana -> (instante de cálculo, [(clave, total), ...])
+        self._loaded = False
+        self._sync_pid = None  # Proceso en el que corre el hilo de sincronización
+
+    @staticmethod
+    def _new_counters():
+        return {name: SlidingWindowCounter(*spec) for name, spec in WINDOWS.items()}
+
+    def _ensure_loaded(self):
+        """Restaura los contadores guardados (una vez por proceso) y arranca la sincronización"""
+        if self._loaded and self._sync_pid == os.getpid():
+            return
+        self.reload()
+        self.start_sync(current_app._get_current_object())
+
+    def record(self, item_type, item_id, amount):
+        """Registra una señal para un título en todas las ventanas (solo en memoria)"""
+        self._ensure_loaded()
+        now = time.time()
+        with self._lock:
+            for window, counter in self.counters.items():
+                counter.add((item_type, item_id), amount, now)
+                key = (window, item_type, item_id, counter._bucket(now))
+                self._pending[key] = self._pending.get(key, 0.0) + amount
+
+    def top(self, window, n=10):
+        """Top N [((tipo, id), total), ...] de una ventana, recalculado con un intervalo fijo"""
+        self._ensure_loaded()
+        now = time.time()
+        cached = self._top.get(window)
+        if cached is None or now - cached[0] >= current_app.config['TRENDING_REFRESH_INTERVAL']:
+            with self._lock:
+                totals = self.counters[window].totals(now)
+            ranking = heapq.nlargest(current_app.config['TRENDING_TOP_SIZE'], totals.items(),
+                                     key=lambda kv: (kv[1], kv[0]))
+            cached = self._top[window] = (now, ranking)
+        return cached[1][:n]
+
+    # ==================== SINCRONIZACIÓN ====================
+
+    def save(self):
+        """Suma a trending_bucket lo registrado desde la última vez y borra los buckets caducados"""
+        now = time.time()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        rows = [{'period': window, 'item_type': item_type, 'item_id': item_id, 'bucket': bucket, 'count': count}
+                for (window, item_type, item_id, bucket), count in pending.items()]
+
+        table = TrendingBucket.__table__
+        try:
+            with db.engine.begin() as connection:
+                if rows:
+                    statement = insert(table)
+                    connection.execute(statement.on_conflict_do_update(
+                        index_elements=[table.c.period, table.c.item_type, table.c.item_id, table.c.bucket],
+                        set_={'count': table.c.count + statement.excluded.count}), rows)
+                for window, (bucket_seconds, buckets) in WINDOWS.items():
+                    oldest = int(now // bucket_seconds) - buckets + 1
+                    connection.execute(table.delete().where(table.c.period == window, table.c.bucket < oldest))
+        except Exception:
+            # No se pierde lo registrado: se vuelve a intentar en la siguiente pasada
+            with self._lock:
+                for key, count in pending.items():
+                    self._pending[key] = self._pending.get(key, 0.0) + count
+            raise
+
+    def reload(self):
+        """Recarga los contadores desde trending_bucket (lo de todos los procesos) más lo aún no guardado"""
+        merged = db.session.execute(select(TrendingBucket.period, TrendingBucket.item_type, TrendingBucket.item_id,
+                                           TrendingBucket.bucket, TrendingBucket.count)).all()
+
+        counters = self._new_counters()
+        for window, item_type, item_id, bucket, count in merged:
+            if window in counters:
+                counters[window].load((item_type, item_id), bucket, count)
+        with self._lock:
+            for (window, item_type, item_id, bucket), count in self._pending.items():
+                counters[window].load((item_type, item_id), bucket, count)
+            self.counters = counters
+            self._top = {}
+            self._loaded = True
+
+    def start_sync(self, app):
+        """Hilo que cada TRENDING_REFRESH_INTERVAL recarga los contadores de todos los procesos
+        y cada TRENDING_SNAPSHOT_INTERVAL guarda los de este; uno por proceso"""
+        with self._lock:
+            if self._sync_pid == os.getpid():
+                return
+            self._sync_pid = os.getpid()
+
+        def run():
+            last_save = time.monotonic()
+            while True:
+                time.sleep(app.config['TRENDING_REFRESH_INTERVAL'])
+                try:
+                    with app.app_context():
+                        if time.monotonic() - last_save >= app.config['TRENDING_SNAPSHOT_INTERVAL']:
+                            last_save = time.monotonic()
+                            self.save()
+                        self.reload()
+                except Exception:
+                    app.logger.exception('Error al sincronizar las tendencias')
+
+        threading.Thread(target=run, name='carflix-trending', daemon=True).start()
+
+
+tracker = TrendingTracker()
+
+
+def record_watch(item_type, item_id):
+    """Señal de "marcado como visto" (los episodios cuentan para su serie)"""
+    tracker.record(item_type, item_id, WATCH_WEIGHT)
+
+
+def record_heartbeat(item_type, item_id):
+    """Señal periódica del reproductor mientras se está viendo un título"""
+    tracker.record(item_type, item_id, HEARTBEAT_WEIGHT)
+
+
+def allow_heartbeat(user_id):
+    """Como mucho un heartbeat por usuario cada TRENDING_HEARTBEAT_INTERVAL segundos"""
+    if _last_heartbeat.get(user_id) is not None:
+        return False
+    _last_heartbeat.set(user_id, True, ttl=current_app.config['TRENDING_HEARTBEAT_INTERVAL'])
+    return True
+
+
+def known_item(item_type, item_id):
+    """True si el título existe; los ids del catálogo se cachean durante TRENDING_IDS_TTL segundos"""
+    ids = _catalog_ids.get('ids')
+    if ids is None:
+        ids = {'movie': frozenset(db.session.execute(select(Movie.id)).scalars()),
+               'series': frozenset(db.session.execute(select(Series.id)).scalars())}
+        _catalog_ids.set('ids', ids, ttl=current_app.config['TRENDING_IDS_TTL'])
+    if item_id in ids[item_type]:
+        return True
+    # Títulos dados de alta después de cargar la caché
+    model = Movie if item_type == 'movie' else Series
+    return db.session.get(model, item_id) is not None
+
+
+def trending(window='24h', n=10):
+    """Top N de la ventana como [(tipo, objeto, puntuación), ...]"""
+    ranking = tracker.top(window, n)
+    scores = dict(ranking)
+    return [(item_type, item, scores[(item_type, item.id)])
+            for item_type, item in load_items([key for key, _ in ranking])]
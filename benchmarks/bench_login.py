@@ -0,0 +1,104 @@
+"""
+Benchmark de inicio de sesión: logins por segundo y por núcleo
+Ejecutar: python benchmarks/bench_login.py [--method scrypt:32768:8:1] [--seconds 5]
+
+Mide la verificación de contraseñas aislada (un hilo y el pool completo) y el
+login completo con el cliente de pruebas de Flask sobre una base de datos temporal.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app import create_app, db
+from app.models import User
+
+EMAIL = 'bench@carflix.com'
+PASSWORD = 'bench-password-123'
+
+
+def make_app(method):
+    """App con base de datos temporal y CSRF desactivado"""
+    db_path = os.path.join(tempfile.mkdtemp(prefix='carflix-bench-'), 'bench.db')
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + db_path
+        WTF_CSRF_ENABLED = False
+        PASSWORD_HASH_METHOD = method
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        user = User(username='bench', email=EMAIL)
+        user.set_password(PASSWORD)
+        db.session.add(user)
+        db.session.commit()
+    return app
+
+
+def run_for(seconds, fn):
+    """Ejecuta fn en bucle durante `seconds` y devuelve operaciones por segundo"""
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        fn()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def bench_verify(app, seconds):
+    """Verificaciones por segundo con un hilo y con tantos hilos como workers del pool"""
+    with app.app_context():
+        user = User.query.filter_by(email=EMAIL).first()
+        single = run_for(seconds, lambda: user.check_password(PASSWORD))
+
+        workers = app.config['PASSWORD_CHECK_WORKERS']
+
+        def worker():
+            with app.app_context():
+                return run_for(seconds, lambda: user.check_password(PASSWORD))
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parallel = sum(pool.map(lambda _: worker(), range(workers)))
+    return single, parallel, workers
+
+
+def bench_login(app, seconds):
+    """Logins completos (POST /login) por segundo con el cliente de pruebas"""
+    client = app.test_client()
+
+    def login():
+        response = client.post('/login', data={'email': EMAIL, 'password': PASSWORD})
+        assert response.status_code == 302, response.status_code
+        client.get('/logout')
+
+    return run_for(seconds, login)
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Benchmark de inicio de sesión')
+    parser.add_argument('--method', default=Config.PASSWORD_HASH_METHOD, help='Método de hash de Werkzeug')
+    parser.add_argument('--seconds', type=float, default=5.0, help='Duración de cada medición')
+    args = parser.parse_args()
+
+    app = make_app(args.method)
+    single, parallel, workers = bench_verify(app, args.seconds)
+    logins = bench_login(app, args.seconds)
+    cores = min(workers, os.cpu_count() or 1)
+
+    print("=" * 60)
+    print(f"🔐 CARFLIX - Benchmark de login ({args.method})")
+    print("=" * 60)
+    print(f"{'Verificaciones (1 hilo):':<32}{single:8.1f} /s")
+    print(f"{f'Verificaciones ({workers} hilos):':<32}{parallel:8.1f} /s  ->  {parallel / cores:.1f} /s por núcleo")
+    print(f"{'Login completo (1 cliente):':<32}{logins:8.1f} /s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,435 @@
+"""
+Benchmark de las rutas principales: latencias, throughput y consultas por petición
+Ejecutar: python benchmarks/bench_routes.py [--mode client|http|both] [--users 200] [--movies 500]
+          [--save-baseline] [--threshold 0.25]
+
+- client: cliente de pruebas de Flask, una petición tras otra (sin red ni servidor).
+- http: servidor WSGI local con hilos y varios procesos generando carga por HTTP.
+
+Cubre /home, /movie/<id>, /series/<id>, /search, /stats, /admin/stats, las rutas
+toggle y peticiones con Range a /video/. Los resultados se comparan con
+benchmarks/baselines.json: el script termina con código 1 si el p95 o el
+throughput empeoran más de --threshold, o si aumentan las consultas por petición.
+
+Las páginas de stream_page se renderizan mientras se envían: la latencia se mide
+hasta leer el cuerpo entero y las consultas se cuentan con un listener de
+SQLAlchemy en el proceso que atiende las peticiones (las cabeceras X-Query-*
+se calculan antes de la plantilla).
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app import create_app, db
+from app.models import User, Movie, Series, Episode, Category, movie_categories, series_categories, \
+    movie_watched, episode_watched, movie_favorites
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+PASSWORD = 'bench-password-123'
+ADMIN_EMAIL = 'admin@carflix.com'
+ADMIN_PASSWORD = 'admin123'
+VIDEO_PATH = 'videos/bench.mp4'
+VIDEO_SIZE = 8 * 1024 * 1024
+RANGE_SIZE = 1024 * 1024
+SEARCH_WORDS = ['Acción', 'noche', 'Película 1', 'Serie', 'zzz', 'Drama']
+CATEGORIES = ['Acción', 'Aventura', 'Comedia', 'Drama', 'Ciencia Ficción', 'Terror', 'Thriller', 'Romance']
+
+
+# ==================== DATOS ====================
+
+def make_config(db_path, upload_folder):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + db_path
+        UPLOAD_FOLDER = upload_folder
+        WTF_CSRF_ENABLED = False
+        QUERY_STATS_HEADERS = False  # Con cabeceras las páginas no se envían por partes
+        QUERY_STATS_LOG = False
+        SLOW_QUERY_THRESHOLD_MS = 0
+    return BenchConfig
+
+
+def seed(app, sizes, rng):
+    """Catálogo, usuarios e historial con inserciones masivas"""
+    with app.app_context():
+        template = User(username='x', email='x')
+        template.set_password(PASSWORD)
+        password_hash = template.password_hash
+
+        db.session.execute(Category.__table__.insert(), [{'name': name} for name in CATEGORIES])
+        db.session.execute(User.__table__.insert(), [
+            {'username': f'bench{i}', 'email': f'bench{i}@carflix.com', 'password_hash': password_hash}
+            for i in range(sizes['users'])
+        ])
+        db.session.execute(Movie.__table__.insert(), [
+            {'title': f'Película {i}', 'description': f'Descripción de la película {i} de noche',
+             'duration': rng.randint(80, 180), 'release_year': rng.randint(1970, 2024), 'video_path': VIDEO_PATH}
+            for i in range(sizes['movies'])
+        ])
+        db.session.execute(Series.__table__.insert(), [
+            {'title': f'Serie {i}', 'description': f'Descripción de la serie {i}',
+             'release_year': rng.randint(1990, 2024)}
+            for i in range(sizes['series'])
+        ])
+        db.session.execute(Episode.__table__.insert(), [
+            {'series_id': s + 1, 'season_number': e // 10 + 1, 'episode_number': e % 10 + 1,
+             'title': f'Episodio {e + 1}', 'duration': 45, 'video_path': VIDEO_PATH}
+            for s in range(sizes['series']) for e in range(sizes['episodes'])
+        ])
+
+        categories = range(1, len(CATEGORIES) + 1)
+        db.session.execute(movie_categories.insert(), [
+            {'movie_id': m, 'category_id': c}
+            for m in range(1, sizes['movies'] + 1) for c in rng.sample(categories, 2)
+        ])
+        db.session.execute(series_categories.insert(), [
+            {'series_id': s, 'category_id': c}
+            for s in range(1, sizes['series'] + 1) for c in rng.sample(categories, 2)
+        ])
+
+        user_ids = [u.id for u in User.query.filter(User.email.like('bench%')).all()]
+        total_episodes = sizes['series'] * sizes['episodes']
+        watched, episodes, favorites = [], [], []
+        for user_id in user_ids:
+            for movie_id in rng.sample(range(1, sizes['movies'] + 1), min(sizes['history'], sizes['movies'])):
+                watched.append({'user_id': user_id, 'movie_id': movie_id})
+            for episode_id in rng.sample(range(1, total_episodes + 1), min(sizes['history'], total_episodes)):
+                episodes.append({'user_id': user_id, 'episode_id': episode_id})
+            for movie_id in rng.sample(range(1, sizes['movies'] + 1), min(5, sizes['movies'])):
+                favorites.append({'user_id': user_id, 'movie_id': movie_id})
+        db.session.execute(movie_watched.insert(), watched)
+        db.session.execute(episode_watched.insert(), episodes)
+        db.session.execute(movie_favorites.insert(), favorites)
+        db.session.commit()
+
+
+def prepare(sizes, seed_value):
+    """Base de datos temporal, vídeo de prueba y datos
+
+    Devuelve la app: las rutas se registran al importar app.routes, así que solo
+    la primera app creada en el proceso las tiene (el servidor HTTP la hereda con fork).
+    """
+    directory = tempfile.mkdtemp(prefix='carflix-bench-')
+    upload_folder = os.path.join(directory, 'static')
+    os.makedirs(os.path.join(upload_folder, 'videos'))
+    with open(os.path.join(upload_folder, VIDEO_PATH), 'wb') as f:
+        f.write(os.urandom(VIDEO_SIZE))
+
+    app = create_app(make_config(os.path.join(directory, 'bench.db'), upload_folder))
+    seed(app, sizes, random.Random(seed_value))
+    return app
+
+
+# ==================== ESCENARIOS ====================
+
+def _range_header(rng):
+    start = rng.randrange(0, VIDEO_SIZE - RANGE_SIZE)
+    return {'Range': f'bytes={start}-{start + RANGE_SIZE - 1}'}
+
+
+# (nombre, requiere admin, constructor (rng, tamaños) -> (ruta, cabeceras))
+SCENARIOS = [
+    ('home', False, lambda rng, s: ('/home', {})),
+    ('movie_detail', False, lambda rng, s: (f'/movie/{rng.randint(1, s["movies"])}', {})),
+    ('series_detail', False, lambda rng, s: (f'/series/{rng.randint(1, s["series"])}', {})),
+    ('search', False, lambda rng, s: ('/search?' + urlencode({'q': rng.choice(SEARCH_WORDS)}), {})),
+    ('stats', False, lambda rng, s: ('/stats', {})),
+    ('admin_stats', True, lambda rng, s: ('/admin/stats', {})),
+    ('toggle_watched_movie', False, lambda rng, s: (f'/toggle-watched/movie/{rng.randint(1, s["movies"])}', {})),
+    ('toggle_favorite_movie', False, lambda rng, s: (f'/toggle-favorite/movie/{rng.randint(1, s["movies"])}', {})),
+    ('toggle_watched_episode', False,
+     lambda rng, s: (f'/toggle-watched/episode/{rng.randint(1, s["series"] * s["episodes"])}', {})),
+    ('video_range', False, lambda rng, s: (f'/video/{VIDEO_PATH}', _range_header(rng))),
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def summarize(latencies, queries, elapsed):
+    return {
+        'requests': len(latencies),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'queries': sum(queries) / len(queries) if queries else 0.0,
+    }
+
+
+def count_statements(counter):
+    """Suma 1 en counter (multiprocessing.Value) por cada sentencia de cualquier engine"""
+    def before_cursor_execute(*args):
+        with counter.get_lock():
+            counter.value += 1
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+
+
+# ==================== MODO CLIENTE DE PRUEBAS ====================
+
+def run_client(app, sizes, scenarios, requests, seed_value):
+    """Cada escenario en secuencia con el cliente de pruebas de Flask"""
+    rng = random.Random(seed_value)
+    user_client, admin_client = app.test_client(), app.test_client()
+    user_client.post('/login', data={'email': 'bench0@carflix.com', 'password': PASSWORD})
+    admin_client.post('/login', data={'email': ADMIN_EMAIL, 'password': ADMIN_PASSWORD})
+
+    statements = multiprocessing.Value('q', 0)
+    count_statements(statements)
+
+    results = {}
+    for name, admin, build in scenarios:
+        client = admin_client if admin else user_client
+        for _ in range(max(1, requests // 10)):  # Calentamiento
+            path, headers = build(rng, sizes)
+            client.get(path, headers=headers).close()
+
+        latencies, queries = [], []
+        start = time.perf_counter()
+        for _ in range(requests):
+            path, headers = build(rng, sizes)
+            before = statements.value
+            t = time.perf_counter()
+            response = client.get(path, headers=headers)
+            response.get_data()  # Las páginas de stream_page se renderizan al leer el cuerpo
+            response.close()
+            latencies.append(time.perf_counter() - t)
+            queries.append(statements.value - before)
+        results[name] = summarize(latencies, queries, time.perf_counter() - start)
+    return results
+
+
+# ==================== MODO HTTP ====================
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve(app, port, statements):
+    """Servidor WSGI con hilos (proceso aparte); cuenta sus sentencias en statements"""
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    count_statements(statements)
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    # Las conexiones SQLite heredadas del proceso padre no se pueden reutilizar
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    make_server('127.0.0.1', port, app, threaded=True, request_handler=QuietHandler).serve_forever()
+
+
+def _wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('El servidor de benchmark no ha arrancado')
+
+
+def _login(port, email, password):
+    """Cookie de sesión tras POST /login"""
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    connection.request('POST', '/login', body=urlencode({'email': email, 'password': password}),
+                       headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    cookies = [c.split(';', 1)[0] for c in response.headers.get_all('Set-Cookie') or []]
+    return '; '.join(cookies)
+
+
+def load_worker(port, worker_id, sizes, scenarios, requests, seed_value, barrier, queue):
+    """Proceso generador de carga: todos los escenarios, sincronizados con los demás procesos
+
+    La barrera anota las sentencias del servidor al empezar cada escenario (y al
+    final): como todos los procesos esperan en ella, la diferencia entre dos
+    marcas son las sentencias de un escenario.
+    """
+    rng = random.Random(seed_value + worker_id)
+    user_cookie = _login(port, f'bench{worker_id % sizes["users"]}@carflix.com', PASSWORD)
+    admin_cookie = _login(port, ADMIN_EMAIL, ADMIN_PASSWORD)
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+
+    for name, admin, build in SCENARIOS:
+        if name not in scenarios:
+            continue
+        cookie = admin_cookie if admin else user_cookie
+        latencies = []
+        barrier.wait()
+        start = time.perf_counter()
+        for _ in range(requests):
+            path, headers = build(rng, sizes)
+            t = time.perf_counter()
+            connection.request('GET', path, headers={'Cookie': cookie, **headers})
+            response = connection.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - t)
+        queue.put((name, latencies, start, time.perf_counter()))
+    barrier.wait()
+    connection.close()
+
+
+def run_http(app, sizes, scenarios, requests, seed_value, processes):
+    """Servidor local y `processes` generadores de carga concurrentes"""
+    port = _free_port()
+    statements = multiprocessing.Value('q', 0)
+    marks = multiprocessing.Manager().list()
+    server = multiprocessing.Process(target=serve, args=(app, port, statements), daemon=True)
+    server.start()
+    try:
+        _wait_for(port)
+        barrier = multiprocessing.Barrier(processes, action=lambda: marks.append(statements.value))
+        queue = multiprocessing.Queue()
+        names = {name for name, _, _ in scenarios}
+        workers = [multiprocessing.Process(target=load_worker,
+                                           args=(port, i, sizes, names, requests, seed_value, barrier, queue))
+                   for i in range(processes)]
+        for worker in workers:
+            worker.start()
+        rows = [queue.get() for _ in range(processes * len(names))]
+        for worker in workers:
+            worker.join()
+    finally:
+        server.terminate()
+        server.join()
+
+    # Los escenarios se ejecutan en el orden de SCENARIOS; marks tiene uno más
+    ordered = [name for name, _, _ in SCENARIOS if name in names]
+    per_request = {name: (marks[i + 1] - marks[i]) / (requests * processes) for i, name in enumerate(ordered)}
+
+    results = {}
+    for name, _, _ in scenarios:
+        mine = [r for r in rows if r[0] == name]
+        elapsed = max(r[3] for r in mine) - min(r[2] for r in mine)
+        results[name] = summarize([lat for r in mine for lat in r[1]], [per_request[name]], elapsed)
+    return results
+
+
+# ==================== BASELINES ====================
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baselines(path, baselines):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baselines, f, indent=2, ensure_ascii=False, sort_keys=True)
+        f.write('\n')
+
+
+def regressions(results, baseline, threshold):
+    """[(escenario, motivo), ...] de los escenarios peores que la baseline"""
+    found = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if current['p95_ms'] > base['p95_ms'] * (1 + threshold):
+            found.append((name, f"p95 {current['p95_ms']:.1f} ms > {base['p95_ms']:.1f} ms"))
+        if current['rps'] < base['rps'] * (1 - threshold):
+            found.append((name, f"throughput {current['rps']:.1f}/s < {base['rps']:.1f}/s"))
+        if current['queries'] > base['queries'] + 0.5:
+            found.append((name, f"consultas {current['queries']:.1f} > {base['queries']:.1f}"))
+    return found
+
+
+def print_results(title, results):
+    print(f"\n{title}")
+    print(f"  {'Escenario':<24}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'SQL/req':>9}")
+    for name, r in results.items():
+        print(f"  {name:<24}{r['p50_ms']:9.1f}{r['p95_ms']:9.1f}{r['p99_ms']:9.1f}{r['rps']:9.1f}{r['queries']:9.1f}")
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Benchmark de las rutas principales')
+    parser.add_argument('--mode', choices=['client', 'http', 'both'], default='client')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--movies', type=int, default=500)
+    parser.add_argument('--series', type=int, default=100)
+    parser.add_argument('--episodes', type=int, default=10, help='Episodios por serie')
+    parser.add_argument('--history', type=int, default=30, help='Películas y episodios vistos por usuario')
+    parser.add_argument('--requests', type=int, default=200, help='Peticiones por escenario (y por proceso en http)')
+    parser.add_argument('--processes', type=int, default=4, help='Procesos generadores de carga en modo http')
+    parser.add_argument('--only', nargs='*', help='Ejecuta solo estos escenarios')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--baseline-file', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help='Guarda los resultados como nueva baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Empeoramiento tolerado (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    sizes = {'users': args.users, 'movies': args.movies, 'series': args.series,
+             'episodes': args.episodes, 'history': args.history}
+    scenarios = [s for s in SCENARIOS if not args.only or s[0] in args.only]
+    modes = ['client', 'http'] if args.mode == 'both' else [args.mode]
+
+    print("=" * 60)
+    print("⏱️  CARFLIX - Benchmark de rutas")
+    print("=" * 60)
+    print("Tamaño: " + ", ".join(f"{k}={v}" for k, v in sizes.items()))
+    app = prepare(sizes, args.seed)
+
+    baselines = load_baselines(args.baseline_file)
+    failed = []
+    for mode in modes:
+        if mode == 'client':
+            results = run_client(app, sizes, scenarios, args.requests, args.seed)
+        else:
+            results = run_http(app, sizes, scenarios, args.requests, args.seed, args.processes)
+        print_results(f"Modo {mode}:", results)
+
+        key = f"{mode}:" + ",".join(f"{k}={v}" for k, v in sizes.items())
+        if args.save_baseline:
+            baselines[key] = results
+        elif key in baselines:
+            failed += [(mode, name, reason) for name, reason in regressions(results, baselines[key], args.threshold)]
+        else:
+            print(f"  (sin baseline para {key}; usa --save-baseline)")
+
+    if args.save_baseline:
+        save_baselines(args.baseline_file, baselines)
+        print(f"\n✓ Baseline guardada en {args.baseline_file}")
+        return 0
+
+    print()
+    if failed:
+        for mode, name, reason in failed:
+            print(f"✗ [{mode}] {name}: {reason}")
+        return 1
+    print("✓ Sin regresiones")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+Benchmark de concurrencia de SQLite: lectores y escritores en procesos separados
+Ejecutar: python benchmarks/bench_sqlite_concurrency.py [--readers 4] [--writers 2] [--seconds 5]
+
+Compara el perfil por defecto de SQLite (journal DELETE, sin escritor único)
+con el perfil de producción de app/database.py (SQLITE_TUNING). Los lectores
+repiten las consultas de /home y los escritores marcan y desmarcan películas
+como vistas, igual que las rutas toggle.
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.exc import OperationalError
+
+from config import Config
+from app import create_app, db
+from app.models import User, Movie, Series, Category, movie_watched
+
+USERS = 200
+MOVIES = 500
+
+
+def make_config(db_path, tuned):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + db_path
+        SQLITE_TUNING = tuned
+    return BenchConfig
+
+
+def prepare(db_path):
+    """Crea la base de datos con usuarios y películas"""
+    app = create_app(make_config(db_path, tuned=False))
+    with app.app_context():
+        db.session.execute(User.__table__.insert(), [
+            {'username': f'bench{i}', 'email': f'bench{i}@carflix.com', 'password_hash': 'x'}
+            for i in range(USERS)
+        ])
+        db.session.execute(Movie.__table__.insert(), [
+            {'title': f'Película {i}', 'video_path': 'videos/movies/sample.mp4', 'duration': 90}
+            for i in range(MOVIES)
+        ])
+        db.session.commit()
+
+
+def reader(db_path, tuned, seconds, queue):
+    """Repite las consultas de catálogo de /home"""
+    app = create_app(make_config(db_path, tuned))
+    ops = errors = 0
+    latencies = []
+    with app.app_context():
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                Movie.query.all()
+                Series.query.all()
+                Category.query.all()
+                db.session.commit()
+                ops += 1
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+    queue.put(('read', ops, errors, latencies))
+
+
+def writer(db_path, tuned, seconds, queue):
+    """Marca y desmarca películas como vistas con un commit por operación"""
+    app = create_app(make_config(db_path, tuned))
+    rng = random.Random(os.getpid())
+    ops = errors = 0
+    latencies = []
+    with app.app_context():
+        user_ids = [u.id for u in User.query.all()]
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            user_id, movie_id = rng.choice(user_ids), rng.randint(1, MOVIES)
+            start = time.perf_counter()
+            try:
+                deleted = db.session.execute(movie_watched.delete().where(
+                    movie_watched.c.user_id == user_id, movie_watched.c.movie_id == movie_id)).rowcount
+                if not deleted:
+                    db.session.execute(movie_watched.insert().values(user_id=user_id, movie_id=movie_id))
+                db.session.commit()
+                ops += 1
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+    queue.put(('write', ops, errors, latencies))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(tuned, readers, writers, seconds):
+    """Lanza los procesos sobre una base de datos nueva y agrega los resultados"""
+    db_path = os.path.join(tempfile.mkdtemp(prefix='carflix-bench-'), 'bench.db')
+    prepare(db_path)
+
+    queue = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=reader, args=(db_path, tuned, seconds, queue)) for _ in range(readers)]
+    processes += [multiprocessing.Process(target=writer, args=(db_path, tuned, seconds, queue)) for _ in range(writers)]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    summary = {}
+    for kind in ('read', 'write'):
+        rows = [r for r in results if r[0] == kind]
+        latencies = [lat for r in rows for lat in r[3]]
+        summary[kind] = {
+            'ops': sum(r[1] for r in rows) / seconds,
+            'errors': sum(r[2] for r in rows),
+            'p95_ms': percentile(latencies, 95) * 1000,
+        }
+    return summary
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Benchmark de concurrencia de SQLite')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"🗄️  CARFLIX - Concurrencia SQLite ({args.readers} lectores, {args.writers} escritores)")
+    print("=" * 60)
+    for name, tuned in (('Por defecto', False), ('Producción', True)):
+        summary = run(tuned, args.readers, args.writers, args.seconds)
+        print(f"{name}:")
+        for kind, label in (('read', 'Lecturas'), ('write', 'Escrituras')):
+            data = summary[kind]
+            print(f"  {label:<11} {data['ops']:8.1f} /s   p95 {data['p95_ms']:7.1f} ms   "
+                  f"errores 'database is locked': {data['errors']}")
+
+
+if __name__ == '__main__':
+    main()
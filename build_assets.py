@@ -0,0 +1,36 @@
+"""
+Script para generar los estáticos con huella de contenido de Carflix
+Ejecutar: python build_assets.py
+
+Copia CSS, JS e imágenes a app/static/dist con el hash en el nombre y genera
+las variantes .gz (y .br si está instalado brotli). Hay que ejecutarlo en cada
+despliegue y reiniciar la app para que cargue el nuevo manifiesto.
+"""
+
+import os
+import time
+
+from config import basedir
+from app import assets
+
+
+def main():
+    """Función principal"""
+    print("=" * 60)
+    print("🎬 CARFLIX - Construyendo estáticos")
+    print("=" * 60)
+
+    start = time.perf_counter()
+    manifest = assets.build(os.path.join(basedir, 'app', 'static'))
+    elapsed = time.perf_counter() - start
+
+    for logical, hashed in sorted(manifest['files'].items()):
+        sizes = manifest['sizes'][hashed]
+        variants = ', '.join(f"{encoding} {size / 1024:.1f} KB" for encoding, size in sizes.items()
+                             if encoding != 'identity')
+        print(f"  {logical} -> {hashed}  ({sizes['identity'] / 1024:.1f} KB{'; ' + variants if variants else ''})")
+    print(f"✓ {len(manifest['files'])} ficheros en {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
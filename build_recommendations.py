@@ -0,0 +1,39 @@
+"""
+Script para reconstruir las recomendaciones "Porque viste..." de Carflix
+Ejecutar: python build_recommendations.py [--top-k N]
+
+Si numpy y scipy están instalados se usan matrices dispersas (recomendado para
+catálogos grandes); si no, se calcula en Python puro.
+"""
+
+import argparse
+import time
+
+from app import create_app
+from app import recommendations
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Reconstruye la tabla de títulos similares')
+    parser.add_argument('--top-k', type=int, default=None, help='Vecinos a guardar por título')
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        print("=" * 60)
+        print("🎬 CARFLIX - Construyendo recomendaciones")
+        print("=" * 60)
+        motor = 'numpy/scipy' if recommendations.scientific()[1] is not None else 'Python puro'
+        print(f"Motor: {motor}")
+
+        start = time.perf_counter()
+        rows = recommendations.build_recommendations(top_k=args.top_k)
+        elapsed = time.perf_counter() - start
+
+        print(f"✓ {rows} vecinos guardados en {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
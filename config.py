@@ -18,4 +18,119 @@ class Config:
 
     # Extensiones permitidas
     ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'avi', 'mkv', 'mov'}
-    ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
\ No newline at end of file
+    ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+
+    # Recomendaciones ("Porque viste...")
+    RECOMMENDATIONS_TOP_K = 12  # Vecinos guardados por título
+    RECOMMENDATIONS_MAX_USER_ITEMS = 500  # Límite de historial por usuario al construir
+
+    # Orden personalizado de /home por afinidad a categorías (segundos)
+    PERSONALIZATION_CACHE_TTL = 300  # Orden calculado por usuario
+    PERSONALIZATION_CATALOG_TTL = 600  # Vectores de categorías del catálogo
+
+    # Tendencias con ventanas deslizantes (segundos)
+    TRENDING_SNAPSHOT_INTERVAL = 60  # Cada cuánto se guardan los contadores en la base de datos
+    TRENDING_REFRESH_INTERVAL = 30  # Cada cuánto se recalcula el top de cada ventana
+    TRENDING_TOP_SIZE = 50  # Títulos que se guardan en el top precalculado
+    TRENDING_IDS_TTL = 300  # Segundos que se cachean los ids del catálogo que aceptan heartbeats
+    TRENDING_HEARTBEAT_INTERVAL = 50  # Mínimo de segundos entre heartbeats de un mismo usuario
+
+    # Caché del usuario autenticado (segundos); cada petición comprueba su versión
+    # en la base de datos, así que los cambios se ven al momento en todos los procesos
+    USER_CACHE_TTL = 30
+
+    # Hash de contraseñas (formato de Werkzeug: 'scrypt:N:r:p' o 'pbkdf2:sha256:iteraciones').
+    # Al cambiarlo, los hashes antiguos se regeneran en el siguiente inicio de sesión
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'
+    PASSWORD_SALT_LENGTH = 16
+    PASSWORD_CHECK_WORKERS = os.cpu_count() or 2  # Verificaciones simultáneas
+    PASSWORD_CHECK_MAX_PENDING = 4 * (os.cpu_count() or 2)  # En curso + en cola
+    PASSWORD_CHECK_TIMEOUT = 10  # Segundos
+
+    # Perfil de producción de SQLite (ver app/database.py)
+    SQLITE_TUNING = True  # PRAGMAs al conectar y escritor único serializado
+    SQLITE_WAL = True  # journal_mode=WAL: los lectores no se bloquean durante los commits
+    SQLITE_SYNCHRONOUS = 'NORMAL'  # Seguro con WAL; 'FULL' para máxima durabilidad
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024  # Bytes
+    SQLITE_CACHE_SIZE = -64000  # Negativo = KiB por conexión
+    SQLITE_BUSY_TIMEOUT = 5000  # Milisegundos esperando un bloqueo antes de fallar
+    SQLITE_SPLIT_READ_WRITE = True  # Pool de lectores separado del escritor
+    SQLITE_READ_POOL_SIZE = 8
+    SQLITE_WRITE_QUEUE_TIMEOUT = 30  # Segundos esperando el turno del escritor
+
+    # Instrumentación de SQL por petición (ver app/instrumentation.py)
+    QUERY_STATS_HEADERS = None  # Cabeceras X-Query-*; None = solo en modo debug
+    QUERY_STATS_LOG = True  # Línea JSON por petición en el logger 'carflix.sql'
+    QUERY_N_PLUS_ONE_THRESHOLD = 5  # Repeticiones de una misma sentencia para sospechar N+1
+
+    # Registro de consultas lentas (ver app/slow_queries.py)
+    SLOW_QUERY_THRESHOLD_MS = 200  # 0 o None lo desactiva
+    SLOW_QUERY_DB = os.path.join(basedir, 'slow_queries.db')  # Agregado por forma para /admin/slow-queries
+    SLOW_QUERY_LOG_FILE = os.environ.get('SLOW_QUERY_LOG_FILE')  # Fichero rotativo opcional
+    SLOW_QUERY_LOG_MAX_BYTES = 5 * 1024 * 1024
+    SLOW_QUERY_LOG_BACKUPS = 3
+
+    # Métricas en formato Prometheus en /metrics (ver app/metrics.py)
+    METRICS_ENABLED = True
+    METRICS_MULTIPROC_DIR = os.environ.get('CARFLIX_METRICS_DIR')  # Directorio compartido entre workers
+    METRICS_FLUSH_INTERVAL = 5  # Segundos entre volcados de cada worker al directorio compartido
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Si se define, /metrics exige "Authorization: Bearer <token>"
+
+    # Profiler de muestreo por petición (ver app/profiler.py)
+    PROFILER_ENABLED = True  # Permite ?_profile=1 / X-Profile: 1 a los administradores
+    PROFILER_DIR = os.path.join(basedir, 'profiles')  # Ficheros .folded y resúmenes .json
+    PROFILER_INTERVAL_MS = 5  # Intervalo de muestreo
+    PROFILER_SAMPLE_RATE = 0  # Perfilado continuo de 1 de cada N peticiones; 0 lo desactiva
+    PROFILER_FLUSH_INTERVAL = 60  # Segundos entre volcados del perfil continuo
+
+    # Arranque: crear tablas, migrar y crear el admin en cada create_app(). Cómodo en
+    # desarrollo; en producción se desactiva y se ejecuta `python manage.py init`
+    AUTO_INIT_DB = os.environ.get('CARFLIX_AUTO_INIT_DB', '1') == '1'
+
+    # Lanzador pre-fork (serve.py)
+    SERVER_HOST = os.environ.get('CARFLIX_HOST', '0.0.0.0')
+    SERVER_PORT = int(os.environ.get('CARFLIX_PORT', 5000))
+    SERVER_WORKERS = int(os.environ.get('CARFLIX_WORKERS', os.cpu_count() or 2))  # Procesos; cada uno atiende en hilos
+
+    # Servidor asyncio para /video y subidas (stream_server.py)
+    STREAM_HOST = os.environ.get('CARFLIX_STREAM_HOST', '0.0.0.0')
+    STREAM_PORT = int(os.environ.get('CARFLIX_STREAM_PORT', 5001))
+    STREAM_MAX_CONNECTIONS = int(os.environ.get('CARFLIX_STREAM_MAX_CONNECTIONS', 4000))  # Por proceso; por encima, 503
+    STREAM_MAX_UPLOAD_BYTES = 8 * 1024 * 1024 * 1024  # Subidas de vídeo por PUT /upload (8 GB)
+    STREAM_IDLE_TIMEOUT = 30  # Segundos esperando una petición o un bloque de una subida
+    STREAM_THREADS = 8  # Hilos para autenticación y escritura de subidas
+
+    # Estáticos con huella (build_assets.py); sin manifiesto se sirven los originales
+    ASSETS_MANIFEST = os.path.join(basedir, 'app/static/dist/manifest.json')
+
+    # Páginas grandes renderizadas por partes (app/rendering.py) y compresión gzip
+    STREAM_FLUSH_BYTES = 16 * 1024  # Tamaño de los bloques entre puntos {{ flush() }}
+    COMPRESSION_ENABLED = True
+    COMPRESSION_MIN_SIZE = 500  # Bytes; por debajo no compensa
+    COMPRESSION_LEVEL = 6
+
+    # Plantillas: caché de bytecode compartida entre workers y precompilación al arrancar
+    TEMPLATE_CACHE_DIR = os.environ.get('CARFLIX_TEMPLATE_CACHE') or os.path.join(basedir, '.template_cache')
+    TEMPLATE_WARM_UP = True
+
+    # Listados paginados del panel de administración
+    ADMIN_PAGE_SIZE = 50  # Filas por página (?per_page=, máximo 200)
+    ADMIN_COUNT_TTL = 60  # Segundos que se reutiliza el total de un listado
+
+    # Contadores de filas del panel (app/counters.py)
+    COUNTERS_RECONCILE_INTERVAL = 3600  # Segundos entre recálculos con COUNT(*)
+
+    # Importación masiva del catálogo (app/catalog_import.py)
+    IMPORT_BATCH_SIZE = 1000  # Filas por transacción
+    INGEST_THREADS = 16  # Hilos de stat y lectura de cabeceras al escanear carpetas de episodios
+
+    # Borrado diferido de usuarios y series (app/deletion.py)
+    PURGE_BATCH_SIZE = 500  # Filas por transacción al purgar
+    PURGE_BATCH_PAUSE = 0.05  # Segundos entre bloques para dejar pasar al resto de escrituras
+
+    # Recolector de ficheros subidos huérfanos (app/media_gc.py)
+    MEDIA_GC_GRACE = 24 * 3600  # Segundos sin modificar antes de poder borrar un fichero sin referencias
+    MEDIA_GC_THREADS = 16  # Hilos del recorrido de carpetas
+
+    # Comprobación de integridad de ficheros (app/media_check.py)
+    MEDIA_CHECK_THREADS = 32  # Hilos de stat y lectura de cabeceras
@@ -0,0 +1,360 @@
+"""
+Generador de datos sintéticos a gran escala para Carflix
+Ejecutar: python generate_data.py [--users 100000] [--movies 20000] [--series 2000] [--seed 42] [--workers 4]
+
+A diferencia de populate_db.py (unos pocos títulos a mano, objeto a objeto),
+genera catálogos e historiales del tamaño de producción:
+
+- Deterministas: el contenido depende solo de --seed y de los tamaños; cada
+  bloque usa su propio generador (semilla, tipo, número de bloque), así que el
+  resultado no cambia con el número de workers.
+- Popularidad con ley de potencias (Zipf) para títulos y series, y actividad
+  por usuario con distribución de Pareto: pocos usuarios ven mucho y unos pocos
+  títulos acaparan la mayoría de las visualizaciones.
+- Los bloques se generan en paralelo (multiprocessing) y el proceso principal
+  los inserta con executemany en transacciones grandes, con ids explícitos.
+
+Todos los usuarios generados tienen la contraseña de --password.
+"""
+
+import argparse
+import bisect
+import math
+import multiprocessing
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from app import counters, create_app, db, personalization
+from app.models import User, Movie, Series, Episode, Category
+
+CATEGORY_NAMES = [
+    'Acción', 'Aventura', 'Comedia', 'Drama', 'Ciencia Ficción',
+    'Terror', 'Thriller', 'Romance', 'Animación', 'Documental',
+    'Fantasía', 'Musical', 'Crimen', 'Misterio', 'Familiar'
+]
+
+ADJECTIVES = ['Oscura', 'Última', 'Perdida', 'Eterna', 'Secreta', 'Salvaje', 'Rota', 'Dorada', 'Silenciosa',
+              'Infinita', 'Helada', 'Prohibida', 'Roja', 'Olvidada', 'Brillante']
+NOUNS = ['Noche', 'Ciudad', 'Frontera', 'Promesa', 'Tormenta', 'Misión', 'Isla', 'Sombra', 'Leyenda',
+         'Memoria', 'Estrella', 'Carretera', 'Herencia', 'Galaxia', 'Conspiración']
+
+MOVIE_VIDEO = 'videos/movies/sample.mp4'
+EPISODE_VIDEO = 'videos/series/sample.mp4'
+POSTER = 'images/posters/default.jpg'
+
+ZIPF_EXPONENT = 0.9  # Popularidad de títulos
+ACTIVITY_ALPHA = 1.5  # Pareto de la actividad por usuario (media = alpha / (alpha - 1))
+HISTORY_DAYS = 365  # Antigüedad máxima del historial
+RECENCY_DAYS = 60  # Media de la antigüedad de cada visualización (exponencial)
+FAVORITE_RATE = 0.1  # Fracción de títulos vistos que acaban en favoritos
+MAX_USER_MOVIES = 2000
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'  # Formato con el que SQLAlchemy guarda DateTime en SQLite
+
+COLUMNS = {
+    'user': ('id', 'username', 'email', 'password_hash', 'is_admin', 'profile_picture', 'created_at'),
+    'movie': ('id', 'title', 'description', 'duration', 'release_year', 'video_path', 'poster_path', 'created_at'),
+    'series': ('id', 'title', 'description', 'release_year', 'poster_path', 'created_at'),
+    'episode': ('id', 'series_id', 'season_number', 'episode_number', 'title', 'description', 'duration',
+                'video_path', 'created_at'),
+    'movie_categories': ('movie_id', 'category_id'),
+    'series_categories': ('series_id', 'category_id'),
+    'movie_watched': ('user_id', 'movie_id', 'watched_date'),
+    'episode_watched': ('user_id', 'episode_id', 'watched_date'),
+    'movie_favorites': ('user_id', 'movie_id', 'added_date'),
+    'series_favorites': ('user_id', 'series_id', 'added_date'),
+}
+
+# Estado compartido con los workers (se fija en _init_worker)
+_plan = None
+
+
+# ==================== UTILIDADES ====================
+
+def chunk_rng(seed, kind, index):
+    """Generador propio de cada bloque: el resultado no depende del reparto entre workers"""
+    return random.Random(f'{seed}:{kind}:{index}')
+
+
+def zipf_cumulative(n, exponent=ZIPF_EXPONENT):
+    """Pesos acumulados de una distribución de Zipf sobre n rangos"""
+    total = 0.0
+    cumulative = []
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** exponent
+        cumulative.append(total)
+    return cumulative
+
+
+def sample_popular(rng, ids, cumulative, k):
+    """k ids distintos elegidos según su popularidad"""
+    k = min(k, len(ids))
+    chosen = set()
+    total = cumulative[-1]
+    attempts = 0
+    while len(chosen) < k and attempts < k * 20:
+        chosen.add(ids[bisect.bisect_left(cumulative, rng.random() * total)])
+        attempts += 1
+    return list(chosen)
+
+
+def activity(rng, mean):
+    """Número de elementos para un usuario: Pareto escalado a la media pedida"""
+    pareto_mean = ACTIVITY_ALPHA / (ACTIVITY_ALPHA - 1)
+    return int(mean * rng.paretovariate(ACTIVITY_ALPHA) / pareto_mean)
+
+
+def past_date(rng, until):
+    """Fecha reciente con más peso en los últimos días"""
+    days = min(rng.expovariate(1 / RECENCY_DAYS), HISTORY_DAYS)
+    return until - timedelta(days=days)
+
+
+def fmt(value):
+    return value.strftime(DATETIME_FORMAT)
+
+
+def title(rng):
+    return f'La {rng.choice(NOUNS)} {rng.choice(ADJECTIVES)}'
+
+
+# ==================== GENERACIÓN POR BLOQUES ====================
+
+def _init_worker(plan):
+    global _plan
+    _plan = plan
+
+
+def generate_users(index):
+    plan = _plan
+    rng = chunk_rng(plan['seed'], 'users', index)
+    start = plan['user_offset'] + index * plan['chunk_size'] + 1
+    end = min(start + plan['chunk_size'], plan['user_offset'] + plan['users'] + 1)
+    rows = []
+    for user_id in range(start, end):
+        created = plan['until'] - timedelta(days=rng.uniform(0, 3 * HISTORY_DAYS))
+        rows.append((user_id, f'user{user_id}', f'user{user_id}@example.com', plan['password_hash'], 0,
+                     'images/default-avatar.png', fmt(created)))
+    return {'user': rows}
+
+
+def generate_movies(index):
+    plan = _plan
+    rng = chunk_rng(plan['seed'], 'movies', index)
+    start = plan['movie_offset'] + index * plan['chunk_size'] + 1
+    end = min(start + plan['chunk_size'], plan['movie_offset'] + plan['movies'] + 1)
+    movies, categories = [], []
+    for movie_id in range(start, end):
+        year = rng.randint(1960, plan['until'].year)
+        movies.append((movie_id, f'{title(rng)} {movie_id}', f'Película sintética número {movie_id}.',
+                       max(70, int(rng.gauss(110, 20))), year, MOVIE_VIDEO, POSTER,
+                       fmt(plan['until'] - timedelta(days=rng.uniform(0, 3 * HISTORY_DAYS)))))
+        for category_id in rng.sample(plan['category_ids'], rng.choice((1, 1, 2, 2, 3))):
+            categories.append((movie_id, category_id))
+    return {'movie': movies, 'movie_categories': categories}
+
+
+def generate_series(index):
+    """Series y sus episodios; la estructura (episodios por serie) viene del plan"""
+    plan = _plan
+    rng = chunk_rng(plan['seed'], 'series', index)
+    first = index * plan['chunk_size']
+    layout = plan['series_layout'][first:first + plan['chunk_size']]
+    series, episodes, categories = [], [], []
+    for series_id, first_episode_id, seasons in layout:
+        series.append((series_id, f'{title(rng)} (serie {series_id})', f'Serie sintética número {series_id}.',
+                       rng.randint(1990, plan['until'].year), POSTER,
+                       fmt(plan['until'] - timedelta(days=rng.uniform(0, 3 * HISTORY_DAYS)))))
+        for category_id in rng.sample(plan['category_ids'], rng.choice((1, 2, 2, 3))):
+            categories.append((series_id, category_id))
+        episode_id = first_episode_id
+        for season, count in enumerate(seasons, start=1):
+            for number in range(1, count + 1):
+                episodes.append((episode_id, series_id, season, number, f'Episodio {number}',
+                                 None, rng.randint(20, 60), EPISODE_VIDEO, fmt(plan['until'])))
+                episode_id += 1
+    return {'series': series, 'episode': episodes, 'series_categories': categories}
+
+
+def generate_history(index):
+    """Visualizaciones y favoritos de un bloque de usuarios"""
+    plan = _plan
+    rng = chunk_rng(plan['seed'], 'history', index)
+    start = plan['user_offset'] + index * plan['chunk_size'] + 1
+    end = min(start + plan['chunk_size'], plan['user_offset'] + plan['users'] + 1)
+    until = plan['until']
+    watched, favorites, episodes, series_favorites = [], [], [], []
+
+    for user_id in range(start, end):
+        count = min(activity(rng, plan['watch_mean']), MAX_USER_MOVIES)
+        for movie_id in sample_popular(rng, plan['movie_ids'], plan['movie_weights'], count):
+            date = past_date(rng, until)
+            watched.append((user_id, movie_id, fmt(date)))
+            if rng.random() < FAVORITE_RATE:
+                favorites.append((user_id, movie_id, fmt(min(until, date + timedelta(hours=rng.uniform(0, 48))))))
+
+        if not plan['series_ids']:
+            continue
+        started = activity(rng, plan['series_mean'])
+        for series_id in sample_popular(rng, plan['series_ids'], plan['series_weights'], started):
+            first_episode_id, total = plan['episode_ranges'][series_id]
+            # La mayoría abandona pronto; unos pocos terminan la serie
+            seen = max(1, int(total * rng.random() ** 2))
+            date = past_date(rng, until)
+            for offset in range(seen):
+                episodes.append((user_id, first_episode_id + offset, fmt(min(until, date + timedelta(hours=offset)))))
+            if seen == total or rng.random() < FAVORITE_RATE:
+                series_favorites.append((user_id, series_id, fmt(min(until, date + timedelta(hours=seen)))))
+
+    return {'movie_watched': watched, 'movie_favorites': favorites,
+            'episode_watched': episodes, 'series_favorites': series_favorites}
+
+
+# ==================== INSERCIÓN ====================
+
+def insert(connection, table, rows):
+    """executemany directo sobre el driver, sin construir objetos por fila"""
+    if not rows:
+        return 0
+    columns = COLUMNS[table]
+    sql = f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})'
+    connection.exec_driver_sql(sql, rows)
+    return len(rows)
+
+
+def run_stage(pool, fn, chunks, counts, label):
+    """Genera los bloques en paralelo y los inserta en orden, un bloque por transacción"""
+    started = time.perf_counter()
+    for result in pool.imap(fn, range(chunks)):
+        with db.engine.begin() as connection:
+            for table, rows in result.items():
+                counts[table] = counts.get(table, 0) + insert(connection, table, rows)
+    print(f"✓ {label} ({time.perf_counter() - started:.1f} s)")
+
+
+def build_plan(args):
+    """Ids de partida, estructura de las series y pesos de popularidad"""
+    rng = chunk_rng(args.seed, 'plan', 0)
+
+    existing = {c.name: c.id for c in Category.query.all()}
+    for name in CATEGORY_NAMES:
+        if name not in existing:
+            category = Category(name=name)
+            db.session.add(category)
+            db.session.flush()
+            existing[name] = category.id
+    db.session.commit()
+
+    def max_id(model):
+        return db.session.scalar(select(func.max(model.id))) or 0
+
+    user_offset, movie_offset = max_id(User), max_id(Movie)
+    series_offset, episode_offset = max_id(Series), max_id(Episode)
+
+    layout, episode_ranges = [], {}
+    next_episode = episode_offset + 1
+    for series_id in range(series_offset + 1, series_offset + args.series + 1):
+        seasons = [rng.randint(6, 12) for _ in range(max(1, min(10, int(rng.expovariate(1 / 2.5)) + 1)))]
+        layout.append((series_id, next_episode, seasons))
+        episode_ranges[series_id] = (next_episode, sum(seasons))
+        next_episode += sum(seasons)
+
+    # El orden de popularidad es una permutación fija de los ids
+    movie_ids = list(range(movie_offset + 1, movie_offset + args.movies + 1))
+    series_ids = list(range(series_offset + 1, series_offset + args.series + 1))
+    rng.shuffle(movie_ids)
+    rng.shuffle(series_ids)
+
+    template = User(username='x', email='x')
+    template.set_password(args.password)
+
+    return {
+        'seed': args.seed,
+        'until': args.until,
+        'chunk_size': args.chunk_size,
+        'users': args.users,
+        'movies': args.movies,
+        'watch_mean': args.watch_mean,
+        'series_mean': args.series_mean,
+        'password_hash': template.password_hash,
+        'category_ids': sorted(existing.values()),
+        'user_offset': user_offset,
+        'movie_offset': movie_offset,
+        'series_layout': layout,
+        'episode_ranges': episode_ranges,
+        'movie_ids': movie_ids,
+        'movie_weights': zipf_cumulative(len(movie_ids)),
+        'series_ids': series_ids,
+        'series_weights': zipf_cumulative(len(series_ids)),
+    }
+
+
+def generate(args):
+    """Genera e inserta todo; devuelve {tabla: filas insertadas}"""
+    plan = build_plan(args)
+    counts = {}
+
+    def chunks(n):
+        return math.ceil(n / args.chunk_size)
+
+    # Las conexiones abiertas no deben heredarse en los workers
+    db.session.remove()
+    for engine in db.engines.values():
+        engine.dispose()
+
+    with multiprocessing.Pool(args.workers, initializer=_init_worker, initargs=(plan,)) as pool:
+        run_stage(pool, generate_users, chunks(args.users), counts, f"{args.users} usuarios")
+        run_stage(pool, generate_movies, chunks(args.movies), counts, f"{args.movies} películas")
+        run_stage(pool, generate_series, chunks(args.series), counts, f"{args.series} series")
+        run_stage(pool, generate_history, chunks(args.users), counts, "Historial y favoritos")
+
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql('ANALYZE')
+    # Las filas se insertan sin pasar por el ORM: los contadores del panel y los
+    # vectores de afinidad se recalculan
+    counters.reconcile()
+    with db.engine.begin() as connection:
+        personalization.rebuild_affinities(connection)
+    return counts
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Generador de datos sintéticos para Carflix')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--movies', type=int, default=5000)
+    parser.add_argument('--series', type=int, default=500)
+    parser.add_argument('--watch-mean', type=float, default=20, help='Películas vistas por usuario (media)')
+    parser.add_argument('--series-mean', type=float, default=2, help='Series empezadas por usuario (media)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--until', type=lambda s: datetime.strptime(s, '%Y-%m-%d'), default=datetime(2025, 1, 1),
+                        help='Fecha de referencia del historial (AAAA-MM-DD)')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--password', default='carflix123', help='Contraseña de los usuarios generados')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        print("=" * 60)
+        print("🏭 CARFLIX - Generando datos sintéticos")
+        print("=" * 60)
+        started = time.perf_counter()
+        counts = generate(args)
+        elapsed = time.perf_counter() - started
+        total = sum(counts.values())
+
+        print("=" * 60)
+        for table, count in counts.items():
+            print(f"  {table:<20} {count:>12,}")
+        print(f"  {total:,} filas en {elapsed:.1f} s ({total / elapsed:,.0f} filas/s)")
+        print(f"  Usuarios: user<id>@example.com / {args.password}")
+        print("=" * 60)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,326 @@
+"""
+Comandos de mantenimiento de Carflix
+Ejecutar: python manage.py <comando>
+
+Comandos:
+  init      Crea las tablas, aplica las migraciones y crea el administrador por defecto
+  upgrade   Aplica las migraciones de esquema pendientes
+  status    Muestra las migraciones aplicadas y pendientes
+  audit     Ejecuta EXPLAIN QUERY PLAN sobre las consultas conocidas y marca recorridos completos
+  slow      Muestra las consultas lentas registradas, por tiempo total
+  counters  Recalcula con COUNT(*) los contadores de filas del panel
+  import    Importa un manifiesto JSON o CSV de catálogo: manage.py import <fichero> [--dry-run]
+  ingest    Crea los episodios de una serie a partir de sus vídeos: manage.py ingest <carpeta> --series ID [--dry-run]
+  purge     Purga los usuarios y series marcados como borrados (normalmente lo hace un hilo en segundo plano)
+  gc        Busca ficheros subidos que ya no referencia nadie; con --delete los borra
+  verify    Comprueba que los ficheros referenciados existen y son válidos (--full relee todas las cabeceras)
+  startup   Informe del tiempo de arranque: importaciones por módulo y paquete y create_app()
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from config import Config
+from app import create_app, init_database
+
+
+class ManageConfig(Config):
+    # Cada comando decide qué hace con el esquema
+    AUTO_INIT_DB = False
+
+
+def cmd_init(args):
+    """Prepara una base de datos nueva o existente"""
+    created = init_database()
+    print("✓ Esquema al día")
+    if created:
+        print("✓ Usuario administrador creado: admin@carflix.com / admin123")
+
+
+def cmd_upgrade(args):
+    """Aplica las migraciones pendientes"""
+    from app import migrations
+
+    done = migrations.upgrade()
+    if not done:
+        print("✓ La base de datos ya está al día")
+    for version, name in done:
+        print(f"✓ Migración {version:04d} aplicada: {name}")
+
+
+def cmd_status(args):
+    """Estado de las migraciones"""
+    from app import migrations
+
+    for version, name, applied_at in migrations.status():
+        state = f"aplicada {applied_at:%Y-%m-%d %H:%M}" if applied_at else "PENDIENTE"
+        print(f"  {version:04d}  {name:<35} {state}")
+
+
+def cmd_audit(args):
+    """Auditoría de planes de consulta; devuelve 1 si hay recorridos inesperados"""
+    from app import query_audit
+
+    unexpected = 0
+    for name, plan, problems, expected in query_audit.audit():
+        if problems and not expected:
+            unexpected += 1
+            mark = '✗'
+        elif problems:
+            mark = '~'
+        else:
+            mark = '✓'
+        print(f"{mark} {name}")
+        if args.verbose or (problems and not expected):
+            for line in plan:
+                print(f"      {line}")
+
+    print()
+    print(f"{unexpected} consultas con recorridos completos inesperados")
+    return 1 if unexpected else 0
+
+
+def cmd_slow(args):
+    """Consultas lentas registradas"""
+    from flask import current_app
+    from app import slow_queries
+
+    path = current_app.config['SLOW_QUERY_DB']
+    offenders = slow_queries.top_offenders(path, limit=20) if path else []
+    if not offenders:
+        print("✓ No hay consultas lentas registradas")
+    for offender in offenders:
+        print(f"{offender['total_ms']:10.0f} ms  {offender['count']:6d}x  máx {offender['max_ms']:8.1f} ms  "
+              f"{offender['route'] or '-'}")
+        print(f"      {offender['shape'][:150]}")
+        if args.verbose:
+            for line in offender['plan']:
+                print(f"        {line}")
+
+
+def cmd_counters(args):
+    """Recalcula los contadores de filas del panel"""
+    from app import counters
+
+    for name, (before, after) in counters.reconcile().items():
+        mark = '✓' if before == after else '✗'
+        print(f"{mark} {name:12s} {after:10d}" + ('' if before == after else f"  (era {before})"))
+
+
+def cmd_import(args):
+    """Importación masiva del catálogo desde un manifiesto"""
+    from app import catalog_import
+
+    if not args.path:
+        print("✗ Indica el manifiesto: python manage.py import <fichero.json|fichero.csv>")
+        return 2
+    with open(args.path, 'rb') as f:
+        data = f.read()
+
+    try:
+        manifest = catalog_import.parse(data, args.path)
+        results = catalog_import.run(manifest, batch_size=args.batch_size,
+                                     check_media=not args.skip_media_check, dry_run=args.dry_run)
+    except catalog_import.ManifestError as e:
+        for error in e.errors:
+            print(f"✗ {error}")
+        print(f"\n{len(e.errors)} errores: no se ha importado nada")
+        return 1
+
+    for name, result in results.items():
+        print(f"✓ {name:12s} {result.created:8d} nuevos  {result.existing:8d} ya existían")
+    if args.dry_run:
+        print("\n(simulación: no se ha escrito nada)")
+
+
+def cmd_ingest(args):
+    """Alta de episodios desde una carpeta de vídeos"""
+    from app import ingest
+    from app.models import Series
+
+    if not args.path or not args.series:
+        print("✗ Uso: python manage.py ingest <carpeta bajo app/static> --series ID [--dry-run]")
+        return 2
+    series = Series.query.get(args.series)
+    if series is None:
+        print(f"✗ No existe la serie {args.series}")
+        return 1
+
+    try:
+        entries = ingest.ingest(series.id, args.path, dry_run=args.dry_run)
+    except ValueError as e:
+        print(f"✗ {e}")
+        return 1
+
+    marks = {'new': '+', 'conflict': '!', 'skipped': '?'}
+    for entry in entries:
+        if entry.action == 'new':
+            duration = f"{entry.duration} min" if entry.duration else "duración desconocida"
+            detail = f"{entry.title} ({duration})"
+        else:
+            detail = entry.reason
+        number = f"T{entry.season_number}E{entry.episode_number:02d}" if entry.season_number else "-"
+        print(f"  {marks[entry.action]} {number:9s} {entry.path}  {detail}")
+
+    new = sum(1 for entry in entries if entry.action == 'new')
+    print()
+    if args.dry_run:
+        print(f"{new} episodios nuevos para «{series.title}» (simulación: no se ha escrito nada)")
+    else:
+        print(f"✓ {new} episodios creados en «{series.title}»")
+    return 1 if any(entry.action == 'conflict' for entry in entries) else 0
+
+
+def cmd_purge(args):
+    """Purga lo que quedó marcado como borrado (por ejemplo, si el proceso murió a mitad)"""
+    from app import deletion
+
+    done = deletion.purge_pending()
+    if not done:
+        print("✓ No hay borrados pendientes")
+    for kind, item_id, rows in done:
+        print(f"✓ {kind} {item_id}: {rows} filas borradas")
+
+
+def _size(n):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024 or unit == 'GB':
+            return f"{n:.1f} {unit}" if unit != 'B' else f"{n} B"
+        n /= 1024
+
+
+def cmd_gc(args):
+    """Recolector de ficheros subidos huérfanos"""
+    from app import media_gc
+
+    report, orphans = media_gc.collect(delete=args.delete, grace=args.grace)
+    for media in orphans[:args.limit if not args.verbose else None]:
+        print(f"  {_size(media.size):>10}  {media.path}")
+    if len(orphans) > args.limit and not args.verbose:
+        print(f"  ... y {len(orphans) - args.limit} más (-v para verlos todos)")
+
+    print()
+    print(f"Ficheros recorridos:   {report.scanned}")
+    print(f"Rutas referenciadas:   {report.referenced}")
+    print(f"Huérfanos:             {report.orphans} ({_size(sum(m.size for m in orphans))})")
+    print(f"En periodo de gracia:  {report.young}")
+    if args.delete:
+        print(f"✓ Borrados:            {report.removed} ({_size(report.reclaimed_bytes)})")
+    elif orphans:
+        print("Ejecuta con --delete para borrarlos")
+
+
+def cmd_verify(args):
+    """Comprobación de integridad de los ficheros referenciados"""
+    from app import media_check
+    from app.models import MediaCheck
+
+    counts, written = media_check.run(full=args.full)
+    problems = MediaCheck.query.filter(MediaCheck.status != 'ok').order_by(MediaCheck.path)
+    total = problems.count()
+    for check in problems.limit(None if args.verbose else args.limit):
+        print(f"✗ {check.status:8s} {check.path}  ({check.item_type} {check.item_id}, {check.field}: {check.detail})")
+    if total > args.limit and not args.verbose:
+        print(f"  ... y {total - args.limit} más (-v para verlos todos)")
+
+    print()
+    for status in ('ok', 'missing', 'empty', 'invalid'):
+        print(f"{status:10s} {counts.get(status, 0):8d}")
+    print(f"Filas actualizadas: {written}")
+
+
+_STARTUP_PROBE = """
+import json, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app()
+print(json.dumps({'import': imported - start, 'create_app': time.perf_counter() - imported}))
+"""
+
+
+def cmd_startup(args):
+    """Arranca la app en un proceso nuevo con -X importtime y resume dónde se va el tiempo"""
+    env = dict(os.environ, CARFLIX_AUTO_INIT_DB='0')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', _STARTUP_PROBE],
+                            capture_output=True, text=True, env=env,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode:
+        print(result.stderr)
+        return 1
+
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(own), int(cumulative)))
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+
+    packages = defaultdict(int)
+    for name, own, _ in modules:
+        packages[name.split('.')[0]] += own
+
+    print("=" * 60)
+    print("🚀 CARFLIX - Tiempo de arranque")
+    print("=" * 60)
+    print(f"  Importar app:  {timings['import'] * 1000:8.1f} ms")
+    print(f"  create_app():  {timings['create_app'] * 1000:8.1f} ms  (sin inicializar la base de datos)")
+    print(f"  Módulos importados: {len(modules)}")
+    print()
+    print("Paquetes (tiempo propio de sus módulos):")
+    for name, own in sorted(packages.items(), key=lambda p: -p[1])[:args.limit]:
+        print(f"  {own / 1000:8.1f} ms  {name}")
+    print()
+    print("Módulos (tiempo acumulado):")
+    for name, _, cumulative in sorted(modules, key=lambda m: -m[2])[:args.limit]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+
+COMMANDS = {
+    'init': cmd_init,
+    'upgrade': cmd_upgrade,
+    'status': cmd_status,
+    'audit': cmd_audit,
+    'slow': cmd_slow,
+    'counters': cmd_counters,
+    'import': cmd_import,
+    'ingest': cmd_ingest,
+    'purge': cmd_purge,
+    'gc': cmd_gc,
+    'verify': cmd_verify,
+    'startup': cmd_startup,
+}
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Comandos de mantenimiento de Carflix')
+    parser.add_argument('command', choices=sorted(COMMANDS))
+    parser.add_argument('-v', '--verbose', action='store_true', help='Muestra los planes de consulta completos')
+    parser.add_argument('--limit', type=int, default=15, help='Filas de cada tabla de los informes (startup, gc, verify)')
+    parser.add_argument('path', nargs='?', help='Manifiesto de import o carpeta de ingest')
+    parser.add_argument('--series', type=int, help='Serie en la que ingest crea los episodios')
+    parser.add_argument('--dry-run', action='store_true', help='Valida y cuenta sin escribir nada')
+    parser.add_argument('--skip-media-check', action='store_true',
+                        help='No comprueba que existan los ficheros de vídeo e imagen')
+    parser.add_argument('--batch-size', type=int, help='Filas por transacción (IMPORT_BATCH_SIZE)')
+    parser.add_argument('--delete', action='store_true', help='gc: borra los ficheros huérfanos')
+    parser.add_argument('--grace', type=int, help='gc: segundos sin modificar para considerar un fichero (MEDIA_GC_GRACE)')
+    parser.add_argument('--full', action='store_true', help='verify: relee las cabeceras aunque no hayan cambiado')
+    args = parser.parse_args()
+
+    if args.command == 'startup':
+        return cmd_startup(args) or 0
+
+    app = create_app(ManageConfig)
+    with app.app_context():
+        return COMMANDS[args.command](args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""
+Servidor de producción pre-fork de Carflix
+Ejecutar: python serve.py [--workers N] [--host H] [--port P]
+
+El proceso maestro importa y configura la app una sola vez (incluidos numpy/scipy
+y las plantillas, que create_app precompila), congela el recolector de basura y
+abre el socket; después crea los workers con fork. Los workers comparten esa memoria copy-on-write y
+arrancan en milisegundos, así que reponer o reciclar uno es inmediato.
+
+El maestro no toca el esquema: antes del primer arranque hay que ejecutar
+`python manage.py init`.
+
+Señales del maestro:
+  SIGTERM / SIGINT  Para los workers (esperando a las peticiones en curso) y sale
+  SIGHUP            Reinicio escalonado: sustituye los workers de uno en uno
+  SIGTTIN / SIGTTOU Añade / quita un worker
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+from config import Config
+from app import create_app, db
+
+GRACEFUL_TIMEOUT = 30  # Segundos que un worker tiene para terminar sus peticiones
+RESPAWN_DELAY = 1  # Espera antes de reponer un worker que muere nada más arrancar
+
+
+class ServeConfig(Config):
+    # El esquema lo prepara `python manage.py init`, no cada arranque
+    AUTO_INIT_DB = False
+
+
+# ==================== MAESTRO ====================
+
+def preload():
+    """Crea la app y carga en el maestro todo lo que los workers van a compartir"""
+    gc.disable()
+    app = create_app(ServeConfig)
+
+    from app import migrations, personalization, recommendations
+    recommendations.scientific()
+    personalization.numpy_or_none()
+
+    with app.app_context():
+        pending = [version for version, _, applied in migrations.status() if applied is None]
+        if pending:
+            app.logger.warning('Migraciones pendientes: %s. Ejecuta `python manage.py init`', pending)
+
+        # Las conexiones SQLite no deben cruzar el fork: cada worker abre las suyas
+        for engine in db.engines.values():
+            engine.dispose()
+
+    gc.freeze()
+    return app
+
+
+def listen(host, port):
+    sock = socket.create_server((host, port), backlog=2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Master:
+    def __init__(self, app, sock, workers):
+        self.app = app
+        self.sock = sock
+        self.size = workers
+        self.workers = {}  # pid -> momento de arranque
+        self.stopping = False
+        self.reload = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            for signum in (signal.SIGTERM, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+                signal.signal(signum, signal.SIG_DFL)
+            code = 1
+            try:
+                code = run_worker(self.app, self.sock)
+            finally:
+                os._exit(code)
+        self.workers[pid] = time.monotonic()
+        return pid
+
+    def reap(self):
+        """Recoge los workers terminados; devuelve [(pid, segundos vivo)]"""
+        dead = []
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            started = self.workers.pop(pid, None)
+            if started is not None:
+                dead.append((pid, time.monotonic() - started))
+        return dead
+
+    def stop(self, pid, timeout=GRACEFUL_TIMEOUT):
+        """Para un worker con SIGTERM y, si no termina a tiempo, con SIGKILL"""
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    break
+            except ChildProcessError:
+                break
+            time.sleep(0.05)
+        else:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.workers.pop(pid, None)
+
+    def rolling_restart(self):
+        """Sustituye los workers de uno en uno: siempre hay `size` atendiendo"""
+        for pid in list(self.workers):
+            if self.stopping:
+                return
+            self.spawn()
+            self.stop(pid)
+        print(f"✓ Reinicio escalonado completado ({len(self.workers)} workers)")
+
+    def _on_signal(self, signum, frame):
+        if signum in (signal.SIGTERM, signal.SIGINT):
+            self.stopping = True
+        elif signum == signal.SIGHUP:
+            self.reload = True
+        elif signum == signal.SIGTTIN:
+            self.size += 1
+        elif signum == signal.SIGTTOU:
+            self.size = max(1, self.size - 1)
+
+    def run(self):
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(signum, self._on_signal)
+
+        while not self.stopping:
+            for pid, lived in self.reap():
+                print(f"✗ Worker {pid} terminado tras {lived:.1f} s; se repone")
+                if lived < RESPAWN_DELAY:
+                    time.sleep(RESPAWN_DELAY)
+
+            if self.reload:
+                self.reload = False
+                self.rolling_restart()
+
+            while len(self.workers) < self.size and not self.stopping:
+                self.spawn()
+            while len(self.workers) > self.size:
+                self.stop(next(iter(self.workers)))
+
+            time.sleep(0.2)
+
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self.workers):
+            self.stop(pid)
+        self.sock.close()
+
+
+# ==================== WORKER ====================
+
+def run_worker(app, sock):
+    """Atiende peticiones en hilos sobre el socket heredado hasta recibir SIGTERM"""
+    gc.enable()
+    server = make_server(app.config['SERVER_HOST'], sock.getsockname()[1], app, threaded=True, fd=sock.fileno())
+    # Al parar, los hilos con peticiones en curso se esperan en server_close()
+    server.daemon_threads = False
+
+    def shutdown(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        directory = app.config['METRICS_MULTIPROC_DIR']
+        if directory and app.config['METRICS_ENABLED']:
+            from app import metrics
+            metrics.flush(directory)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor pre-fork de Carflix')
+    parser.add_argument('--host', default=Config.SERVER_HOST)
+    parser.add_argument('--port', type=int, default=Config.SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=Config.SERVER_WORKERS)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    app = preload()
+    app.config['SERVER_HOST'] = args.host
+    sock = listen(args.host, args.port)
+
+    print("=" * 60)
+    print("🎬 CARFLIX - Servidor pre-fork")
+    print("=" * 60)
+    print(f"  Maestro:  pid {os.getpid()} (app cargada en {(time.perf_counter() - start) * 1000:.0f} ms)")
+    print(f"  Escucha:  http://{args.host}:{args.port}")
+    print(f"  Workers:  {args.workers}")
+    print("  SIGHUP reinicia los workers de uno en uno; SIGTERM los para")
+    print("=" * 60)
+
+    Master(app, sock, args.workers).run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
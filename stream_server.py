@@ -0,0 +1,62 @@
+"""
+Servidor asyncio de vídeo y subidas de Carflix
+Ejecutar: python stream_server.py [--host H] [--port P] [--reuse-port]
+
+Atiende /video/<ruta> y PUT /upload/<movies|series>/<nombre> (ver app/streaming.py);
+el resto de rutas siguen en la app Flask (run.py o serve.py). Con --reuse-port
+se pueden lanzar varios procesos en el mismo puerto y el kernel reparte las
+conexiones entre ellos.
+"""
+
+import argparse
+import asyncio
+import resource
+import sys
+
+from config import Config
+from app import create_app
+from app.streaming import serve
+
+
+class StreamConfig(Config):
+    # El esquema lo prepara `python manage.py init`
+    AUTO_INIT_DB = False
+
+
+def raise_file_limit():
+    """Sube el límite de descriptores abiertos al máximo permitido: cada conexión usa uno"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or hard > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor asyncio de vídeo y subidas de Carflix')
+    parser.add_argument('--host', default=Config.STREAM_HOST)
+    parser.add_argument('--port', type=int, default=Config.STREAM_PORT)
+    parser.add_argument('--reuse-port', action='store_true', help='Permite varios procesos en el mismo puerto')
+    args = parser.parse_args()
+
+    app = create_app(StreamConfig)
+    files = raise_file_limit()
+    max_connections = app.config['STREAM_MAX_CONNECTIONS']
+
+    print("=" * 60)
+    print("🎬 CARFLIX - Servidor de vídeo (asyncio)")
+    print("=" * 60)
+    print(f"  Escucha:     http://{args.host}:{args.port}/video/ y /upload/")
+    print(f"  Conexiones:  {max_connections} como máximo por proceso")
+    if files < max_connections + 64:
+        print(f"  ⚠️  El límite de ficheros abiertos ({files}) es menor que STREAM_MAX_CONNECTIONS")
+    print("=" * 60)
+
+    try:
+        asyncio.run(serve(app, args.host, args.port, reuse_port=args.reuse_port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())